@@ -1,25 +1,62 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from fastapi import Form
 import os
-from pydantic import BaseModel
-import psycopg2
+import configparser
+from contextlib import asynccontextmanager
+from pydantic import BaseModel, ValidationError
+import asyncpg
+import json
 from datetime import datetime
 from typing import List, Optional
+from uuid import UUID
 import subprocess
 
-# --- FastAPI-Setup ---
-app = FastAPI()
-
-# --- DB-Verbindung ---
-def get_connection():
-    return psycopg2.connect(
-        host="192.168.40.33",
-        database="kundendatenbank",
-        user="appuser",
-        password="3A5595DD43CC7FC2E414FC6AC55260DD"
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# --- Konfiguration ---
+# Zugangsdaten aus config.ini neben app.py ([database]), Umgebungsvariablen haben Vorrang
+def _db_cfg():
+    config = configparser.ConfigParser()
+    config.read(os.path.join(APP_DIR, "config.ini"), encoding="utf-8")
+    cfg = config["database"] if config.has_section("database") else {}
+    return {
+        "host": os.environ.get("DB_HOST", cfg.get("host", "localhost")),
+        "port": int(os.environ.get("DB_PORT", cfg.get("port", 5432))),
+        "database": os.environ.get("DB_NAME", cfg.get("database", "kundendatenbank")),
+        "user": os.environ.get("DB_USER", cfg.get("user", "appuser")),
+        "password": os.environ.get("DB_PASSWORD", cfg.get("password", "")),
+        "pool_min": int(cfg.get("pool_min", 1)),
+        "pool_max": int(cfg.get("pool_max", 10)),
+    }
+
+# --- DB-Pool ---
+# Wird einmal beim Start angelegt und beim Herunterfahren geschlossen; jede Anfrage
+# leiht sich nur eine bereits offene Verbindung, statt eine neue aufzubauen.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    cfg = _db_cfg()
+    app.state.pool = await asyncpg.create_pool(
+        host=cfg["host"],
+        port=cfg["port"],
+        database=cfg["database"],
+        user=cfg["user"],
+        password=cfg["password"],
+        min_size=cfg["pool_min"],
+        max_size=cfg["pool_max"],
+        command_timeout=30
     )
+    try:
+        yield
+    finally:
+        await app.state.pool.close()
+
+# --- FastAPI-Setup ---
+app = FastAPI(lifespan=lifespan)
+
+def get_pool(request: Request) -> asyncpg.Pool:
+    return request.app.state.pool
 
 # --- Request-Modell ---
 class Besuch(BaseModel):
@@ -28,44 +65,322 @@ class Besuch(BaseModel):
     anzahl_einheiten: int
     bemerkung: str
 
+def _als_ortszeit(termin: datetime) -> datetime:
+    # besuch.termin ist "timestamp without time zone" in Ortszeit
+    return termin.astimezone().replace(tzinfo=None) if termin.tzinfo else termin
+
 # --- Route: Besuch speichern ---
 @app.post("/besuch")
-def create_besuch(besuch: Besuch):
-    conn = get_connection()
-    cur = conn.cursor()
-
-    cur.execute(
+async def create_besuch(besuch: Besuch, request: Request):
+    # Der Browser schickt Zeitpunkte mit Offset (z.B. +02:00); asyncpg lehnt die für TIMESTAMP ab
+    try:
+        termin = _als_ortszeit(besuch.termin)
+    except (OverflowError, ValueError, OSError) as e:
+        raise HTTPException(status_code=422, detail=f"Ungültiger Termin: {e}")
+    await get_pool(request).execute(
         """
         INSERT INTO besuch (kdnr, termin, anzahl_einheiten, bemerkung)
-        VALUES (%s, %s, %s, %s)
+        VALUES ($1, $2, $3, $4)
         """,
-        (besuch.kdnr, besuch.termin, besuch.anzahl_einheiten, besuch.bemerkung)
+        besuch.kdnr, termin, besuch.anzahl_einheiten, besuch.bemerkung
     )
 
-    conn.commit()
-    cur.close()
-    conn.close()
-
     return {"status": "ok", "besuch": besuch.dict()}
 
+# --- Route: viele Besuche auf einmal (Nachtragen aus dem Papierkalender) ---
+# Nimmt ein JSON-Array oder NDJSON (eine Zeile pro Besuch, Content-Type application/x-ndjson).
+# Alle Zeilen werden in einem Durchgang validiert, per COPY in eine Staging-Tabelle geladen
+# und in EINER Transaktion nach besuch übernommen. Exakte Duplikate (kdnr, termin) - innerhalb
+# der Lieferung oder bereits in der Datenbank - werden übersprungen und gemeldet.
+# NDJSON wird zeilenweise aus dem Datenstrom gelesen; ein JSON-Array muss dagegen komplett im
+# Speicher liegen und ist daher auf BULK_MAX_BYTES begrenzt (größere Lieferungen als NDJSON).
+BULK_MAX_BYTES = 10 * 1024 * 1024
+BULK_MAX_ZEILE = 64 * 1024
+
+def _parse_zeile(nr: int, zeile: bytes):
+    try:
+        return (nr, json.loads(zeile.decode("utf-8")), None)
+    except UnicodeDecodeError:
+        return (nr, None, "Ungültige Zeichenkodierung (UTF-8 erwartet)")
+    except json.JSONDecodeError as e:
+        return (nr, None, f"Ungültiges JSON: {e}")
+
+async def _lese_bulk_zeilen(request: Request):
+    """Liefert [(zeilennummer, objekt_oder_None, fehler_oder_None)]."""
+    ndjson = "ndjson" in request.headers.get("content-type", "")
+    zeilen = []
+    puffer = b""
+    array = None  # erst beim ersten Zeichen entschieden: JSON-Array oder NDJSON
+
+    def zeilen_abtrennen(ende=False):
+        nonlocal puffer
+        *fertig, puffer = puffer.split(b"\n")
+        if ende:
+            fertig.append(puffer)
+            puffer = b""
+        for zeile in fertig:
+            if zeile.strip():
+                zeilen.append(_parse_zeile(len(zeilen), zeile))
+        if len(puffer) > BULK_MAX_ZEILE:
+            raise HTTPException(status_code=413, detail=f"Zeile {len(zeilen)} ist länger als {BULK_MAX_ZEILE} Bytes.")
+
+    async for block in request.stream():
+        puffer += block
+        if array is None and puffer.strip():
+            array = not ndjson and puffer.lstrip().startswith(b"[")
+        if array:
+            if len(puffer) > BULK_MAX_BYTES:
+                raise HTTPException(status_code=413, detail=f"JSON-Array größer als {BULK_MAX_BYTES // (1024 * 1024)} MB, bitte als NDJSON senden.")
+        elif array is False:
+            zeilen_abtrennen()
+
+    if not array:
+        zeilen_abtrennen(ende=True)
+        return zeilen
+    try:
+        daten = json.loads(puffer.decode("utf-8"))
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Ungültige Zeichenkodierung (UTF-8 erwartet).")
+    except json.JSONDecodeError as e:
+        return [(0, None, f"Ungültiges JSON: {e}")]
+    return [(nr, obj, None) for nr, obj in enumerate(daten)]
+
+@app.post("/besuche/bulk")
+async def create_besuche_bulk(request: Request, alles_oder_nichts: bool = False):
+    fehler = []
+    gueltig = []
+    for nr, obj, parse_fehler in await _lese_bulk_zeilen(request):
+        if parse_fehler:
+            fehler.append({"zeile": nr, "fehler": parse_fehler})
+            continue
+        try:
+            besuch = Besuch.model_validate(obj)
+        except ValidationError as e:
+            fehler.append({"zeile": nr, "fehler": "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())})
+            continue
+        try:
+            termin = _als_ortszeit(besuch.termin)
+        except (OverflowError, ValueError, OSError) as e:
+            fehler.append({"zeile": nr, "fehler": f"termin: Ungültiger Termin: {e}"})
+            continue
+        gueltig.append((nr, besuch.kdnr, termin, besuch.anzahl_einheiten, besuch.bemerkung))
+
+    empfangen = len(gueltig) + len(fehler)
+    if alles_oder_nichts and fehler:
+        return {"status": "abgelehnt", "empfangen": empfangen, "eingefuegt": 0, "duplikate": [], "fehler": fehler}
+
+    eingefuegt_keys = set()
+    unbekannt = set()
+    if gueltig:
+        async with get_pool(request).acquire() as conn:
+            async with conn.transaction():
+                # Parallele Bulk-Importe nacheinander abarbeiten, damit die Duplikatprüfung greift
+                await conn.execute("SELECT pg_advisory_xact_lock(hashtext('besuch_bulk'));")
+                await conn.execute("""
+                    CREATE TEMP TABLE besuch_staging (
+                        zeile INTEGER, kdnr INTEGER, termin TIMESTAMP, anzahl_einheiten INTEGER, bemerkung TEXT
+                    ) ON COMMIT DROP;
+                """)
+                await conn.copy_records_to_table(
+                    "besuch_staging", records=gueltig,
+                    columns=["zeile", "kdnr", "termin", "anzahl_einheiten", "bemerkung"]
+                )
+
+                rows = await conn.fetch("""
+                    SELECT s.zeile FROM besuch_staging s
+                    WHERE NOT EXISTS (SELECT 1 FROM kunde k WHERE k.kdnr = s.kdnr);
+                """)
+                unbekannt = {r["zeile"] for r in rows}
+
+                if alles_oder_nichts and unbekannt:
+                    rows = []
+                else:
+                    rows = await conn.fetch("""
+                        INSERT INTO besuch (kdnr, termin, anzahl_einheiten, bemerkung)
+                        SELECT DISTINCT ON (s.kdnr, s.termin) s.kdnr, s.termin, s.anzahl_einheiten, s.bemerkung
+                        FROM besuch_staging s
+                        JOIN kunde k ON k.kdnr = s.kdnr
+                        WHERE NOT EXISTS (
+                            SELECT 1 FROM besuch b WHERE b.kdnr = s.kdnr AND b.termin = s.termin
+                        )
+                        ORDER BY s.kdnr, s.termin, s.zeile
+                        RETURNING kdnr, termin;
+                    """)
+                eingefuegt_keys = {(r["kdnr"], r["termin"]) for r in rows}
+
+    # Ergebnis pro Zeile zuordnen: die erste Zeile je (kdnr, termin) wurde eingefügt, der Rest ist Duplikat
+    eingefuegt = 0
+    duplikate = []
+    for nr, kdnr, termin, _, _ in gueltig:
+        if nr in unbekannt:
+            fehler.append({"zeile": nr, "fehler": f"Unbekannte Kundennummer {kdnr}"})
+        elif (kdnr, termin) in eingefuegt_keys:
+            eingefuegt_keys.discard((kdnr, termin))
+            eingefuegt += 1
+        elif not (alles_oder_nichts and unbekannt):
+            duplikate.append(nr)
+
+    fehler.sort(key=lambda f: f["zeile"])
+    status = "abgelehnt" if alles_oder_nichts and unbekannt else "ok"
+    return {"status": status, "empfangen": empfangen,
+            "eingefuegt": eingefuegt, "duplikate": duplikate, "fehler": fehler}
+
+# --- Route: Synchronisation der Offline-Warteschlange des Erfassungsformulars ---
+# Das Formular vergibt pro Besuch einen Idempotenz-Schlüssel (UUID). Der eindeutige Index
+# ux_besuch_idempotenz sorgt dafür, dass Wiederholungen nie einen zweiten Besuch anlegen.
+class BesuchSync(Besuch):
+    idempotenz_schluessel: UUID
+
+class SyncAnfrage(BaseModel):
+    besuche: List[dict]
+
+@app.post("/besuche/sync")
+async def sync_besuche(anfrage: SyncAnfrage, request: Request):
+    ergebnisse = {}
+    ohne_schluessel = []  # Einträge ohne gültigen Schlüssel, nach Position in der Anfrage
+    gueltig = []
+    for index, obj in enumerate(anfrage.besuche):
+        schluessel = str(obj.get("idempotenz_schluessel", ""))
+        try:
+            besuch = BesuchSync.model_validate(obj)
+        except ValidationError as e:
+            fehler = {"status": "fehler", "fehler": "; ".join(err["msg"] for err in e.errors())}
+            if any(err["loc"] == ("idempotenz_schluessel",) for err in e.errors()):
+                ohne_schluessel.append(dict(fehler, index=index))
+            else:
+                ergebnisse[schluessel] = fehler
+            continue
+        gueltig.append(besuch)
+
+    if gueltig:
+        async with get_pool(request).acquire() as conn:
+            async with conn.transaction():
+                # Unbekannte Kunden vorab aussortieren, sonst bricht der Fremdschlüssel den ganzen Stapel ab
+                bekannt = {r["kdnr"] for r in await conn.fetch(
+                    "SELECT kdnr FROM kunde WHERE kdnr = ANY($1::int[]);", list({b.kdnr for b in gueltig})
+                )}
+                neu, termine = [], []
+                for b in gueltig:
+                    if b.kdnr not in bekannt:
+                        ergebnisse[str(b.idempotenz_schluessel)] = {"status": "fehler", "fehler": f"Unbekannte Kundennummer {b.kdnr}"}
+                        continue
+                    # Einzeln umrechnen: ein Termin außerhalb des Wertebereichs darf den Stapel nicht blockieren
+                    try:
+                        termine.append(_als_ortszeit(b.termin))
+                    except (OverflowError, ValueError, OSError) as e:
+                        ergebnisse[str(b.idempotenz_schluessel)] = {"status": "fehler", "fehler": f"Ungültiger Termin: {e}"}
+                        continue
+                    neu.append(b)
+
+                rows = await conn.fetch("""
+                    INSERT INTO besuch (idempotenz_schluessel, kdnr, termin, anzahl_einheiten, bemerkung)
+                    SELECT * FROM unnest($1::uuid[], $2::int[], $3::timestamp[], $4::int[], $5::text[])
+                    ON CONFLICT (idempotenz_schluessel) WHERE idempotenz_schluessel IS NOT NULL DO NOTHING
+                    RETURNING idempotenz_schluessel;
+                """,
+                    [b.idempotenz_schluessel for b in neu], [b.kdnr for b in neu],
+                    termine, [b.anzahl_einheiten for b in neu],
+                    [b.bemerkung for b in neu]
+                )
+        eingefuegt = {str(r["idempotenz_schluessel"]) for r in rows}
+        for b in neu:
+            schluessel = str(b.idempotenz_schluessel)
+            ergebnisse[schluessel] = {"status": "gespeichert" if schluessel in eingefuegt else "bereits_vorhanden"}
+
+    return {"status": "ok", "ergebnisse": ergebnisse, "ohne_schluessel": ohne_schluessel}
+
 # Static files mounten
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", StaticFiles(directory=os.path.join(APP_DIR, "static")), name="static")
+
+# --- Gebaute Web-App (build_assets.py) ---
+# Gehashte Assets ändern nie ihren Inhalt und dürfen ein Jahr im Browser liegen;
+# form.html und sw.js müssen dagegen bei jedem Aufruf revalidiert werden.
+DIST_DIR = os.path.join(APP_DIR, "dist")
+CACHE_IMMUTABLE = "public, max-age=31536000, immutable"
+CACHE_REVALIDIEREN = "no-cache"
+
+def _vorkomprimiert(request: Request, pfad: str, media_type: str, cache_control: str):
+    """Liefert pfad.br bzw. pfad.gz aus, wenn der Client es akzeptiert und die Datei existiert."""
+    headers = {"Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    akzeptiert = request.headers.get("accept-encoding", "")
+    for endung, encoding in ((".br", "br"), (".gz", "gzip")):
+        if encoding in akzeptiert and os.path.exists(pfad + endung):
+            headers["Content-Encoding"] = encoding
+            return FileResponse(pfad + endung, media_type=media_type, headers=headers)
+    return FileResponse(pfad, media_type=media_type, headers=headers)
+
+@app.get("/assets/{name}")
+def serve_asset(name: str, request: Request):
+    pfad = os.path.join(DIST_DIR, "assets", os.path.basename(name))
+    if not os.path.isfile(pfad):
+        raise HTTPException(status_code=404)
+    media_type = "text/css" if name.endswith(".css") else "application/javascript"
+    return _vorkomprimiert(request, pfad, media_type, CACHE_IMMUTABLE)
+
+@app.get("/sw.js")
+def serve_service_worker(request: Request):
+    pfad = os.path.join(DIST_DIR, "sw.js")
+    if not os.path.isfile(pfad):
+        raise HTTPException(status_code=404)
+    return _vorkomprimiert(request, pfad, "application/javascript", CACHE_REVALIDIEREN)
 
 @app.get("/form")
-def serve_form():
-    return FileResponse(os.path.join("static", "form.html"))
+def serve_form(request: Request):
+    # Ohne Build (Entwicklung) die Quelldatei mit Tailwind-CDN ausliefern
+    pfad = os.path.join(DIST_DIR, "form.html")
+    if not os.path.isfile(pfad):
+        return FileResponse(os.path.join(APP_DIR, "static", "form.html"))
+    return _vorkomprimiert(request, pfad, "text/html; charset=utf-8", CACHE_REVALIDIEREN)
 
 # Kundendaten für Dropdown
 @app.get("/kunden")
-def get_kunden():
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT kdnr, name FROM kunde ORDER BY kdnr;")
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
+async def get_kunden(request: Request):
+    rows = await get_pool(request).fetch("SELECT kdnr, name FROM kunde ORDER BY kdnr;")
+
+    return [{"kdnr": r["kdnr"], "name": r["name"]} for r in rows]
+
+# --- Kundensuche (Tippsuche im Formular) ---
+# Jedes Suchwort muss als Teilwort (ILIKE) oder unscharf (Trigramm-Wortähnlichkeit, pg_trgm <%)
+# im Suchtext aus Name, Kürzel und Ort vorkommen; beide Bedingungen nutzen ix_kunde_suche.
+# Sortiert wird nach Kundennummer-Treffer, Namensanfang und Ähnlichkeit.
+SUCHE_MAX_WOERTER = 5
+
+def _like_muster(wort: str) -> str:
+    return wort.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
 
-    return [{"kdnr": r[0], "name": r[1]} for r in rows]
+def _als_kdnr(wort: str):
+    """Kundennummer, wenn das Wort eine ist: nur ASCII-Ziffern ('²' ist auch isdigit) und passend für int4."""
+    return int(wort) if wort.isascii() and wort.isdecimal() and len(wort) <= 9 else None
+
+@app.get("/kunden/search")
+async def search_kunden(request: Request, q: str = "", limit: int = Query(20, ge=1, le=100), offset: int = Query(0, ge=0)):
+    woerter = q.lower().split()[:SUCHE_MAX_WOERTER]
+    if not woerter:
+        return {"treffer": [], "weitere": False}
+
+    suchtext = "kunde_suchtext(name, kuerzel, ort)"
+    params = [" ".join(woerter), _like_muster(woerter[0]) + "%", _als_kdnr(woerter[0])]
+    bedingungen = []
+    for wort in woerter:
+        params.extend([f"%{_like_muster(wort)}%", wort])
+        bedingungen.append(f"({suchtext} ILIKE ${len(params) - 1} OR ${len(params)} <% {suchtext})")
+    params.extend([limit + 1, offset])
+
+    rows = await get_pool(request).fetch(f"""
+        SELECT kdnr, name, kuerzel, ort
+        FROM kunde
+        WHERE kdnr = $3 OR ({" AND ".join(bedingungen)})
+        ORDER BY (kdnr = $3) IS TRUE DESC,
+                 lower(name) LIKE $2 DESC,
+                 word_similarity($1, {suchtext}) DESC,
+                 name, kdnr
+        LIMIT ${len(params) - 1} OFFSET ${len(params)};
+    """, *params)
+
+    return {
+        "treffer": [{"kdnr": r["kdnr"], "name": r["name"], "kuerzel": r["kuerzel"], "ort": r["ort"]} for r in rows[:limit]],
+        "weitere": len(rows) > limit
+    }
 
 # Neuen Kunden anlegen
 class KundeCreate(BaseModel):
@@ -78,33 +393,26 @@ class KundeCreate(BaseModel):
     ort: str
 
 @app.post("/kunde")
-def add_kunde(kunde: KundeCreate):
+async def add_kunde(kunde: KundeCreate, request: Request):
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute(
-            "INSERT INTO kunde (name, ansprechpartner, strasse, hausnummer, plz, ort, kuerzel) VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING kdnr;",
-            (kunde.name, kunde.ansprechpartner, kunde.strasse, kunde.hausnummer, kunde.plz, kunde.ort, kunde.kuerzel)
-        )
-        new_id = cur.fetchone()[0]
-        conn.commit()
+        async with get_pool(request).acquire() as conn:
+            # Transaktion: bei einem Fehler wird automatisch zurückgerollt
+            async with conn.transaction():
+                new_id = await conn.fetchval(
+                    "INSERT INTO kunde (name, ansprechpartner, strasse, hausnummer, plz, ort, kuerzel) VALUES ($1, $2, $3, $4, $5, $6, $7) RETURNING kdnr;",
+                    kunde.name, kunde.ansprechpartner, kunde.strasse, kunde.hausnummer, kunde.plz, kunde.ort, kunde.kuerzel
+                )
+                # Desktop-Clients leeren ihren Stammdaten-Cache (LISTEN stammdaten_geaendert)
+                await conn.execute("SELECT pg_notify('stammdaten_geaendert', $1);", str(new_id))
         
         return {"message": "Kunde angelegt", "kdnr": new_id}
     
-    except psycopg2.Error as e:
+    except asyncpg.PostgresError as e:
         # Fängt spezifische Datenbank-Fehler ab
-        if 'conn' in locals() and conn:
-            conn.rollback() # Bricht die fehlerhafte Transaktion ab
         return {"error": "Datenbank-Fehler", "details": str(e)}
     except Exception as e:
         # Fängt sonstige Fehler ab
         return {"error": "Allgemeiner Fehler", "details": str(e)}
-    finally:
-        # Wird IMMER ausgeführt, um die Verbindung sauber zu schließen
-        if 'cur' in locals() and cur:
-            cur.close()
-        if 'conn' in locals() and conn:
-            conn.close()
         
 
 # @app.get("/rechnung")
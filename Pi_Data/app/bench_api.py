@@ -0,0 +1,96 @@
+"""
+Lastmessung für die Erfassungs-API: Anfragen/s und Latenz-Perzentile für /kunden und /besuch.
+
+Vorher/Nachher-Vergleich gegen eine lokale PostgreSQL-Testdatenbank (NICHT die Produktiv-DB,
+/besuch legt echte Zeilen an):
+    uvicorn app:app --port 8000                  # jeweilige Version der app.py starten
+    python bench_api.py --url http://127.0.0.1:8000 --kdnr 10001
+
+Benötigt nur die Standardbibliothek.
+"""
+import argparse
+import http.client
+import json
+import statistics
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+
+
+def _perzentil(werte, p):
+    werte = sorted(werte)
+    if not werte:
+        return 0.0
+    index = min(len(werte) - 1, int(round(p / 100 * (len(werte) - 1))))
+    return werte[index]
+
+
+def lauf(url, methode, pfad, body_fabrik, dauer_s, parallel):
+    ziel = urlparse(url)
+    latenzen = []
+    fehler = [0]
+    lock = threading.Lock()
+    ende = time.perf_counter() + dauer_s
+
+    def arbeiter(nr):
+        # Keep-Alive-Verbindung pro Thread, wie ein Browser
+        conn = http.client.HTTPConnection(ziel.hostname, ziel.port or 80, timeout=30)
+        i = 0
+        while time.perf_counter() < ende:
+            body = body_fabrik(nr, i)
+            headers = {"Content-Type": "application/json"} if body is not None else {}
+            t0 = time.perf_counter()
+            try:
+                conn.request(methode, pfad, body=body, headers=headers)
+                antwort = conn.getresponse()
+                antwort.read()
+                ok = antwort.status == 200
+            except Exception:
+                ok = False
+                conn.close()
+                conn = http.client.HTTPConnection(ziel.hostname, ziel.port or 80, timeout=30)
+            dauer = time.perf_counter() - t0
+            with lock:
+                if ok:
+                    latenzen.append(dauer)
+                else:
+                    fehler[0] += 1
+            i += 1
+        conn.close()
+
+    threads = [threading.Thread(target=arbeiter, args=(n,)) for n in range(parallel)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    gesamt = time.perf_counter() - start
+
+    ms = [l * 1000 for l in latenzen]
+    print(f"{methode} {pfad:<10} {len(ms) / gesamt:8.1f} req/s   "
+          f"p50 {_perzentil(ms, 50):7.1f} ms   p99 {_perzentil(ms, 99):7.1f} ms   "
+          f"mittel {statistics.fmean(ms) if ms else 0:7.1f} ms   fehler {fehler[0]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lastmessung /kunden und /besuch")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--kdnr", type=int, required=True, help="Existierende Kundennummer in der Testdatenbank")
+    parser.add_argument("--dauer", type=float, default=10.0, help="Sekunden pro Endpunkt")
+    parser.add_argument("--parallel", type=int, default=8, help="Gleichzeitige Clients")
+    args = parser.parse_args()
+
+    basis = datetime(2000, 1, 1)
+
+    def besuch_body(nr, i):
+        termin = basis + timedelta(minutes=nr * 1_000_000 + i)
+        return json.dumps({"kdnr": args.kdnr, "termin": termin.isoformat(), "anzahl_einheiten": 1, "bemerkung": "bench"})
+
+    lauf(args.url, "GET", "/kunden", lambda nr, i: None, args.dauer, args.parallel)
+    lauf(args.url, "POST", "/besuch", besuch_body, args.dauer, args.parallel)
+    print("Hinweis: Testbesuche entfernen mit  DELETE FROM besuch WHERE bemerkung = 'bench';")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Vergleich Kundenliste komplett (GET /kunden) gegen Tippsuche (GET /kunden/search):
+Antwortgröße und Latenz-Perzentile, optional mit 10.000 synthetischen Kunden.
+
+Nur gegen eine lokale PostgreSQL-Testdatenbank (NICHT die Produktiv-DB):
+    python bench_kundensuche.py --anlegen 10000      # synthetische Kunden anlegen (kuerzel 'BENCH...')
+    uvicorn app:app --port 8000
+    python bench_kundensuche.py --url http://127.0.0.1:8000
+    python bench_kundensuche.py --entfernen          # synthetische Kunden wieder löschen
+"""
+import argparse
+import asyncio
+import gzip
+import http.client
+import random
+import statistics
+import time
+from urllib.parse import urlencode, urlparse
+
+from bench_api import _perzentil
+
+NAMEN = ["Klinikum", "Praxis", "Bezirkskrankenhaus", "Sonnenhof", "Caritas", "Diakonie", "Lebenshilfe",
+         "Wohnheim", "Tagesstätte", "Beratungsstelle", "Jugendhilfe", "Seniorenzentrum"]
+ORTE = ["Bamberg", "Forchheim", "Bayreuth", "Erlangen", "Nürnberg", "Hirschaid", "Kulmbach", "Coburg"]
+# Typische Eingaben beim Tippen: Anfang eines Namens, Name + Ort, Tippfehler, Kundennummer
+SUCHEN = ["kli", "klinikum bam", "sonnen", "diakonie for", "lebenshilf", "klinkum", "10001", "cari kul"]
+
+
+async def anlegen(anzahl):
+    import asyncpg
+    from app import _db_cfg
+    cfg = _db_cfg()
+    conn = await asyncpg.connect(host=cfg["host"], port=cfg["port"], database=cfg["database"],
+                                 user=cfg["user"], password=cfg["password"])
+    zufall = random.Random(7)
+    zeilen = [
+        (f"{zufall.choice(NAMEN)} {zufall.choice(ORTE)} {i}", None, "Hauptstraße", str(i % 200 + 1),
+         "96049", zufall.choice(ORTE), f"BENCH{i}")
+        for i in range(anzahl)
+    ]
+    try:
+        await conn.copy_records_to_table(
+            "kunde", records=zeilen, columns=["name", "ansprechpartner", "strasse", "hausnummer", "plz", "ort", "kuerzel"]
+        )
+        await conn.execute("ANALYZE kunde;")
+    finally:
+        await conn.close()
+    print(f"✅ {anzahl} synthetische Kunden angelegt")
+
+
+async def entfernen():
+    import asyncpg
+    from app import _db_cfg
+    cfg = _db_cfg()
+    conn = await asyncpg.connect(host=cfg["host"], port=cfg["port"], database=cfg["database"],
+                                 user=cfg["user"], password=cfg["password"])
+    try:
+        status = await conn.execute("DELETE FROM kunde WHERE kuerzel LIKE 'BENCH%';")
+    finally:
+        await conn.close()
+    print(f"✅ {status}")
+
+
+def messen(url, pfade, wiederholungen):
+    ziel = urlparse(url)
+    conn = http.client.HTTPConnection(ziel.hostname, ziel.port or 80, timeout=30)
+    latenzen, groessen = [], []
+    for _ in range(wiederholungen):
+        for pfad in pfade:
+            t0 = time.perf_counter()
+            conn.request("GET", pfad)
+            antwort = conn.getresponse()
+            body = antwort.read()
+            latenzen.append((time.perf_counter() - t0) * 1000)
+            if antwort.status != 200:
+                raise RuntimeError(f"{pfad}: HTTP {antwort.status}")
+            groessen.append((len(body), len(gzip.compress(body))))
+    conn.close()
+    return latenzen, groessen
+
+
+def ausgabe(name, latenzen, groessen):
+    roh = statistics.fmean(g for g, _ in groessen)
+    komprimiert = statistics.fmean(g for _, g in groessen)
+    print(f"{name:<16} {roh / 1024:9.1f} KiB ({komprimiert / 1024:7.1f} KiB gzip)   "
+          f"p50 {_perzentil(latenzen, 50):7.1f} ms   p99 {_perzentil(latenzen, 99):7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kundenliste komplett gegen Tippsuche")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--wiederholungen", type=int, default=20)
+    parser.add_argument("--anlegen", type=int, default=0, metavar="ANZAHL", help="synthetische Kunden anlegen und beenden")
+    parser.add_argument("--entfernen", action="store_true", help="synthetische Kunden löschen und beenden")
+    args = parser.parse_args()
+
+    if args.anlegen:
+        asyncio.run(anlegen(args.anlegen))
+        return
+    if args.entfernen:
+        asyncio.run(entfernen())
+        return
+
+    ausgabe("/kunden", *messen(args.url, ["/kunden"], args.wiederholungen))
+    # Jeder Tastendruck ist eine Anfrage: alle Präfixe der Suchbegriffe messen
+    pfade = [f"/kunden/search?{urlencode({'q': s[:n], 'limit': 20})}" for s in SUCHEN for n in range(2, len(s) + 1)]
+    ausgabe("/kunden/search", *messen(args.url, pfade, max(1, args.wiederholungen // 5)))
+
+
+if __name__ == "__main__":
+    main()
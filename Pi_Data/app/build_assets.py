@@ -0,0 +1,122 @@
+"""
+Build-Schritt für die Erfassungs-Web-App: erzeugt dist/ mit
+
+  - assets/app.<hash>.css  Tailwind, auf die in form.html verwendeten Klassen reduziert
+  - form.html              verweist auf das gehashte CSS statt auf das Tailwind-CDN
+  - sw.js                  Service Worker mit Versionskennung und Liste der App-Shell
+  - *.br / *.gz            vorkomprimierte Fassungen aller Dateien
+
+Aufruf:  python build_assets.py
+Benötigt das Tailwind-CLI (Standalone-Binary 'tailwindcss' im PATH oder 'npx tailwindcss');
+für .br-Dateien zusätzlich das Paket 'brotli' (sonst nur gzip).
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(APP_DIR, "static")
+DIST_DIR = os.path.join(APP_DIR, "dist")
+ASSETS_DIR = os.path.join(DIST_DIR, "assets")
+
+_BUILD_CSS = re.compile(r"<!-- build:css -->.*?<!-- endbuild -->", re.S)
+
+
+def _tailwind_befehl():
+    if shutil.which("tailwindcss"):
+        return ["tailwindcss"]
+    if shutil.which("npx"):
+        return ["npx", "--yes", "tailwindcss@3"]
+    raise RuntimeError("Tailwind-CLI nicht gefunden (Standalone-Binary 'tailwindcss' oder Node.js/npx installieren).")
+
+
+def baue_css() -> bytes:
+    """Tailwind mit Purge über form.html, minifiziert."""
+    ausgabe = os.path.join(DIST_DIR, "app.css.tmp")
+    subprocess.run(
+        _tailwind_befehl() + [
+            "-c", os.path.join(APP_DIR, "tailwind.config.js"),
+            "-i", os.path.join(APP_DIR, "assets", "tailwind.css"),
+            "-o", ausgabe, "--minify"
+        ],
+        cwd=APP_DIR, check=True
+    )
+    with open(ausgabe, "rb") as f:
+        css = f.read()
+    os.remove(ausgabe)
+    return css
+
+
+def _kurzhash(daten: bytes) -> str:
+    return hashlib.sha256(daten).hexdigest()[:12]
+
+
+def _schreiben(pfad, daten: bytes):
+    with open(pfad, "wb") as f:
+        f.write(daten)
+
+
+def komprimieren(pfad):
+    """Legt pfad.gz und (falls brotli installiert ist) pfad.br an."""
+    with open(pfad, "rb") as f:
+        daten = f.read()
+    # mtime=0: gleiche Eingabe ergibt byte-identische .gz-Dateien
+    _schreiben(pfad + ".gz", gzip.compress(daten, compresslevel=9, mtime=0))
+    try:
+        import brotli
+    except ImportError:
+        return False
+    _schreiben(pfad + ".br", brotli.compress(daten, quality=11))
+    return True
+
+
+def build():
+    if os.path.isdir(DIST_DIR):
+        shutil.rmtree(DIST_DIR)
+    os.makedirs(ASSETS_DIR)
+
+    css = baue_css()
+    css_name = f"app.{_kurzhash(css)}.css"
+    _schreiben(os.path.join(ASSETS_DIR, css_name), css)
+
+    with open(os.path.join(STATIC_DIR, "form.html"), encoding="utf-8") as f:
+        html = f.read()
+    if not _BUILD_CSS.search(html):
+        raise RuntimeError("form.html enthält keinen <!-- build:css -->-Block.")
+    html = _BUILD_CSS.sub(f'<link rel="stylesheet" href="/assets/{css_name}">', html)
+    _schreiben(os.path.join(DIST_DIR, "form.html"), html.encode("utf-8"))
+
+    # Version = Inhalt der Shell: jede Änderung an HTML oder CSS installiert den Worker neu
+    shell = ["/form", f"/assets/{css_name}"]
+    version = _kurzhash(html.encode("utf-8") + css)
+    with open(os.path.join(STATIC_DIR, "sw.js"), encoding="utf-8") as f:
+        sw = f.read().replace("__VERSION__", version).replace("__SHELL__", json.dumps(shell))
+    _schreiben(os.path.join(DIST_DIR, "sw.js"), sw.encode("utf-8"))
+
+    dateien = [os.path.join(ASSETS_DIR, css_name), os.path.join(DIST_DIR, "form.html"), os.path.join(DIST_DIR, "sw.js")]
+    brotli_ok = all([komprimieren(pfad) for pfad in dateien])
+
+    manifest = {"version": version, "css": css_name, "shell": shell}
+    _schreiben(os.path.join(DIST_DIR, "manifest.json"), json.dumps(manifest, indent=2).encode("utf-8"))
+
+    for pfad in dateien:
+        groessen = [os.path.getsize(pfad)] + [os.path.getsize(pfad + e) for e in (".gz", ".br") if os.path.exists(pfad + e)]
+        print(f"✅ {os.path.relpath(pfad, APP_DIR):<32} " + " / ".join(f"{g / 1024:.1f} KB" for g in groessen))
+    if not brotli_ok:
+        print("⚠️ Paket 'brotli' fehlt, nur gzip-Dateien erzeugt.")
+    return manifest
+
+
+if __name__ == "__main__":
+    argparse.ArgumentParser(description="Baut die Erfassungs-Web-App nach dist/").parse_args()
+    try:
+        build()
+    except (RuntimeError, subprocess.CalledProcessError) as e:
+        print("❌ Build fehlgeschlagen:", e)
+        sys.exit(1)
@@ -0,0 +1,77 @@
+// Service Worker der Besuchserfassung.
+// Versionskennung und Shell-Liste setzt build_assets.py ein; ausgeliefert wird nur die Datei in dist/
+const VERSION = "__VERSION__";
+const SHELL_CACHE = "shell-" + VERSION;
+const SUCHE_CACHE = "kundensuche";
+const SUCHE_MAX = 50;                          // gespeicherte Suchen, älteste fliegen zuerst raus
+const SUCHE_MAX_ALTER = 7 * 24 * 3600 * 1000;  // ältere Antworten werden offline nicht mehr gezeigt
+const SHELL = __SHELL__;
+
+self.addEventListener("install", (event) => {
+    event.waitUntil(
+        caches.open(SHELL_CACHE)
+            .then(cache => cache.addAll(SHELL))
+            .then(() => self.skipWaiting())
+    );
+});
+
+self.addEventListener("activate", (event) => {
+    // Shell-Caches älterer Versionen und den früheren Daten-Cache entfernen
+    event.waitUntil(
+        caches.keys()
+            .then(namen => Promise.all(namen
+                .filter(n => (n.startsWith("shell-") && n !== SHELL_CACHE) || n === "daten")
+                .map(n => caches.delete(n))))
+            .then(() => self.clients.claim())
+    );
+});
+
+// Suche merken: erneut gespeicherte Suchen rücken ans Ende, darüber hinaus die ältesten löschen
+async function sucheMerken(cache, request, response) {
+    await cache.delete(request);
+    await cache.put(request, response);
+    const schluessel = await cache.keys();
+    await Promise.all(schluessel.slice(0, -SUCHE_MAX).map(k => cache.delete(k)));
+}
+
+function zuAlt(response) {
+    const datum = Date.parse(response.headers.get("Date"));
+    return isNaN(datum) || Date.now() - datum > SUCHE_MAX_ALTER;
+}
+
+// Kundensuche: Netz zuerst, offline die letzte (nicht zu alte) Antwort auf dieselbe Suche
+async function kundensuche(request) {
+    const cache = await caches.open(SUCHE_CACHE);
+    try {
+        const response = await fetch(request);
+        if (response.ok) sucheMerken(cache, request, response.clone()).catch(() => {});
+        return response;
+    } catch (err) {
+        const gecacht = await cache.match(request);
+        if (gecacht && !zuAlt(gecacht)) return gecacht;
+        throw err;
+    }
+}
+
+// Nach dem Anlegen eines Kunden sind gemerkte Suchen unvollständig
+async function kundeAnlegen(request) {
+    const response = await fetch(request);
+    if (response.ok) await caches.delete(SUCHE_CACHE);
+    return response;
+}
+
+self.addEventListener("fetch", (event) => {
+    const url = new URL(event.request.url);
+    if (url.origin !== self.location.origin) return;
+
+    if (event.request.method === "POST" && url.pathname === "/kunde") {
+        event.respondWith(kundeAnlegen(event.request));
+    } else if (event.request.method !== "GET") {
+        return;  // /besuche/sync usw. laufen direkt, die Warteschlange liegt in IndexedDB
+    } else if (url.pathname === "/kunden/search") {
+        event.respondWith(kundensuche(event.request));
+    } else if (SHELL.includes(url.pathname)) {
+        // App-Shell: Cache zuerst, die Assets sind versioniert
+        event.respondWith(caches.match(url.pathname).then(r => r || fetch(event.request)));
+    }
+});
@@ -0,0 +1,6 @@
+// Nur die tatsächlich verwendeten Klassen landen im Build (build_assets.py)
+module.exports = {
+  content: ["./static/form.html"],
+  theme: { extend: {} },
+  plugins: [],
+};
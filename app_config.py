@@ -0,0 +1,23 @@
+import configparser
+import os
+
+# Projektordner (unabhängig vom Arbeitsverzeichnis, aus dem gestartet wird)
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_config = None
+
+def get_config() -> configparser.ConfigParser:
+    """Liest config.ini einmalig beim ersten Zugriff und liefert danach dieselbe Instanz."""
+    global _config
+    if _config is None:
+        config = configparser.ConfigParser()
+        config.read(os.path.join(BASE_DIR, "config.ini"), encoding="utf-8")
+        _config = config
+    return _config
+
+def get_section(name: str):
+    """Liefert einen Abschnitt der config.ini (leer, falls er fehlt)."""
+    config = get_config()
+    if not config.has_section(name):
+        config.add_section(name)
+    return config[name]
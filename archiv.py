@@ -0,0 +1,182 @@
+"""
+Revisionssicheres PDF-Archiv der Rechnungen.
+
+Jedes erzeugte PDF wird einmal unter seiner SHA-256 abgelegt (archiv/ab/abcdef....pdf, schreibgeschützt)
+und in der Tabelle rechnung_pdf mit der Rechnung verknüpft. Der Index (Kunde, Nummer, Datum, Status)
+kommt aus der Datenbank; geöffnet wird die archivierte Datei, ohne neu zu rendern. Beim Öffnen wird
+die Prüfsumme kontrolliert, veränderte Dateien fallen also auf.
+
+  python archiv.py --suche "klinikum 2510"      Index durchsuchen (--status offen|bezahlt, --von, --bis)
+  python archiv.py --export 2510-001 ziel.pdf   archivierte Fassung herauskopieren
+  python archiv.py --nachtragen Rechnungen/2025-10   vorhandene PDFs (<rechnung_nr>.pdf) übernehmen
+  python archiv.py --pruefen                    alle Archivdateien gegen ihre Prüfsumme prüfen
+"""
+import argparse
+import glob
+import hashlib
+import os
+import shutil
+import stat
+import subprocess
+import sys
+
+from app_config import BASE_DIR, get_section
+from db import archiviere_pdf, fetch_archiv, fetch_archiv_dateien, fetch_archiv_pdf
+
+_BLOCK = 1024 * 1024
+
+
+def archiv_cfg():
+    cfg = get_section("archiv")
+    return {
+        # relative Pfade beziehen sich auf den Programmordner
+        "ordner": os.path.join(BASE_DIR, cfg.get("ordner", "archiv")),
+        "aktiv": cfg.getboolean("aktiv", True)
+    }
+
+
+def _sha256(pfad: str) -> str:
+    sha = hashlib.sha256()
+    with open(pfad, "rb") as f:
+        for block in iter(lambda: f.read(_BLOCK), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def archivpfad(sha256: str) -> str:
+    """Ablageort einer Datei; zwei Zeichen Unterordner, damit kein Ordner zu groß wird."""
+    return os.path.join(archiv_cfg()["ordner"], sha256[:2], f"{sha256}.pdf")
+
+
+def _ablegen(quelle: str) -> tuple:
+    """Kopiert eine Datei ins Archiv (falls noch nicht vorhanden). Gibt (sha256, groesse) zurück."""
+    sha256 = _sha256(quelle)
+    ziel = archivpfad(sha256)
+    if os.path.isfile(ziel) and _sha256(ziel) == sha256:
+        return sha256, os.path.getsize(ziel)  # identische Datei liegt schon im Archiv
+
+    os.makedirs(os.path.dirname(ziel), exist_ok=True)
+    with open(quelle, "rb") as src, open(ziel + ".tmp", "wb") as dst:
+        shutil.copyfileobj(src, dst, _BLOCK)
+        dst.flush()
+        os.fsync(dst.fileno())
+    if _sha256(ziel + ".tmp") != sha256:
+        os.remove(ziel + ".tmp")
+        raise RuntimeError(f"{quelle} hat sich beim Archivieren verändert.")
+    if os.path.exists(ziel):
+        os.chmod(ziel, stat.S_IWRITE | stat.S_IREAD)  # beschädigte Datei ersetzen (unter Windows sonst nicht möglich)
+    os.replace(ziel + ".tmp", ziel)
+    os.chmod(ziel, stat.S_IREAD | stat.S_IRGRP | stat.S_IROTH)
+    return sha256, os.path.getsize(ziel)
+
+
+def archivieren(rechnung_nr: str, quelle: str) -> str:
+    """
+    Legt das PDF einer Rechnung im Archiv ab und verknüpft es in der Datenbank.
+    Gibt die SHA-256 zurück. Ist die Rechnung bezahlt und schon archiviert, bricht die Datenbank ab.
+    """
+    # Erst die Datei, dann der Eintrag: eine Datei ohne Eintrag ist harmlos, umgekehrt nicht
+    sha256, groesse = _ablegen(quelle)
+    archiviere_pdf(rechnung_nr, sha256, groesse)
+    return sha256
+
+
+def pdf_pfad(rechnung_nr: str):
+    """Pfad der jüngsten archivierten Fassung (Prüfsumme kontrolliert) oder None, falls nicht archiviert."""
+    eintrag = fetch_archiv_pdf(rechnung_nr)
+    if eintrag is None:
+        return None
+    sha256 = eintrag[0]
+    pfad = archivpfad(sha256)
+    if not os.path.isfile(pfad):
+        raise RuntimeError(f"Archivdatei für {rechnung_nr} fehlt: {pfad}")
+    if _sha256(pfad) != sha256:
+        raise RuntimeError(f"Archivdatei für {rechnung_nr} wurde verändert: {pfad}")
+    return pfad
+
+
+def oeffnen(pfad: str):
+    """Öffnet eine Datei im Standardprogramm des Systems."""
+    if sys.platform.startswith("win"):
+        os.startfile(pfad)
+    elif sys.platform == "darwin":
+        subprocess.Popen(["open", pfad])
+    else:
+        subprocess.Popen(["xdg-open", pfad])
+
+
+def exportieren(rechnung_nr: str, ziel: str) -> str:
+    """Kopiert die archivierte Fassung heraus (ohne den Schreibschutz). Gibt den Zielpfad zurück."""
+    pfad = pdf_pfad(rechnung_nr)
+    if pfad is None:
+        raise RuntimeError(f"Für {rechnung_nr} ist kein PDF archiviert.")
+    if os.path.isdir(ziel):
+        ziel = os.path.join(ziel, f"{rechnung_nr}.pdf")
+    shutil.copyfile(pfad, ziel)
+    return ziel
+
+
+def nachtragen(ordner: str) -> dict:
+    """
+    Übernimmt vorhandene PDFs mit dem Namen <rechnung_nr>.pdf aus einem Ordner ins Archiv.
+    Gibt {'archiviert': [...], 'uebersprungen': [(name, grund)]} zurück.
+    """
+    ergebnis = {"archiviert": [], "uebersprungen": []}
+    for pfad in sorted(glob.glob(os.path.join(ordner, "*.pdf"))):
+        rechnung_nr = os.path.splitext(os.path.basename(pfad))[0]
+        try:
+            archivieren(rechnung_nr, pfad)
+            ergebnis["archiviert"].append(rechnung_nr)
+        except Exception as e:
+            ergebnis["uebersprungen"].append((os.path.basename(pfad), str(e).strip().splitlines()[0]))
+    return ergebnis
+
+
+def pruefen() -> dict:
+    """Prüft jede verknüpfte Archivdatei. Gibt {'ok': anzahl, 'fehler': [(rechnung_nr, grund)]} zurück."""
+    ergebnis = {"ok": 0, "fehler": []}
+    for rechnung_nr, sha256, groesse in fetch_archiv_dateien():
+        pfad = archivpfad(sha256)
+        if not os.path.isfile(pfad):
+            ergebnis["fehler"].append((rechnung_nr, "Datei fehlt"))
+        elif os.path.getsize(pfad) != groesse or _sha256(pfad) != sha256:
+            ergebnis["fehler"].append((rechnung_nr, "Prüfsumme stimmt nicht"))
+        else:
+            ergebnis["ok"] += 1
+    return ergebnis
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="PDF-Archiv der Rechnungen")
+    parser.add_argument("--suche", default=None, help="Rechnungsnummer, Kundennummer, Name, Kürzel oder Ort")
+    parser.add_argument("--status", choices=["offen", "bezahlt"], default=None)
+    parser.add_argument("--von", default=None, help="Rechnungsdatum ab YYYY-MM-DD")
+    parser.add_argument("--bis", default=None, help="Rechnungsdatum bis YYYY-MM-DD")
+    parser.add_argument("--export", nargs=2, metavar=("RECHNUNG_NR", "ZIEL"), help="archivierte Fassung herauskopieren")
+    parser.add_argument("--nachtragen", metavar="ORDNER", help="vorhandene PDFs <rechnung_nr>.pdf ins Archiv übernehmen")
+    parser.add_argument("--pruefen", action="store_true", help="alle Archivdateien prüfen")
+    args = parser.parse_args()
+
+    try:
+        if args.export:
+            print(f"✅ {exportieren(*args.export)}")
+        elif args.nachtragen:
+            ergebnis = nachtragen(args.nachtragen)
+            print(f"✅ {len(ergebnis['archiviert'])} PDFs archiviert")
+            for name, grund in ergebnis["uebersprungen"]:
+                print(f"⚠️ {name}: {grund}")
+        elif args.pruefen:
+            ergebnis = pruefen()
+            print(f"✅ {ergebnis['ok']} Archivdateien in Ordnung")
+            for rechnung_nr, grund in ergebnis["fehler"]:
+                print(f"❌ {rechnung_nr}: {grund}")
+            sys.exit(1 if ergebnis["fehler"] else 0)
+        else:
+            bezahlt = None if args.status is None else args.status == "bezahlt"
+            for r in fetch_archiv(args.suche, bezahlt, args.von, args.bis):
+                status = "bezahlt" if r["bezahlt"] else "offen"
+                pdf = "PDF" if r["sha256"] else "-"
+                print(f"{r['rechnung_nr']:<10} {r['datum']}  {r['kunde'][:30]:<30} {r['summe'] or 0:>10.2f} €  {status:<8} {pdf}")
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
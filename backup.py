@@ -0,0 +1,486 @@
+"""
+Datensicherung der kundendatenbank.
+
+pg_dump läuft als Unterprozess, seine Ausgabe wird blockweise durch gzip in eine Datei im
+Sicherungsordner geschrieben (nie komplett im Speicher). Jede Sicherung bekommt eine SHA-256-
+Prüfsumme in SHA256SUMS (Format von sha256sum, also auch mit 'sha256sum -c' prüfbar).
+Alte Sicherungen werden nach Tages-/Wochen-/Monatsregel ausgedünnt. In größeren Abständen wird
+die neueste Sicherung testweise in eine Scratch-Datenbank zurückgespielt und mit der Live-
+Datenbank verglichen.
+
+  python backup.py                  jetzt sichern und Aufbewahrung anwenden
+  python backup.py --pruefen        Prüfsummen aller vorhandenen Sicherungen kontrollieren
+  python backup.py --restore-test   neueste Sicherung testweise zurückspielen
+  python backup.py --dienst         Dauerbetrieb: sichert und testet, sobald fällig
+
+Als Dienst auf dem Pi, z.B. /etc/systemd/system/kundendb-backup.service:
+  [Service]
+  WorkingDirectory=/home/pi/Invoice-Software
+  ExecStart=/usr/bin/python3 backup.py --dienst
+  Restart=on-failure
+  [Install]
+  WantedBy=multi-user.target
+
+Benötigt pg_dump und pg_restore (PostgreSQL-Client-Programme, mindestens die Version des Servers).
+Der Restore-Test braucht das Recht CREATEDB für den konfigurierten Benutzer.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from app_config import BASE_DIR, get_section
+
+ENDUNG = ".dump.gz"
+PRUEFSUMMEN = "SHA256SUMS"
+STATUS_DATEI = "backup_status.json"
+SPERRE = ".backup.lock"
+_BLOCK = 1024 * 1024
+_ZEITSTEMPEL = re.compile(r"_(\d{8}-\d{6})" + re.escape(ENDUNG) + "$")
+# Tabellen, deren Zeilenzahlen der Restore-Test mit der Live-Datenbank vergleicht
+PRUEF_TABELLEN = ("kunde", "kondition", "besuch", "rechnung", "zahlung", "mahnung", "schema_migration")
+# Kein Konsolenfenster für pg_dump/pg_restore, wenn die GUI unter pythonw läuft
+_OHNE_FENSTER = getattr(subprocess, "CREATE_NO_WINDOW", 0)
+
+
+def backup_cfg():
+    cfg = get_section("backup")
+    datenbank = get_section("database").get("database", "kundendatenbank")
+    return {
+        "datenbank": datenbank,
+        # relative Pfade beziehen sich auf den Programmordner, nicht auf das Arbeitsverzeichnis
+        "ziel": os.path.join(BASE_DIR, cfg.get("ziel", "backups")),
+        "pg_dump": cfg.get("pg_dump", "pg_dump"),
+        "pg_restore": cfg.get("pg_restore", "pg_restore"),
+        "kompression": cfg.getint("kompression", 6),
+        "intervall_stunden": cfg.getfloat("intervall_stunden", 24),
+        "taeglich": cfg.getint("aufbewahren_taeglich", 7),
+        "woechentlich": cfg.getint("aufbewahren_woechentlich", 4),
+        "monatlich": cfg.getint("aufbewahren_monatlich", 12),
+        "restore_test_tage": cfg.getfloat("restore_test_tage", 7),
+        "restore_test_db": cfg.get("restore_test_db", f"{datenbank}_restoretest"),
+        "beim_start": cfg.getboolean("beim_start", False)
+    }
+
+
+def _pg_umgebung() -> dict:
+    """Zugangsdaten für pg_dump/pg_restore als Umgebungsvariablen (nicht in der Befehlszeile sichtbar)."""
+    db = get_section("database")
+    env = dict(os.environ)
+    env.update(
+        PGHOST=db.get("host", "localhost"),
+        PGPORT=db.get("port", "5432"),
+        PGUSER=db.get("user", ""),
+        PGPASSWORD=db.get("password", ""),
+        PGCONNECT_TIMEOUT=db.get("connect_timeout", "5")
+    )
+    return env
+
+
+# --- Hilfsfunktionen ---
+@contextmanager
+def _sperre(ordner: str, max_alter_s=6 * 3600):
+    """Verhindert zwei gleichzeitige Läufe im selben Ordner (z.B. GUI und Dienst)."""
+    pfad = os.path.join(ordner, SPERRE)
+    try:
+        if time.time() - os.path.getmtime(pfad) > max_alter_s:
+            os.remove(pfad)  # Überbleibsel eines abgestürzten Laufs
+    except OSError:
+        pass
+    try:
+        fd = os.open(pfad, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        raise RuntimeError(f"Es läuft bereits eine Datensicherung ({pfad}).")
+    try:
+        os.write(fd, str(os.getpid()).encode())
+        os.close(fd)
+        yield
+    finally:
+        os.remove(pfad)
+
+
+def _datei_sha256(pfad: str) -> str:
+    sha = hashlib.sha256()
+    with open(pfad, "rb") as f:
+        for block in iter(lambda: f.read(_BLOCK), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def _fehlertext(stderr_datei) -> str:
+    stderr_datei.seek(0)
+    zeilen = stderr_datei.read().decode("utf-8", "replace").strip().splitlines()
+    return "\n".join(zeilen[-5:]) or "ohne Meldung"
+
+
+class _PruefsummenDatei:
+    """Dateiobjekt für gzip: schreibt durch und berechnet dabei die SHA-256 der komprimierten Daten."""
+    def __init__(self, datei):
+        self._datei = datei
+        self.sha = hashlib.sha256()
+
+    def write(self, daten):
+        self.sha.update(daten)
+        return self._datei.write(daten)
+
+    def flush(self):
+        self._datei.flush()
+
+
+def sicherungen(ordner: str) -> list:
+    """[(zeitpunkt, dateiname)] aller Sicherungen im Ordner, neueste zuerst."""
+    if not os.path.isdir(ordner):
+        return []
+    ergebnis = []
+    for name in os.listdir(ordner):
+        treffer = _ZEITSTEMPEL.search(name)
+        if treffer:
+            ergebnis.append((datetime.strptime(treffer.group(1), "%Y%m%d-%H%M%S"), name))
+    return sorted(ergebnis, reverse=True)
+
+
+def _lese_pruefsummen(ordner: str) -> dict:
+    pfad = os.path.join(ordner, PRUEFSUMMEN)
+    if not os.path.isfile(pfad):
+        return {}
+    summen = {}
+    with open(pfad, encoding="utf-8") as f:
+        for zeile in f:
+            if zeile.strip():
+                summe, name = zeile.rstrip("\n").split("  ", 1)
+                summen[name] = summe
+    return summen
+
+
+def _schreibe_pruefsummen(ordner: str, summen: dict):
+    pfad = os.path.join(ordner, PRUEFSUMMEN)
+    with open(pfad + ".tmp", "w", encoding="utf-8", newline="\n") as f:
+        for name in sorted(summen):
+            f.write(f"{summen[name]}  {name}\n")
+    os.replace(pfad + ".tmp", pfad)
+
+
+def lese_status(ordner: str) -> dict:
+    try:
+        with open(os.path.join(ordner, STATUS_DATEI), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _schreibe_status(ordner: str, **eintraege):
+    status = lese_status(ordner)
+    status.update(eintraege)
+    pfad = os.path.join(ordner, STATUS_DATEI)
+    with open(pfad + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(status, f, indent=2, ensure_ascii=False)
+    os.replace(pfad + ".tmp", pfad)
+
+
+# --- Sicherung ---
+def sichern(fortschritt=None) -> dict:
+    """
+    Erstellt eine Sicherung, prüft sie und wendet die Aufbewahrungsregeln an.
+    fortschritt(bytes_unkomprimiert) wird nach jedem Block aufgerufen.
+    Gibt einen Bericht (dict) zurück; wirft RuntimeError, wenn pg_dump fehlschlägt.
+    """
+    cfg = backup_cfg()
+    ordner = cfg["ziel"]
+    os.makedirs(ordner, exist_ok=True)
+    beginn = time.perf_counter()
+
+    with _sperre(ordner):
+        # Reste abgebrochener Läufe (nur möglich, solange keine Sperre bestand)
+        for name in os.listdir(ordner):
+            if name.endswith(ENDUNG + ".tmp"):
+                os.remove(os.path.join(ordner, name))
+
+        name = f"{cfg['datenbank']}_{datetime.now():%Y%m%d-%H%M%S}{ENDUNG}"
+        pfad = os.path.join(ordner, name)
+        unkomprimiert = 0
+
+        # Custom-Format ohne eigene Kompression: pg_restore kann es direkt vom Datenstrom lesen,
+        # komprimiert wird hier (gzip, Stufe aus der config)
+        befehl = [cfg["pg_dump"], "--format=custom", "--compress=0", "--no-password", cfg["datenbank"]]
+        with tempfile.TemporaryFile() as stderr_datei, open(pfad + ".tmp", "wb") as roh:
+            ziel = _PruefsummenDatei(roh)
+            prozess = subprocess.Popen(befehl, stdout=subprocess.PIPE, stderr=stderr_datei,
+                                       env=_pg_umgebung(), creationflags=_OHNE_FENSTER)
+            try:
+                with gzip.GzipFile(filename=name[:-3], mode="wb", fileobj=ziel, compresslevel=cfg["kompression"]) as gz:
+                    for block in iter(lambda: prozess.stdout.read(_BLOCK), b""):
+                        gz.write(block)
+                        unkomprimiert += len(block)
+                        if fortschritt:
+                            fortschritt(unkomprimiert)
+            finally:
+                prozess.stdout.close()
+                rueckgabe = prozess.wait()
+            roh.flush()
+            os.fsync(roh.fileno())
+            if rueckgabe != 0:
+                fehler = _fehlertext(stderr_datei)
+        if rueckgabe != 0:
+            os.remove(pfad + ".tmp")
+            raise RuntimeError(f"pg_dump fehlgeschlagen (Code {rueckgabe}):\n{fehler}")
+
+        # Geschriebene Datei noch einmal lesen: Prüfsumme muss zum Datenstrom passen
+        sha256 = ziel.sha.hexdigest()
+        if _datei_sha256(pfad + ".tmp") != sha256:
+            os.remove(pfad + ".tmp")
+            raise RuntimeError("Sicherung fehlerhaft geschrieben (Prüfsumme weicht ab).")
+        os.replace(pfad + ".tmp", pfad)
+
+        summen = _lese_pruefsummen(ordner)
+        summen[name] = sha256
+        _schreibe_pruefsummen(ordner, summen)
+        geloescht = aufbewahrung(ordner, cfg)
+
+        bericht = {
+            "datei": pfad,
+            "groesse": os.path.getsize(pfad),
+            "unkomprimiert": unkomprimiert,
+            "sha256": sha256,
+            "geloescht": geloescht,
+            "dauer_s": time.perf_counter() - beginn
+        }
+        _schreibe_status(ordner, letzte_sicherung={"zeit": datetime.now().isoformat(timespec="seconds"),
+                                                   "datei": name, "groesse": bericht["groesse"], "sha256": sha256})
+    return bericht
+
+
+def aufbewahrung(ordner: str, cfg: dict) -> list:
+    """
+    Behält die jeweils neueste Sicherung der letzten N Tage, Wochen und Monate (laut config),
+    löscht die übrigen samt Prüfsumme. Die neueste Sicherung bleibt immer erhalten.
+    Gibt die gelöschten Dateinamen zurück.
+    """
+    dateien = sicherungen(ordner)
+    if not dateien:
+        return []
+    behalten = {dateien[0][1]}
+    for anzahl, zeitraum in ((cfg["taeglich"], lambda z: z.date()),
+                             (cfg["woechentlich"], lambda z: z.isocalendar()[:2]),
+                             (cfg["monatlich"], lambda z: (z.year, z.month))):
+        gesehen = set()
+        for zeitpunkt, name in dateien:
+            schluessel = zeitraum(zeitpunkt)
+            if schluessel not in gesehen and len(gesehen) < anzahl:
+                gesehen.add(schluessel)
+                behalten.add(name)
+
+    geloescht = [name for _, name in dateien if name not in behalten]
+    for name in geloescht:
+        os.remove(os.path.join(ordner, name))
+    if geloescht:
+        summen = _lese_pruefsummen(ordner)
+        _schreibe_pruefsummen(ordner, {n: s for n, s in summen.items() if n not in geloescht})
+    return sorted(geloescht)
+
+
+def pruefen(ordner=None) -> dict:
+    """Vergleicht alle Sicherungen mit ihren Prüfsummen. Gibt {'ok': [...], 'fehler': [(name, grund)]} zurück."""
+    ordner = ordner or backup_cfg()["ziel"]
+    summen = _lese_pruefsummen(ordner)
+    ergebnis = {"ok": [], "fehler": []}
+    for _, name in sicherungen(ordner):
+        if name not in summen:
+            ergebnis["fehler"].append((name, "keine Prüfsumme"))
+        elif _datei_sha256(os.path.join(ordner, name)) != summen[name]:
+            ergebnis["fehler"].append((name, "Prüfsumme stimmt nicht"))
+        else:
+            ergebnis["ok"].append(name)
+    return ergebnis
+
+
+# --- Restore-Test ---
+def _zeilenzahlen(conn) -> dict:
+    zahlen = {}
+    with conn.cursor() as cur:
+        for tabelle in PRUEF_TABELLEN:
+            cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (tabelle,))
+            if cur.fetchone()[0]:
+                cur.execute(f"SELECT count(*) FROM {tabelle};")
+                zahlen[tabelle] = cur.fetchone()[0]
+    conn.rollback()
+    return zahlen
+
+
+def restore_test(datei=None) -> dict:
+    """
+    Spielt eine Sicherung (Standard: die neueste) in die Scratch-Datenbank ein, vergleicht die
+    Zeilenzahlen mit der Live-Datenbank und löscht die Scratch-Datenbank wieder.
+    Gibt einen Bericht (dict) zurück; 'ok' ist False, wenn das Einspielen scheitert oder
+    eine in der Live-Datenbank gefüllte Tabelle in der Sicherung fehlt oder leer ist.
+    """
+    from psycopg2 import sql
+    from db import get_connection
+
+    cfg = backup_cfg()
+    ordner = cfg["ziel"]
+    if datei is None:
+        vorhanden = sicherungen(ordner)
+        if not vorhanden:
+            raise RuntimeError(f"Keine Sicherung in {ordner} gefunden.")
+        datei = vorhanden[0][1]
+    pfad = os.path.join(ordner, datei)
+    beginn = time.perf_counter()
+
+    summe = _lese_pruefsummen(ordner).get(datei)
+    if summe is not None and _datei_sha256(pfad) != summe:
+        raise RuntimeError(f"{datei}: Prüfsumme stimmt nicht, Restore-Test abgebrochen.")
+
+    scratch = cfg["restore_test_db"]
+    if scratch == cfg["datenbank"]:
+        raise RuntimeError("restore_test_db darf nicht die Live-Datenbank sein.")
+
+    verwaltung = get_connection()
+    verwaltung.autocommit = True
+    try:
+        with verwaltung.cursor() as cur:
+            cur.execute(sql.SQL("DROP DATABASE IF EXISTS {};").format(sql.Identifier(scratch)))
+            cur.execute(sql.SQL("CREATE DATABASE {};").format(sql.Identifier(scratch)))
+
+        try:
+            befehl = [cfg["pg_restore"], "--no-owner", "--no-privileges", "--exit-on-error", "--no-password",
+                      "--dbname", scratch]
+            with tempfile.TemporaryFile() as stderr_datei:
+                prozess = subprocess.Popen(befehl, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=stderr_datei,
+                                           env=_pg_umgebung(), creationflags=_OHNE_FENSTER)
+                try:
+                    with gzip.open(pfad, "rb") as gz:
+                        for block in iter(lambda: gz.read(_BLOCK), b""):
+                            prozess.stdin.write(block)
+                except BrokenPipeError:
+                    pass  # pg_restore hat abgebrochen, der Rückgabewert sagt warum
+                finally:
+                    try:
+                        prozess.stdin.close()
+                    except BrokenPipeError:
+                        pass
+                    rueckgabe = prozess.wait()
+                if rueckgabe != 0:
+                    raise RuntimeError(f"pg_restore fehlgeschlagen (Code {rueckgabe}):\n{_fehlertext(stderr_datei)}")
+
+            live = _zeilenzahlen(verwaltung)
+            wiederhergestellt = get_connection(scratch)
+            try:
+                gesichert = _zeilenzahlen(wiederhergestellt)
+            finally:
+                wiederhergestellt.close()
+        finally:
+            with verwaltung.cursor() as cur:
+                cur.execute(sql.SQL("DROP DATABASE IF EXISTS {};").format(sql.Identifier(scratch)))
+    finally:
+        verwaltung.close()
+
+    # Die Live-Datenbank kann sich seit der Sicherung verändert haben: nur fehlende oder
+    # leere Tabellen gelten als Fehler, Abweichungen der Zeilenzahl werden angezeigt
+    fehlend = [t for t, anzahl in live.items() if anzahl and not gesichert.get(t)]
+    bericht = {
+        "datei": datei,
+        "ok": not fehlend,
+        "fehlend": fehlend,
+        "zeilen": {t: (gesichert.get(t), live.get(t)) for t in PRUEF_TABELLEN if t in live or t in gesichert},
+        "dauer_s": time.perf_counter() - beginn
+    }
+    _schreibe_status(ordner, letzter_restore_test={"zeit": datetime.now().isoformat(timespec="seconds"),
+                                                   "datei": datei, "ok": bericht["ok"]})
+    return bericht
+
+
+# --- Zeitplan ---
+def faellig(jetzt=None) -> tuple:
+    """(sicherung_faellig, restore_test_faellig) laut Status-Datei und config."""
+    cfg = backup_cfg()
+    jetzt = jetzt or datetime.now()
+    status = lese_status(cfg["ziel"])
+
+    def stunden_seit(eintrag):
+        if not eintrag:
+            return float("inf")
+        return (jetzt - datetime.fromisoformat(eintrag["zeit"])).total_seconds() / 3600
+
+    sicherung = stunden_seit(status.get("letzte_sicherung")) >= cfg["intervall_stunden"]
+    test = cfg["restore_test_tage"] > 0 and stunden_seit(status.get("letzter_restore_test")) >= cfg["restore_test_tage"] * 24
+    return sicherung, test
+
+
+def automatisch() -> dict:
+    """Führt aus, was fällig ist (Sicherung, danach ggf. Restore-Test). Für GUI-Start und Dienst."""
+    sicherung, test = faellig()
+    ergebnis = {"sicherung": None, "restore_test": None}
+    if sicherung:
+        ergebnis["sicherung"] = sichern()
+    if test and sicherungen(backup_cfg()["ziel"]):
+        ergebnis["restore_test"] = restore_test()
+    return ergebnis
+
+
+def bericht_als_text(ergebnis: dict) -> str:
+    zeilen = []
+    s = ergebnis.get("sicherung")
+    if s:
+        zeilen.append(f"✅ Sicherung {os.path.basename(s['datei'])}: {s['groesse'] / 1e6:.1f} MB "
+                      f"({s['unkomprimiert'] / 1e6:.1f} MB unkomprimiert) in {s['dauer_s']:.1f} s")
+        zeilen.append(f"   SHA-256 {s['sha256']}")
+        if s["geloescht"]:
+            zeilen.append(f"   Aufbewahrung: {len(s['geloescht'])} alte Sicherung(en) gelöscht")
+    t = ergebnis.get("restore_test")
+    if t:
+        zeichen = "✅" if t["ok"] else "❌"
+        zeilen.append(f"{zeichen} Restore-Test {t['datei']} in {t['dauer_s']:.1f} s")
+        for tabelle, (gesichert, live) in t["zeilen"].items():
+            zeilen.append(f"   {tabelle:<18} {gesichert if gesichert is not None else '-':>8} gesichert / {live if live is not None else '-':>8} live")
+        if t["fehlend"]:
+            zeilen.append(f"   Fehlt oder leer in der Sicherung: {', '.join(t['fehlend'])}")
+    return "\n".join(zeilen) or "Keine Sicherung fällig."
+
+
+def dienst(pruefintervall_s=600):
+    """Dauerbetrieb: prüft regelmäßig, ob eine Sicherung oder ein Restore-Test fällig ist."""
+    print(f"Datensicherung aktiv, Ziel: {backup_cfg()['ziel']}", flush=True)
+    while True:
+        try:
+            ergebnis = automatisch()
+            if ergebnis["sicherung"] or ergebnis["restore_test"]:
+                print(bericht_als_text(ergebnis), flush=True)
+        except Exception as e:
+            print(f"❌ Datensicherung fehlgeschlagen: {e}", flush=True)
+        time.sleep(pruefintervall_s)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Datensicherung der kundendatenbank")
+    parser.add_argument("--pruefen", action="store_true", help="Prüfsummen aller Sicherungen kontrollieren")
+    parser.add_argument("--restore-test", action="store_true", help="Neueste Sicherung testweise zurückspielen")
+    parser.add_argument("--dienst", action="store_true", help="Dauerbetrieb (sichert und testet, sobald fällig)")
+    args = parser.parse_args()
+
+    try:
+        if args.dienst:
+            dienst()
+        elif args.pruefen:
+            ergebnis = pruefen()
+            for name in ergebnis["ok"]:
+                print(f"✅ {name}")
+            for name, grund in ergebnis["fehler"]:
+                print(f"❌ {name}: {grund}")
+            sys.exit(1 if ergebnis["fehler"] else 0)
+        elif args.restore_test:
+            bericht = restore_test()
+            print(bericht_als_text({"restore_test": bericht}))
+            sys.exit(0 if bericht["ok"] else 1)
+        else:
+            print(bericht_als_text({"sicherung": sichern()}))
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
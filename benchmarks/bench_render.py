@@ -0,0 +1,87 @@
+"""
+Misst die Renderzeit pro Rechnung: alter Weg (Environment, Template und CSS bei jedem
+Aufruf neu, keine Font-Konfiguration) gegen den wiederverwendeten PdfRenderer.
+
+Zusätzlich: Render-Cache-Treffer (unveränderte Rechnung wird nur kopiert).
+
+Aufruf aus dem Projektordner:  python benchmarks/bench_render.py [anzahl]
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jinja2 import Environment, FileSystemLoader
+from weasyprint import HTML, CSS
+import generate_invoice
+from generate_invoice import BASE_DIR, PdfRenderer, STANDARD_FUSSZEILE
+
+
+def beispiel_rechnung(anzahl_besuche=8):
+    start = datetime(2025, 10, 1, 9, 0)
+    besuche = [
+        {"datum": (start + timedelta(days=3 * i)).strftime("%d.%m.%y"), "preis_pro_einheit": Decimal("95.00"),
+         "einheiten": 2, "einheitsdauer": 45, "bemerkung": "Supervision"}
+        for i in range(anzahl_besuche)
+    ]
+    fahrten = [
+        {"datum": b["datum"], "fahrtstrecke": Decimal("24"), "km_geld": Decimal("0.35"), "kosten": Decimal("8.40")}
+        for b in besuche
+    ]
+    return {
+        "rechnung_nr": "BENCH25-10", "datum": "01.11.2025", "frist": "15.11.2025", "kondition_id": 1,
+        "kunde": {"name": "Beispielklinik", "ansprechpartner": "Frau Muster", "strasse": "Hauptstr.",
+                  "hausnummer": "1", "plz": "96049", "ort": "Bamberg"},
+        "besuche": besuche,
+        "fahrtkosten": fahrten,
+        "summe": sum(b["preis_pro_einheit"] * b["einheiten"] for b in besuche) + sum(f["kosten"] for f in fahrten)
+    }
+
+
+def render_alt(rechnung, pfad):
+    """Nachbau des bisherigen generate_invoice()."""
+    env = Environment(loader=FileSystemLoader(BASE_DIR))
+    template = env.get_template("templates/rechnung.html")
+    html_content = template.render(rechnung=rechnung)
+    HTML(string=html_content).write_pdf(
+        pfad,
+        stylesheets=[CSS(string='@page {size: A4; margin: 0mm 20mm 10mm 20mm; @bottom-right {content: "Seite " counter(page) " von " counter(pages); font-size: 10pt;} @bottom-center {content: "' + STANDARD_FUSSZEILE + '"; font-size: 8pt; padding-top: 5px; }}')]
+    )
+
+
+def messen(name, funktion, rechnung, anzahl, ordner):
+    # Erster Aufruf getrennt: enthält Font-Suche und Template-Kompilierung
+    t0 = time.perf_counter()
+    funktion(rechnung, os.path.join(ordner, f"{name}_0.pdf"))
+    erster = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for i in range(1, anzahl + 1):
+        funktion(rechnung, os.path.join(ordner, f"{name}_{i}.pdf"))
+    schnitt = (time.perf_counter() - t0) / anzahl
+    print(f"{name:<8} erster Aufruf {erster * 1000:8.1f} ms   danach {schnitt * 1000:8.1f} ms/Rechnung")
+    return schnitt
+
+
+def main():
+    anzahl = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    rechnung = beispiel_rechnung()
+    with tempfile.TemporaryDirectory() as ordner:
+        vorher = messen("vorher", render_alt, rechnung, anzahl, ordner)
+        renderer = PdfRenderer(render_cache=False)
+        nachher = messen("nachher", lambda r, p: renderer.render("rechnung.html", p, rechnung=r), rechnung, anzahl, ordner)
+
+        # Eigener Cache-Ordner, damit der Lauf den echten Cache nicht berührt
+        generate_invoice.RENDER_CACHE_DIR = os.path.join(ordner, "cache")
+        mit_cache = PdfRenderer(render_cache=True)
+        cache = messen("cache", lambda r, p: mit_cache.render("rechnung.html", p, rechnung=r), rechnung, anzahl, ordner)
+    print(f"Faktor: {vorher / nachher:.2f}x  ({anzahl} Rechnungen)")
+    print(f"Faktor mit Cache-Treffer: {vorher / cache:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Misst die Verzugsberechnung (verzug.berechne_verzug) über viele offene Rechnungen mit
+Teilzahlungen, Mahnungen und mehreren Basiszins-Wechseln. Ohne Datenbank.
+
+Aufruf aus dem Projektordner:  python benchmarks/bench_verzug.py [anzahl]
+"""
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from verzug import Zinstabelle, berechne_verzug
+
+BASISZINS = [
+    (date(2016, 7, 1), Decimal("-0.88")), (date(2023, 1, 1), Decimal("1.62")), (date(2023, 7, 1), Decimal("3.12")),
+    (date(2024, 1, 1), Decimal("3.62")), (date(2024, 7, 1), Decimal("3.37")), (date(2025, 1, 1), Decimal("2.27")),
+    (date(2025, 7, 1), Decimal("1.27"))
+]
+CFG = {
+    "zahlungsziel_tage": 14,
+    "zuschlag_prozentpunkte": Decimal("5"),
+    "gebuehren": {1: Decimal("0.00"), 2: Decimal("10.00")},
+    "pauschale": Decimal("0.00")
+}
+
+
+def beispiel_posten(anzahl, stichtag):
+    zufall = random.Random(42)
+    posten = []
+    for _ in range(anzahl):
+        rechnungsdatum = stichtag - timedelta(days=zufall.randint(20, 900))
+        summe = Decimal(zufall.randint(9000, 250000)) / 100
+        zahlungen = [
+            (rechnungsdatum + timedelta(days=zufall.randint(20, (stichtag - rechnungsdatum).days)), (summe / 4).quantize(Decimal("0.01")))
+            for _ in range(zufall.randint(0, 2))
+        ]
+        mahnungen = [(1, rechnungsdatum + timedelta(days=21)), (2, rechnungsdatum + timedelta(days=35))][:zufall.randint(0, 2)]
+        posten.append((summe, rechnungsdatum, sorted(zahlungen), mahnungen))
+    return posten
+
+
+def main():
+    anzahl = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    stichtag = date(2025, 10, 31)
+    posten = beispiel_posten(anzahl, stichtag)
+    tabelle = Zinstabelle(BASISZINS, CFG["zuschlag_prozentpunkte"])
+
+    t0 = time.perf_counter()
+    ergebnisse = [berechne_verzug(*p, tabelle, stichtag, CFG) for p in posten]
+    dauer = time.perf_counter() - t0
+
+    zinsen = sum((e["zinsen"] for e in ergebnisse), Decimal("0"))
+    gesamt = sum((e["gesamt"] for e in ergebnisse), Decimal("0"))
+    print(f"{anzahl} Rechnungen in {dauer * 1000:.0f} ms ({dauer / anzahl * 1e6:.0f} µs/Rechnung)")
+    print(f"Zinsen gesamt {zinsen} €, offen gesamt {gesamt} €")
+
+
+if __name__ == "__main__":
+    main()
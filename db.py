@@ -1,120 +1,399 @@
 import psycopg2
-import configparser
-from datetime import datetime, timedelta
+import psycopg2.pool
+import psycopg2.extras
+import psycopg2.extensions
+import hashlib
+import json
+import os
+import select
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, time as dtime
+from decimal import Decimal
 from pprint import pprint
+from app_config import BASE_DIR, get_section
 
-# --- Konfiguration einlesen ---
-config = configparser.ConfigParser()
-config.read("config.ini")
-
-db_cfg = config["database"]
+# --- Konfiguration (wird erst beim ersten Verbindungsaufbau gelesen) ---
+def _db_cfg():
+    return get_section("database")
 
 # --- Verbindungsfunktion ---
-def get_connection():
+def get_connection(database=None):
+    """Öffnet eine neue, ungepoolte Verbindung (für Tests und Sonderfälle, z.B. den Restore-Test)."""
+    db_cfg = _db_cfg()
     conn = psycopg2.connect(
         host=db_cfg["host"],
         port=db_cfg.get("port", 5432),
-        database=db_cfg["database"],
+        database=database or db_cfg["database"],
         user=db_cfg["user"],
-        password=db_cfg["password"]
+        password=db_cfg["password"],
+        # TCP-Keepalives, damit tote Verbindungen (z.B. nach Neustart des Pi) auffallen
+        keepalives=1,
+        keepalives_idle=db_cfg.getint("keepalives_idle", 60),
+        keepalives_interval=10,
+        keepalives_count=3,
+        connect_timeout=db_cfg.getint("connect_timeout", 5)
     )
     return conn
 
-def fetch_kunden():
+# --- Connection-Pool ---
+# Ein Pool pro Prozess: Der TCP- und Login-Handshake zum Raspberry Pi kostet mehr
+# als die eigentlichen Abfragen, daher werden Verbindungen wiederverwendet.
+_pool = None
+_pool_lock = threading.Lock()
+_pool_slots = None            # begrenzt gleichzeitige Ausleihen (Pool wirft sonst PoolError)
+_zuletzt_benutzt = {}         # id(conn) -> Zeitstempel der letzten Rückgabe
+
+class _Pool(psycopg2.pool.ThreadedConnectionPool):
     """
-    Holt alle Kunden aus der Datenbank und gibt eine Liste von Dictionaries zurück.
+    ThreadedConnectionPool, der neue Verbindungen über get_connection() aufbaut und bis zu
+    maxconn unbenutzte Verbindungen behält (minconn gilt nur für den Start).
     """
-    try:
+    def _connect(self, key=None):
         conn = get_connection()
-        cur = conn.cursor()  # Cursor = "Steuerungselement" für SQL-Abfragen
+        # Frisch aufgebaut: beim ersten Ausleihen kein zusätzliches SELECT 1
+        _zuletzt_benutzt[id(conn)] = time.monotonic()
+        if key is not None:
+            self._used[key] = conn
+            self._rused[id(conn)] = key
+        else:
+            self._pool.append(conn)
+        return conn
 
-        cur.execute("SELECT kdnr, name FROM kunde ORDER BY kdnr;")
-        rows = cur.fetchall()  # Holt alle Zeilen der Ergebnistabelle
+    def _putconn(self, conn, key=None, close=False):
+        # psycopg2 schließt zurückgegebene Verbindungen, sobald minconn unbenutzt im Pool liegen;
+        # dann bräuchte fast jeder Aufruf aus dem BackgroundExecutor eine neue Verbindung.
+        # putconn hält self._lock, der Tausch ist also threadsicher.
+        minconn, self.minconn = self.minconn, self.maxconn
+        try:
+            super()._putconn(conn, key, close)
+        finally:
+            self.minconn = minconn
 
-        kunden = [{"kdnr": row[0], "name": row[1]} for row in rows]
+def _get_pool():
+    global _pool, _pool_slots
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                db_cfg = _db_cfg()
+                minconn = db_cfg.getint("pool_min", 1)
+                maxconn = db_cfg.getint("pool_max", 5)
+                _pool_slots = threading.BoundedSemaphore(maxconn)
+                _pool = _Pool(minconn, maxconn)
+    return _pool
 
-        cur.close()
-        conn.close()
+def _ist_gesund(conn) -> bool:
+    """Health-Check beim Ausleihen: geschlossene Verbindungen sofort verwerfen,
+    länger unbenutzte zusätzlich mit SELECT 1 anpingen."""
+    if conn.closed:
+        return False
+    idle = time.monotonic() - _zuletzt_benutzt.get(id(conn), 0.0)
+    if idle < _db_cfg().getfloat("pool_ping_nach", 30.0):
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1;")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+def _ausleihen(pool):
+    # Höchstens maxconn Versuche: jede verworfene Verbindung wird durch eine neue ersetzt
+    for _ in range(pool.maxconn + 1):
+        conn = pool.getconn()
+        if _ist_gesund(conn):
+            return conn
+        _zurueckgeben(pool, conn, verwerfen=True)
+    raise psycopg2.OperationalError("Keine funktionierende Datenbankverbindung verfügbar.")
+
+def _zurueckgeben(pool, conn, verwerfen=False):
+    try:
+        if verwerfen or conn.closed:
+            _zuletzt_benutzt.pop(id(conn), None)
+            pool.putconn(conn, close=True)
+        else:
+            _zuletzt_benutzt[id(conn)] = time.monotonic()
+            pool.putconn(conn)
+    except psycopg2.pool.PoolError:
+        if not pool.closed:
+            raise
+        # close_pool() lief während der Ausleihe: Verbindung nur noch schließen
+        _zuletzt_benutzt.pop(id(conn), None)
+        if not conn.closed:
+            conn.close()
+
+@contextmanager
+def pooled_connection():
+    """
+    Leiht eine Verbindung aus dem Pool und gibt sie danach zurück.
+    Bei Erfolg wird committet, bei einem Fehler zurückgerollt. Verbindungen mit
+    abgerissenem Socket werden verworfen und beim nächsten Ausleihen neu aufgebaut.
+    """
+    pool = _get_pool()
+    with _pool_slots:
+        conn = _ausleihen(pool)
+        verwerfen = False
+        try:
+            yield conn
+            conn.commit()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            verwerfen = True
+            raise
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            _zurueckgeben(pool, conn, verwerfen)
+
+@contextmanager
+def db_cursor():
+    """Kurzform: gepoolte Verbindung + Cursor in einem."""
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            yield cur
+
+def close_pool():
+    """Schließt alle Verbindungen des Pools (z.B. beim Beenden der Anwendung)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+            _zuletzt_benutzt.clear()
+
+# --- Lokaler Cache für Stammdaten (kunde, kondition) ---
+# Kunden und Konditionen ändern sich selten, werden aber bei jedem Dropdown gebraucht.
+# Schreibzugriffe über dieses Modul leeren den Cache sofort und melden die Änderung per
+# NOTIFY, damit andere Clients (LISTEN) ihren Cache ebenfalls leeren. Ohne verbundenen
+# Listener wird nicht gecacht, sonst blieben fremde Änderungen bis zum Ablauf der TTL unsichtbar.
+# Die Abrechnung liest Kunde und Konditionen immer in ihrer eigenen Transaktion (nie aus dem Cache).
+CACHE_KANAL = "stammdaten_geaendert"
+
+_cache = {}                   # bereich -> (gueltig_bis, wert)
+_cache_lock = threading.Lock()
+_cache_generation = 0         # verhindert, dass ein veralteter Ladevorgang nach einer Invalidierung gespeichert wird
+_listener_verbunden = False   # nur dann werden fremde Änderungen gemeldet
+
+def _cache_ttl() -> float:
+    return get_section("cache").getfloat("ttl", 300.0)
+
+def _aus_cache(bereich: str, laden):
+    jetzt = time.monotonic()
+    with _cache_lock:
+        eintrag = _cache.get(bereich)
+        if eintrag is not None and eintrag[0] > jetzt:
+            return eintrag[1]
+        generation = _cache_generation
+        cachen = _listener_verbunden
+
+    wert = laden()
+
+    with _cache_lock:
+        if cachen and generation == _cache_generation:
+            _cache[bereich] = (jetzt + _cache_ttl(), wert)
+    return wert
+
+def invalidate_cache():
+    """Verwirft alle gecachten Kunden und Konditionen."""
+    global _cache_generation
+    with _cache_lock:
+        _cache.clear()
+        _cache_generation += 1
+
+def _lade_kunden():
+    with db_cursor() as cur:
+        cur.execute("SELECT kdnr, name, strasse, hausnummer, plz, ort, ansprechpartner, kuerzel FROM kunde ORDER BY kdnr;")
+        # kdnr -> (name, strasse, hausnummer, plz, ort, ansprechpartner, kuerzel)
+        return {row[0]: row[1:] for row in cur.fetchall()}
+
+def _lies_kunden(cur, kdnrs) -> dict:
+    """Kundenköpfe wie im Cache, aber in der laufenden Transaktion gelesen."""
+    cur.execute("""
+        SELECT kdnr, name, strasse, hausnummer, plz, ort, ansprechpartner, kuerzel
+        FROM kunde WHERE kdnr = ANY(%s);
+    """, (list(kdnrs),))
+    return {row[0]: row[1:] for row in cur.fetchall()}
+
+def _lies_konditionen(cur, kdnrs=None, sperren=False) -> dict:
+    """
+    kdnr -> [kondition, ...] nach gueltig_von, in der laufenden Transaktion gelesen.
+    kdnrs None = alle Kunden. sperren: FOR SHARE, d.h. bis zum Commit nicht änderbar.
+    """
+    cur.execute(f"""
+        SELECT kdnr, kondition_id, gueltig_von, gueltig_bis, preis_pro_einheit, einheitsdauer_min, fahrtstrecke_km, km_geld
+        FROM kondition
+        {"WHERE kdnr = ANY(%s)" if kdnrs is not None else ""}
+        ORDER BY kdnr, gueltig_von
+        {"FOR SHARE" if sperren else ""};
+    """, (list(kdnrs),) if kdnrs is not None else None)
+    konditionen = {}
+    for row in cur.fetchall():
+        konditionen.setdefault(row[0], []).append({
+            "kondition_id": row[1], "gueltig_von": row[2], "gueltig_bis": row[3],
+            "preis_pro_einheit": row[4], "einheitsdauer_min": row[5],
+            "fahrtstrecke_km": row[6], "km_geld": row[7]
+        })
+    return konditionen
+
+def _konditionen_stand(konditionen: list) -> list:
+    """Vergleichswert der Konditionen eines Kunden (siehe upsert_rechnungen)."""
+    return [tuple(k.values()) for k in konditionen]
+
+def _lade_konditionen():
+    with db_cursor() as cur:
+        return _lies_konditionen(cur)
+
+def _kunden_cache() -> dict:
+    return _aus_cache("kunden", _lade_kunden)
+
+def _kunde(kdnr: int):
+    kunden = _kunden_cache()
+    if kdnr not in kunden:
+        # Evtl. gerade erst (z.B. über die Web-App) angelegt -> einmal frisch laden
+        invalidate_cache()
+        kunden = _kunden_cache()
+    return kunden.get(kdnr)
+
+def _konditionen(kdnr: int) -> list:
+    return _aus_cache("konditionen", _lade_konditionen).get(kdnr, [])
+
+def _kondition_gilt(kondition: dict, termin: datetime) -> bool:
+    # Gleiche Semantik wie in SQL (termin >= gueltig_von AND termin <= gueltig_bis):
+    # das Datum wird als Mitternacht des Tages verglichen
+    von = datetime.combine(kondition["gueltig_von"], dtime.min, tzinfo=termin.tzinfo)
+    if termin < von:
+        return False
+    if kondition["gueltig_bis"] is None:
+        return True
+    return termin <= datetime.combine(kondition["gueltig_bis"], dtime.min, tzinfo=termin.tzinfo)
+
+def _benachrichtigen(cur, kdnr: int):
+    """Meldet eine Stammdatenänderung an andere Clients (wird mit dem Commit zugestellt)."""
+    cur.execute("SELECT pg_notify(%s, %s);", (CACHE_KANAL, str(kdnr)))
+
+_listener = None
+
+def starte_cache_listener():
+    """
+    Startet (einmalig) einen Hintergrund-Thread, der per LISTEN auf Stammdatenänderungen
+    anderer Clients wartet und den Cache leert. Aktiv, solange [cache] listen_notify nicht false ist;
+    ohne Listener wird nicht gecacht.
+    """
+    global _listener
+    if _listener is not None or not get_section("cache").getboolean("listen_notify", True):
+        return
+    _listener = threading.Thread(target=_listen_schleife, name="cache-listener", daemon=True)
+    _listener.start()
+
+def _listen_schleife():
+    global _listener_verbunden
+    wartezeit = 1
+    while True:
+        conn = None
+        try:
+            conn = get_connection()
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {CACHE_KANAL};")
+            # Während der Verbindungspause können Meldungen verloren gegangen sein
+            with _cache_lock:
+                _listener_verbunden = True
+            invalidate_cache()
+            wartezeit = 1
+            while True:
+                if select.select([conn], [], [], 60)[0]:
+                    conn.poll()
+                    if conn.notifies:
+                        conn.notifies.clear()
+                        invalidate_cache()
+                else:
+                    conn.poll()  # Verbindung prüfen, wirft bei totem Socket
+        except Exception as e:
+            print("⚠️ Cache-Listener getrennt, neuer Versuch:", e)
+        finally:
+            # Ohne Listener nicht mehr cachen (Änderungen anderer Clients kämen nicht an)
+            with _cache_lock:
+                _listener_verbunden = False
+            invalidate_cache()
+            if conn is not None and not conn.closed:
+                conn.close()
+        time.sleep(wartezeit)
+        wartezeit = min(wartezeit * 2, 60)
+
+def fetch_kunden():
+    """
+    Holt alle Kunden (aus dem Cache) und gibt eine Liste von Dictionaries zurück.
+    """
+    try:
+        kunden = [{"kdnr": kdnr, "name": row[0], "kuerzel": row[6], "ort": row[4]} for kdnr, row in _kunden_cache().items()]
 
         return kunden
     except Exception as e:
         print("❌ Fehler beim Abrufen der Kunden:", e)
         return []
 
-def fetch_rechnungsdaten(kdnr: int, startdatum: str, enddatum: str):
+def _summe(werte):
+    """SUM() wie in SQL: NULL-Werte ignorieren, ohne Werte ergibt sich None."""
+    werte = [w for w in werte if w is not None]
+    return sum(werte) if werte else None
+
+def _produkt(a, b):
+    return a * b if a is not None and b is not None else None
+
+def _trenne_abgerechnete(rows):
     """
-    Holt alle Daten, die für die Rechnung eines Kunden im angegebenen Zeitraum benötigt werden.
+    Teilt Besuchszeilen, die mit (rechnung_nr, bezahlt) der Rechnung enden, mit der der Besuch
+    berechnet wurde, in (berechenbar, bereits_abgerechnet, rechnung_nr).
+    Gehören Besuche zu einer noch unbezahlten Rechnung, wird diese neu erstellt (gleiche Nummer,
+    bei mehreren die mit dem frühesten Besuch); alle übrigen berechneten Besuche bleiben außen vor.
+    Ist alles schon mit bezahlten Rechnungen abgerechnet, ist rechnung_nr die bezahlte Rechnung mit
+    dem frühesten Besuch (gesperrt, siehe check_invoice_paid); berechenbar ist dann leer.
     """
-    conn = get_connection()
-    cur = conn.cursor()
-    
-    # Kundendaten
-    cur.execute("SELECT name, strasse, hausnummer, plz, ort, ansprechpartner, kuerzel FROM kunde WHERE kdnr = %s;", (kdnr,))
-    kunde_row = cur.fetchone()
-    
-    # Besuchsdaten
-    cur.execute("""
-        SELECT b.termin, b.anzahl_einheiten, b.bemerkung, k.preis_pro_einheit, k.einheitsdauer_min, k.kondition_id
-        FROM besuch b 
-        JOIN kondition k ON k.kdnr = b.kdnr 
-        WHERE b.kdnr = %s 
-            AND b.termin BETWEEN %s AND %s 
-            AND b.termin >= k.gueltig_von 
-            AND (k.gueltig_bis IS NULL OR b.termin <= k.gueltig_bis) 
-        ORDER BY b.termin;
-    """, (kdnr, startdatum, enddatum))
-    besuche_rows = cur.fetchall()
-    
-    # Fahrtkosten (ein Eintrag pro Besuchstag)
-    cur.execute("""
-        SELECT DISTINCT DATE(b.termin) AS besuchsdatum, k.fahrtstrecke_km, k.km_geld, k.fahrtstrecke_km * k.km_geld AS fahrtkosten
-        FROM besuch b
-        JOIN kondition k ON k.kdnr = b.kdnr
-        WHERE b.kdnr = %s
-            AND b.termin BETWEEN %s AND %s 
-            AND b.termin >= k.gueltig_von 
-            AND (k.gueltig_bis IS NULL OR b.termin <= k.gueltig_bis) 
-        ORDER BY besuchsdatum;
-    """, (kdnr, startdatum, enddatum))
-    fahrt_rows = cur.fetchall()
-
-    # Gesamtkosten
-    cur.execute("""
-        WITH einheitenkosten AS (
-            SELECT SUM(b.anzahl_einheiten * k.preis_pro_einheit) AS summe_einheitenkosten
-            FROM besuch b
-            JOIN kondition k ON k.kdnr = b.kdnr
-            WHERE b.kdnr = %s
-                AND b.termin BETWEEN %s AND %s
-                AND b.termin >= k.gueltig_von
-                AND (k.gueltig_bis IS NULL OR b.termin <= k.gueltig_bis)
-            ),
-            fahrtkosten AS (
-                SELECT SUM(k.fahrtstrecke_km * k.km_geld) AS summe_fahrtkosten
-                FROM (
-                    SELECT DISTINCT DATE(b.termin) AS besuchsdatum, k.fahrtstrecke_km, k.km_geld
-                    FROM besuch b
-                    JOIN kondition k ON k.kdnr = b.kdnr
-                    WHERE b.kdnr = %s
-                        AND b.termin BETWEEN %s AND %s
-                        AND b.termin >= k.gueltig_von
-                        AND (k.gueltig_bis IS NULL OR b.termin <= k.gueltig_bis)
-                    ) AS k
-                )
-            SELECT ek.summe_einheitenkosten, fk.summe_fahrtkosten, (ek.summe_einheitenkosten + fk.summe_fahrtkosten) AS gesamt_summe
-            FROM einheitenkosten ek, fahrtkosten fk;
-        """, (kdnr, startdatum, enddatum, kdnr, startdatum, enddatum))
-    gesamtsumme = cur.fetchone()
-    
-    cur.close()
-    conn.close()
-    
+    offene = [row[-2] for row in rows if row[-2] is not None and not row[-1]]
+    if offene:
+        rechnung_nr = offene[0]
+    elif rows and all(row[-2] is not None for row in rows):
+        rechnung_nr = rows[0][-2]
+    else:
+        rechnung_nr = None
+    berechenbar, abgerechnet = [], []
+    for row in rows:
+        if row[-2] is None or (row[-2] == rechnung_nr and not row[-1]):
+            berechenbar.append(row[:-2])
+        else:
+            abgerechnet.append(row)
+    return berechenbar, abgerechnet, rechnung_nr
+
+def _baue_rechnung(kunde_row, besuche_rows, rechnung_nr=None, bereits_abgerechnet=()):
+    """
+    Baut das Rechnungs-Dictionary für das Template.
+    kunde_row:    (name, strasse, hausnummer, plz, ort, ansprechpartner, kuerzel)
+    besuche_rows: (termin, anzahl_einheiten, bemerkung, preis_pro_einheit, einheitsdauer_min,
+                   kondition_id, fahrtstrecke_km, km_geld, besuch_id), nach Termin sortiert
+    rechnung_nr:  Nummer einer bestehenden Rechnung (Neuerstellung) oder None; neue Rechnungen
+                  bekommen ihre Nummer erst beim Verbuchen (upsert_rechnungen)
+    bereits_abgerechnet: [(datum, rechnung_nr)] der übersprungenen, anderweitig berechneten Besuche
+    """
+    # Fahrtkosten (ein Eintrag pro Besuchstag, wie SELECT DISTINCT DATE(termin), km, km_geld)
+    fahrt_rows = sorted({(row[0].date(), row[6], row[7]) for row in besuche_rows}, key=lambda f: f[0])
+
+    # Gesamtkosten einmalig aus den geladenen Zeilen berechnen
+    summe_einheitenkosten = _summe(_produkt(row[1], row[3]) for row in besuche_rows)
+    summe_fahrtkosten = _summe(_produkt(row[1], row[2]) for row in fahrt_rows)
+    if summe_einheitenkosten is None or summe_fahrtkosten is None:
+        gesamt_summe = None
+    else:
+        gesamt_summe = summe_einheitenkosten + summe_fahrtkosten
+
     # Datenstruktur für Template
     re_datum = datetime.now()
     frist = re_datum + timedelta(days=14)
     
     rechnung = {
-        "rechnung_nr": f"{kunde_row[6]}{datetime.now().strftime('%y-%m')}",
+        "rechnung_nr": rechnung_nr,
         "datum": re_datum.strftime("%d.%m.%Y"),
         "frist": frist.strftime("%d.%m.%Y"),
         "kondition_id": besuche_rows[0][5] if len(besuche_rows) > 0 else None,
@@ -141,173 +420,744 @@ def fetch_rechnungsdaten(kdnr: int, startdatum: str, enddatum: str):
                 "datum": row[0].strftime("%d.%m.%y"),
                 "fahrtstrecke": row[1],
                 "km_geld": row[2],
-                "kosten": row[3]
+                "kosten": _produkt(row[1], row[2])
             }
             for row in fahrt_rows
 #            if all(x is not None for x in row[1:4]) and row[3] > 0
         ],
-        "summe": gesamtsumme[2]
+        "summe": gesamt_summe,
+        # Für die Verbuchung: diese Besuche werden mit der Rechnung verknüpft
+        "besuch_ids": [row[8] for row in besuche_rows],
+        "bereits_abgerechnet": list(bereits_abgerechnet)
     }
     
     return rechnung
 
+def fetch_rechnungsdaten(kdnr: int, startdatum, enddatum: str, nur_unberechnet: bool = False):
+    """
+    Holt alle Daten, die für die Rechnung eines Kunden im angegebenen Zeitraum benötigt werden.
+    Kundenkopf, Konditionen und Besuche werden in einer Transaktion gelesen (nicht aus dem Cache,
+    damit nie mit veralteten Preisen abgerechnet wird); Fahrtkosten und Summen werden in Python berechnet.
+
+    nur_unberechnet: alle noch nicht abgerechneten Besuche bis enddatum (startdatum wird ignoriert),
+    ergibt immer eine neue Rechnung.
+    Im Zeitraum-Modus wird eine unbezahlte Rechnung über dieselben Besuche neu erstellt; Besuche
+    anderer Rechnungen werden nie übernommen, sondern in rechnung['bereits_abgerechnet'] gemeldet.
+    """
+    with db_cursor() as cur:
+        kunde_row = _lies_kunden(cur, [kdnr]).get(kdnr)
+        konditionen = _lies_konditionen(cur, [kdnr]).get(kdnr, [])
+        if nur_unberechnet:
+            # Nur offene Besuche: liest über den Teilindex ix_besuch_unberechnet
+            cur.execute("""
+                SELECT besuch_id, termin, anzahl_einheiten, bemerkung, NULL::text, NULL::boolean
+                FROM besuch
+                WHERE kdnr = %s AND termin <= %s AND rechnung_id IS NULL
+                ORDER BY termin;
+            """, (kdnr, enddatum))
+        else:
+            cur.execute("""
+                SELECT b.besuch_id, b.termin, b.anzahl_einheiten, b.bemerkung, r.rechnung_nr, r.bezahlt
+                FROM besuch b
+                LEFT JOIN rechnung r ON r.rechnung_id = b.rechnung_id
+                WHERE b.kdnr = %s AND b.termin BETWEEN %s AND %s
+                ORDER BY b.termin;
+            """, (kdnr, startdatum, enddatum))
+        besuch_rows, abgerechnet, rechnung_nr = _trenne_abgerechnete(cur.fetchall())
+
+    # Besuche mit der jeweils gültigen Kondition verknüpfen (wie der frühere JOIN)
+    besuche_rows = [
+        (termin, einheiten, bemerkung, k["preis_pro_einheit"], k["einheitsdauer_min"],
+         k["kondition_id"], k["fahrtstrecke_km"], k["km_geld"], besuch_id)
+        for besuch_id, termin, einheiten, bemerkung in besuch_rows
+        for k in konditionen
+        if _kondition_gilt(k, termin)
+    ]
+
+    rechnung = _baue_rechnung(
+        kunde_row, besuche_rows, rechnung_nr,
+        [(row[1].strftime("%d.%m.%y"), row[-2]) for row in abgerechnet]
+    )
+    rechnung["konditionen_stand"] = _konditionen_stand(konditionen)
+    return rechnung
+
+def fetch_rechnungsdaten_alle(startdatum, enddatum: str, nur_unberechnet: bool = False):
+    """
+    Holt die Rechnungsdaten ALLER Kunden mit Besuchen im Zeitraum in einer Abfrage (Sammellauf).
+    Gibt (rechnungen, ohne_kondition) zurück:
+      rechnungen:     Liste von (kdnr, rechnung_dict)
+      ohne_kondition: Liste von (kdnr, name) mit Besuchen, für die keine gültige Kondition existiert
+    nur_unberechnet wie bei fetch_rechnungsdaten: alle offenen Besuche bis enddatum.
+    """
+    if nur_unberechnet:
+        besuche_sql = """
+            SELECT besuch_id, kdnr, termin, anzahl_einheiten, bemerkung,
+                   NULL::text AS abgerechnet_in, NULL::boolean AS bezahlt
+            FROM besuch WHERE termin <= %s AND rechnung_id IS NULL
+        """
+        params = (enddatum,)
+    else:
+        besuche_sql = """
+            SELECT b.besuch_id, b.kdnr, b.termin, b.anzahl_einheiten, b.bemerkung,
+                   r.rechnung_nr AS abgerechnet_in, r.bezahlt
+            FROM besuch b LEFT JOIN rechnung r ON r.rechnung_id = b.rechnung_id
+            WHERE b.termin BETWEEN %s AND %s
+        """
+        params = (startdatum, enddatum)
+
+    with db_cursor() as cur:
+        cur.execute(f"""
+            SELECT ku.kdnr, ku.name, ku.strasse, ku.hausnummer, ku.plz, ku.ort, ku.ansprechpartner, ku.kuerzel,
+                   b.termin, b.anzahl_einheiten, b.bemerkung, k.preis_pro_einheit, k.einheitsdauer_min,
+                   k.kondition_id, k.fahrtstrecke_km, k.km_geld, b.besuch_id, b.abgerechnet_in, b.bezahlt
+            FROM ({besuche_sql}) b
+            JOIN kunde ku ON ku.kdnr = b.kdnr
+            LEFT JOIN kondition k ON k.kdnr = b.kdnr
+                AND b.termin >= k.gueltig_von
+                AND (k.gueltig_bis IS NULL OR b.termin <= k.gueltig_bis)
+            ORDER BY ku.kdnr, b.termin;
+        """, params)
+        rows = cur.fetchall()
+        konditionen = _lies_konditionen(cur, {row[0] for row in rows})
+
+    # Zeilen nach Kunde gruppieren (Reihenfolge kommt sortiert aus der DB)
+    kunden = {}
+    for row in rows:
+        kunden.setdefault(row[0], []).append(row)
+
+    rechnungen = []
+    ohne_kondition = []
+    for kdnr, kunden_rows in kunden.items():
+        kunden_rows, abgerechnet, rechnung_nr = _trenne_abgerechnete(kunden_rows)
+        if not kunden_rows and rechnung_nr is None:
+            continue
+        if any(row[13] is None for row in kunden_rows):
+            ohne_kondition.append((kdnr, kunden_rows[0][1]))
+            continue
+        rechnung = _baue_rechnung(
+            (kunden_rows or abgerechnet)[0][1:8], [row[8:] for row in kunden_rows], rechnung_nr,
+            [(row[8].strftime("%d.%m.%y"), row[-2]) for row in abgerechnet]
+        )
+        rechnung["konditionen_stand"] = _konditionen_stand(konditionen.get(kdnr, []))
+        rechnungen.append((kdnr, rechnung))
+
+    return rechnungen, ohne_kondition
+
 # Funktionen für Rechnungs-Tracking
 def check_invoice_paid(rechnung_nr: str) -> bool:
     """Prüft, ob eine Rechnung bereits als bezahlt markiert wurde."""
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT bezahlt FROM rechnung WHERE rechnung_nr = %s;", (rechnung_nr,))
-    row = cur.fetchone()
-    cur.close()
-    conn.close()
+    with db_cursor() as cur:
+        cur.execute("SELECT bezahlt FROM rechnung WHERE rechnung_nr = %s;", (rechnung_nr,))
+        row = cur.fetchone()
     return row[0] if row else False
 
-def upsert_rechnung(rechnung: dict, kdnr: int):
-    """Speichert eine neue Rechnung oder überschreibt eine unbezahlte (Upsert)."""
-    conn = get_connection()
-    cur = conn.cursor()
+# --- Rechnungsnummern ---
+# Fortlaufender Nummernkreis pro Monat: YYMM-NNN (2511-001, 2511-002, ...).
+# Die Zählerzeile des Monats wird in derselben Transaktion hochgezählt, in der die Rechnungen
+# verbucht werden: Rollback gibt die Nummern wieder frei (keine Lücken), parallele Läufe
+# warten nur auf diese eine Zeile statt auf eine Tabellensperre.
+def reserviere_rechnungsnummern(cur, anzahl: int, datum=None) -> list:
+    """Reserviert anzahl aufeinanderfolgende Nummern mit einer einzigen Anweisung (Block)."""
+    if anzahl <= 0:
+        return []
+    monat = (datum or datetime.now()).strftime("%y%m")
+    cur.execute("""
+        INSERT INTO rechnungsnummer (monat, letzte_nr) VALUES (%s, %s)
+        ON CONFLICT (monat) DO UPDATE SET letzte_nr = rechnungsnummer.letzte_nr + EXCLUDED.letzte_nr
+        RETURNING letzte_nr;
+    """, (monat, anzahl))
+    letzte = cur.fetchone()[0]
+    return [f"{monat}-{nr:03d}" for nr in range(letzte - anzahl + 1, letzte + 1)]
+
+def naechste_rechnungsnummer(datum=None) -> str:
+    """Vorschau auf die nächste freie Nummer (ohne Reservierung, z.B. für den Dateinamen)."""
+    monat = (datum or datetime.now()).strftime("%y%m")
+    with db_cursor() as cur:
+        cur.execute("SELECT letzte_nr FROM rechnungsnummer WHERE monat = %s;", (monat,))
+        row = cur.fetchone()
+    return f"{monat}-{(row[0] if row else 0) + 1:03d}"
+
+# --- Rechnungsinhalt (JSONB) ---
+# Was das Template braucht, so wie es gerendert wurde; Geldbeträge als Text, damit sie exakt bleiben
+RECHNUNG_INHALT_FORMAT = 1
+_INHALT_FELDER = ("rechnung_nr", "datum", "frist", "kunde", "besuche", "fahrtkosten", "summe")
+_INHALT_DEZIMAL = {"summe", "preis_pro_einheit", "fahrtstrecke", "km_geld", "kosten"}
+_template_versionen = {}
+
+def template_version(template="rechnung.html") -> str:
+    """Kurze Prüfsumme des Template-Quelltexts (ändert sich mit jeder Layoutänderung)."""
+    pfad = os.path.join(BASE_DIR, "templates", template)
+    stand = os.stat(pfad).st_mtime_ns
+    if _template_versionen.get(template, (None,))[0] != stand:
+        with open(pfad, "rb") as f:
+            _template_versionen[template] = (stand, hashlib.sha256(f.read()).hexdigest()[:12])
+    return _template_versionen[template][1]
 
+def rechnung_inhalt(rechnung: dict, rechnung_nr=None, template="rechnung.html") -> dict:
+    """Rechnungsinhalt für die Spalte inhalt (ohne Verbuchungsdaten wie besuch_ids)."""
+    inhalt = {feld: rechnung.get(feld) for feld in _INHALT_FELDER}
+    inhalt["rechnung_nr"] = rechnung_nr or rechnung.get("rechnung_nr")
+    inhalt.update(format=RECHNUNG_INHALT_FORMAT, template=template, template_version=template_version(template))
+    return inhalt
+
+def _inhalt_json(inhalt: dict) -> str:
+    return json.dumps(inhalt, default=str, separators=(",", ":"), ensure_ascii=False)
+
+def _inhalt_laden(text: str) -> dict:
+    """Gegenstück zu _inhalt_json: Geldbeträge wieder als Decimal."""
+    def dezimal(obj):
+        for feld in _INHALT_DEZIMAL & obj.keys():
+            if isinstance(obj[feld], str):
+                obj[feld] = Decimal(obj[feld])
+        return obj
+    return json.loads(text, object_hook=dezimal)
+
+_UPSERT_RECHNUNG_SQL = """
+    INSERT INTO rechnung 
+    (rechnung_nr, kdnr, kondition_id, summe, preis_pro_einheit_snapshot, einheitsdauer_min_snapshot, fahrtstrecke_km_snapshot, km_geld_snapshot, bezahlt, inhalt)
+    VALUES %s
+    ON CONFLICT (rechnung_nr) DO UPDATE SET
+        summe = EXCLUDED.summe,
+        kondition_id = EXCLUDED.kondition_id,
+        preis_pro_einheit_snapshot = EXCLUDED.preis_pro_einheit_snapshot,
+        einheitsdauer_min_snapshot = EXCLUDED.einheitsdauer_min_snapshot,
+        fahrtstrecke_km_snapshot = EXCLUDED.fahrtstrecke_km_snapshot,
+        km_geld_snapshot = EXCLUDED.km_geld_snapshot,
+        inhalt = EXCLUDED.inhalt
+    RETURNING rechnung_id, rechnung_nr;
+"""
+
+def _rechnung_params(rechnung: dict, kdnr: int, rechnung_nr: str):
     # Snapshot-Daten sicher extrahieren (falls mal keine Besuche, aber Fahrtkosten da sind)
     preis = rechnung['besuche'][0]['preis_pro_einheit'] if rechnung['besuche'] else 0.0
     dauer = rechnung['besuche'][0]['einheitsdauer'] if rechnung['besuche'] else 0
     km = rechnung['fahrtkosten'][0]['fahrtstrecke'] if rechnung['fahrtkosten'] else 0.0
     geld = rechnung['fahrtkosten'][0]['km_geld'] if rechnung['fahrtkosten'] else 0.0
     kondition_id = rechnung.get('kondition_id')
+    inhalt = psycopg2.extras.Json(rechnung_inhalt(rechnung, rechnung_nr), dumps=_inhalt_json)
+    return (rechnung_nr, kdnr, kondition_id, rechnung['summe'], preis, dauer, km, geld, False, inhalt)
 
-    # ON CONFLICT nutzt deinen 'uk_rechnung_nr' Constraint!
-    cur.execute("""
-        INSERT INTO rechnung 
-        (rechnung_nr, kdnr, kondition_id, summe, preis_pro_einheit_snapshot, einheitsdauer_min_snapshot, fahrtstrecke_km_snapshot, km_geld_snapshot, bezahlt)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, false)
-        ON CONFLICT (rechnung_nr) DO UPDATE SET
-            summe = EXCLUDED.summe,
-            kondition_id = EXCLUDED.kondition_id,
-            preis_pro_einheit_snapshot = EXCLUDED.preis_pro_einheit_snapshot,
-            einheitsdauer_min_snapshot = EXCLUDED.einheitsdauer_min_snapshot,
-            fahrtstrecke_km_snapshot = EXCLUDED.fahrtstrecke_km_snapshot,
-            km_geld_snapshot = EXCLUDED.km_geld_snapshot;
-    """, (
-        rechnung['rechnung_nr'], kdnr, kondition_id, rechnung['summe'], preis, dauer, km, geld
-    ))
-    
-    conn.commit()
-    cur.close()
-    conn.close()
-
-def fetch_offene_rechnungen():
-    """Holt alle Rechnungen, die noch nicht bezahlt wurden."""
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT r.rechnung_nr, r.rechnungsdatum, k.name, r.summe 
-        FROM rechnung r
-        JOIN kunde k ON r.kdnr = k.kdnr
-        WHERE r.bezahlt = false
-        ORDER BY r.rechnungsdatum DESC;
-    """)
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
-    return [{"rechnung_nr": r[0], "datum": r[1].strftime("%d.%m.%Y"), "kunde": r[2], "summe": r[3]} for r in rows]
+def upsert_rechnung(rechnung: dict, kdnr: int) -> str:
+    """Speichert eine neue Rechnung oder überschreibt eine unbezahlte (Upsert). Gibt die Rechnungsnummer zurück."""
+    return upsert_rechnungen([(rechnung, kdnr)])[0]
+
+def upsert_rechnungen(rechnungen: list) -> list:
+    """
+    Upsert für viele Rechnungen in EINER Transaktion (Sammellauf).
+    rechnungen: Liste von (rechnung_dict, kdnr)
+    Neue Rechnungen (rechnung_nr None) bekommen ihre Nummer hier aus einem gemeinsam
+    reservierten Block; sie wird in rechnung['rechnung_nr'] eingetragen.
+    Gibt die Rechnungsnummern in der Reihenfolge der Eingabe zurück.
+    Haben sich die Konditionen eines Kunden seit der Berechnung geändert, wird nichts verbucht.
+    """
+    if not rechnungen:
+        return []
+    with db_cursor() as cur:
+        _pruefe_konditionen(cur, rechnungen)
+        neue = [i for i, (rechnung, _) in enumerate(rechnungen) if not rechnung.get('rechnung_nr')]
+        nummern = [rechnung.get('rechnung_nr') for rechnung, _ in rechnungen]
+        for i, nr in zip(neue, reserviere_rechnungsnummern(cur, len(neue))):
+            nummern[i] = nr
+
+        # ON CONFLICT nutzt deinen 'uk_rechnung_nr' Constraint!
+        ids = dict((nr, rid) for rid, nr in psycopg2.extras.execute_values(
+            cur, _UPSERT_RECHNUNG_SQL,
+            [_rechnung_params(rechnung, kdnr, nr) for (rechnung, kdnr), nr in zip(rechnungen, nummern)],
+            fetch=True
+        ))
+        _verknuepfe_besuche(cur, [(ids[nr], rechnung.get('besuch_ids', [])) for (rechnung, _), nr in zip(rechnungen, nummern)])
+
+    # Erst nach dem Commit eintragen: nach einem Rollback sind die Nummern wieder frei
+    for (rechnung, _), nr in zip(rechnungen, nummern):
+        rechnung['rechnung_nr'] = nr
+    return nummern
+
+def _pruefe_konditionen(cur, rechnungen: list):
+    """
+    Vergleicht die Konditionen, mit denen gerechnet wurde (rechnung['konditionen_stand']), mit dem
+    aktuellen Stand und sperrt sie bis zum Commit (FOR SHARE); bei einer Änderung RuntimeError.
+    """
+    geprueft = [(rechnung, kdnr) for rechnung, kdnr in rechnungen if "konditionen_stand" in rechnung]
+    if not geprueft:
+        return
+    aktuell = _lies_konditionen(cur, {kdnr for _, kdnr in geprueft}, sperren=True)
+    geaendert = sorted({
+        kdnr for rechnung, kdnr in geprueft
+        if _konditionen_stand(aktuell.get(kdnr, [])) != rechnung["konditionen_stand"]
+    })
+    if geaendert:
+        raise RuntimeError(f"Die Konditionen von Kunde {', '.join(map(str, geaendert))} wurden seit der "
+                           "Berechnung geändert. Bitte die Rechnung neu erstellen.")
+
+def _verknuepfe_besuche(cur, zuordnung: list):
+    """
+    Markiert die Besuche als abgerechnet. zuordnung: [(rechnung_id, [besuch_id, ...])].
+    Besuche, die bei einer Neuerstellung nicht mehr in der Rechnung stehen, werden wieder frei.
+    Der Trigger trg_besuch_abrechnung bricht ab, falls ein Besuch schon zu einer anderen Rechnung gehört.
+    """
+    rechnung_ids = [rid for rid, _ in zuordnung]
+    paare = [(bid, rid) for rid, besuch_ids in zuordnung for bid in besuch_ids]
+    cur.execute(
+        "UPDATE besuch SET rechnung_id = NULL WHERE rechnung_id = ANY(%s) AND NOT (besuch_id = ANY(%s));",
+        (rechnung_ids, [bid for bid, _ in paare])
+    )
+    if paare:
+        psycopg2.extras.execute_values(cur, """
+            UPDATE besuch b SET rechnung_id = v.rechnung_id
+            FROM (VALUES %s) AS v (besuch_id, rechnung_id)
+            WHERE b.besuch_id = v.besuch_id AND b.rechnung_id IS DISTINCT FROM v.rechnung_id;
+        """, paare)
+
+def fetch_rechnung_inhalt(rechnung_nr: str):
+    """
+    Gespeicherter Rechnungsinhalt (eine Zeile, keine Besuche/Konditionen) für Nachdruck und
+    Gutschrift, ergänzt um 'bezahlt'. None, wenn es die Rechnung nicht gibt oder ihr Inhalt fehlt.
+    """
+    with db_cursor() as cur:
+        cur.execute("SELECT inhalt::text, bezahlt FROM rechnung WHERE rechnung_nr = %s;", (rechnung_nr,))
+        row = cur.fetchone()
+    if row is None or row[0] is None:
+        return None
+    return dict(_inhalt_laden(row[0]), bezahlt=row[1])
+
+def fetch_bezahlte_rechnungsnummern(rechnung_nrn: list) -> set:
+    """Liefert die Teilmenge der übergebenen Rechnungsnummern, die bereits bezahlt sind."""
+    if not rechnung_nrn:
+        return set()
+    with db_cursor() as cur:
+        cur.execute("SELECT rechnung_nr FROM rechnung WHERE bezahlt = true AND rechnung_nr = ANY(%s);", (list(rechnung_nrn),))
+        return {row[0] for row in cur.fetchall()}
+
+def _offene_rechnung(row) -> dict:
+    rechnung_nr, rechnungsdatum, name, summe = row[:4]
+    return {"rechnung_nr": rechnung_nr, "rechnungsdatum": rechnungsdatum, "datum": rechnungsdatum.strftime("%d.%m.%Y"),
+            "kunde": name, "summe": summe}
+
+def fetch_offene_rechnungen(nach=None, limit=None):
+    """
+    Holt die Rechnungen, die noch nicht bezahlt wurden, neueste zuerst.
+    Seitenweise: nach = (rechnungsdatum, rechnung_nr) der letzten bereits geladenen Zeile,
+    limit = Seitengröße (Keyset über ix_rechnung_offen, kein OFFSET).
+    """
+    bedingung, params = "", []
+    if nach is not None:
+        bedingung = "AND (r.rechnungsdatum, r.rechnung_nr) < (%s, %s)"
+        params.extend(nach)
+    params.append(limit)
+    with db_cursor() as cur:
+        cur.execute(f"""
+            SELECT r.rechnung_nr, r.rechnungsdatum, k.name, r.summe
+            FROM rechnung r
+            JOIN kunde k ON r.kdnr = k.kdnr
+            WHERE r.bezahlt = false {bedingung}
+            ORDER BY r.rechnungsdatum DESC, r.rechnung_nr DESC
+            LIMIT %s;
+        """, params)
+        rows = cur.fetchall()
+    return [_offene_rechnung(r) for r in rows]
+
+# Änderungen werden mit etwas Überlappung abgeholt: Eine Transaktion, die vor dem letzten Abruf
+# geschrieben, aber erst danach committet hat, trägt einen älteren Zeitstempel als das Wasserzeichen.
+# Doppelt gelieferte Zeilen sind harmlos, die Liste übernimmt nur echte Unterschiede.
+_AENDERUNG_UEBERLAPPUNG = timedelta(minutes=2)
+
+def fetch_rechnungsaenderungen(stand=None):
+    """
+    Rechnungen, die sich seit stand (Wasserzeichen aus dem letzten Aufruf) geändert haben,
+    über ix_rechnung_geaendert. Gibt (zeilen, neuer_stand) zurück; jede Zeile hat zusätzlich
+    'bezahlt' (bezahlte Rechnungen verschwinden aus der Liste). Ohne stand nur das aktuelle Wasserzeichen.
+    """
+    with db_cursor() as cur:
+        cur.execute("SELECT COALESCE(max(geaendert_am), now()) FROM rechnung;")
+        neuer_stand = cur.fetchone()[0]
+        if stand is None:
+            return [], neuer_stand
+        cur.execute("""
+            SELECT r.rechnung_nr, r.rechnungsdatum, k.name, r.summe, r.bezahlt
+            FROM rechnung r
+            JOIN kunde k ON r.kdnr = k.kdnr
+            WHERE r.geaendert_am > %s
+            ORDER BY r.geaendert_am;
+        """, (stand - _AENDERUNG_UEBERLAPPUNG,))
+        rows = cur.fetchall()
+    return [dict(_offene_rechnung(r), bezahlt=r[4]) for r in rows], neuer_stand
 
 def mark_rechnung_bezahlt(rechnung_nr: str):
     """Markiert eine Rechnung in der Datenbank als bezahlt."""
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("UPDATE rechnung SET bezahlt = true WHERE rechnung_nr = %s;", (rechnung_nr,))
-    conn.commit()
-    cur.close()
-    conn.close()
+    with db_cursor() as cur:
+        cur.execute("UPDATE rechnung SET bezahlt = true WHERE rechnung_nr = %s;", (rechnung_nr,))
+
+# --- PDF-Archiv ---
+def archiviere_pdf(rechnung_nr: str, sha256: str, groesse: int) -> bool:
+    """
+    Verknüpft eine im Archiv abgelegte PDF-Datei mit der Rechnung. Gibt False zurück, wenn genau
+    diese Datei schon verknüpft war. Der Trigger trg_rechnung_pdf_schuetzen bricht ab, wenn eine
+    bezahlte Rechnung bereits ein archiviertes PDF hat.
+    """
+    with db_cursor() as cur:
+        cur.execute("""
+            INSERT INTO rechnung_pdf (rechnung_id, sha256, groesse)
+            SELECT rechnung_id, %s, %s FROM rechnung WHERE rechnung_nr = %s
+            ON CONFLICT ON CONSTRAINT uk_rechnung_pdf DO NOTHING
+            RETURNING pdf_id;
+        """, (sha256, groesse, rechnung_nr))
+        neu = cur.fetchone() is not None
+        if not neu:
+            cur.execute("SELECT 1 FROM rechnung WHERE rechnung_nr = %s;", (rechnung_nr,))
+            if cur.fetchone() is None:
+                raise ValueError(f"Rechnung {rechnung_nr} gibt es nicht.")
+    return neu
+
+def fetch_archiv_pdf(rechnung_nr: str):
+    """(sha256, groesse) der jüngsten archivierten Fassung einer Rechnung oder None."""
+    with db_cursor() as cur:
+        cur.execute("""
+            SELECT p.sha256, p.groesse
+            FROM rechnung r
+            JOIN rechnung_pdf p ON p.rechnung_id = r.rechnung_id
+            WHERE r.rechnung_nr = %s
+            ORDER BY p.erstellt_am DESC, p.pdf_id DESC
+            LIMIT 1;
+        """, (rechnung_nr,))
+        return cur.fetchone()
+
+def fetch_archiv_dateien() -> list:
+    """Alle Archiveinträge als [(rechnung_nr, sha256, groesse)] für die Prüfung des Archivordners."""
+    with db_cursor() as cur:
+        cur.execute("""
+            SELECT r.rechnung_nr, p.sha256, p.groesse
+            FROM rechnung_pdf p
+            JOIN rechnung r ON r.rechnung_id = p.rechnung_id
+            ORDER BY r.rechnung_nr, p.erstellt_am;
+        """)
+        return cur.fetchall()
+
+def _like_muster(wort: str) -> str:
+    return wort.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def fetch_archiv(suche=None, bezahlt=None, von=None, bis=None, limit=500) -> list:
+    """
+    Rechnungsindex für das Archiv, neueste zuerst: Rechnungen mit Kunde, Status und der
+    jüngsten archivierten Fassung (sha256 oder None).
+    suche: Wörter, die jeweils auf Rechnungsnummer (Anfang), Kundennummer oder Name/Kürzel/Ort
+    (über ix_kunde_suche) passen müssen; bezahlt: True/False/None; von/bis: Rechnungsdatum.
+    """
+    bedingungen, params = [], []
+    for wort in (suche or "").lower().split():
+        bedingungen.append(
+            "(r.rechnung_nr LIKE %s OR k.kdnr::text = %s OR kunde_suchtext(k.name, k.kuerzel, k.ort) ILIKE %s)"
+        )
+        params.extend([_like_muster(wort) + "%", wort, f"%{_like_muster(wort)}%"])
+    if bezahlt is not None:
+        bedingungen.append("r.bezahlt = %s")
+        params.append(bezahlt)
+    if von:
+        bedingungen.append("r.rechnungsdatum >= %s")
+        params.append(von)
+    if bis:
+        bedingungen.append("r.rechnungsdatum <= %s")
+        params.append(bis)
+    params.append(limit)
+    with db_cursor() as cur:
+        cur.execute(f"""
+            SELECT r.rechnung_nr, r.rechnungsdatum, k.name, r.summe, r.bezahlt, p.sha256
+            FROM rechnung r
+            JOIN kunde k ON r.kdnr = k.kdnr
+            LEFT JOIN LATERAL (
+                SELECT sha256 FROM rechnung_pdf
+                WHERE rechnung_id = r.rechnung_id
+                ORDER BY erstellt_am DESC, pdf_id DESC
+                LIMIT 1
+            ) p ON true
+            WHERE {" AND ".join(bedingungen) or "true"}
+            ORDER BY r.rechnungsdatum DESC, r.rechnung_nr DESC
+            LIMIT %s;
+        """, params)
+        rows = cur.fetchall()
+    return [dict(_offene_rechnung(r), bezahlt=r[4], sha256=r[5]) for r in rows]
+
+# --- Mahnwesen ---
+def _rechnungen_aus_besuchen(cur, rechnungen) -> dict:
+    """
+    Baut den Inhalt älterer Rechnungen ohne gespeicherten Inhalt aus den verknüpften Besuchen und
+    den damals gültigen Konditionen wieder auf; Datum und Summe kommen aus der verbuchten Zeile.
+    rechnungen: [(rechnung_id, rechnung_nr, kdnr, rechnungsdatum, summe)]. Gibt {rechnung_id: rechnung} zurück.
+    """
+    if not rechnungen:
+        return {}
+    cur.execute("""
+        SELECT rechnung_id, besuch_id, termin, anzahl_einheiten, bemerkung
+        FROM besuch
+        WHERE rechnung_id = ANY(%s)
+        ORDER BY rechnung_id, termin;
+    """, ([row[0] for row in rechnungen],))
+    besuche = {}
+    for row in cur.fetchall():
+        besuche.setdefault(row[0], []).append(row[1:])
+
+    kdnrs = {row[2] for row in rechnungen}
+    kunden = _lies_kunden(cur, kdnrs)
+    alle_konditionen = _lies_konditionen(cur, kdnrs)
+    zahlungsziel = timedelta(days=get_section("mahnung").getint("zahlungsziel_tage", 14))
+    ergebnis = {}
+    for rechnung_id, rechnung_nr, kdnr, rechnungsdatum, summe in rechnungen:
+        konditionen = alle_konditionen.get(kdnr, [])
+        besuche_rows = [
+            (termin, einheiten, bemerkung, k["preis_pro_einheit"], k["einheitsdauer_min"],
+             k["kondition_id"], k["fahrtstrecke_km"], k["km_geld"], besuch_id)
+            for besuch_id, termin, einheiten, bemerkung in besuche.get(rechnung_id, [])
+            for k in konditionen
+            if _kondition_gilt(k, termin)
+        ]
+        rechnung = _baue_rechnung(kunden.get(kdnr), besuche_rows, rechnung_nr)
+        # Verbuchte Werte haben Vorrang vor der Neuberechnung
+        rechnung["summe_berechnet"] = rechnung["summe"]
+        rechnung["datum"] = rechnungsdatum.strftime("%d.%m.%Y")
+        rechnung["frist"] = (rechnungsdatum + zahlungsziel).strftime("%d.%m.%Y")
+        rechnung["summe"] = summe
+        ergebnis[rechnung_id] = rechnung
+    return ergebnis
+
+def _nicht_rekonstruierbar(rechnung: dict):
+    """Grund, warum ein rekonstruierter Inhalt nicht gespeichert werden darf, sonst None."""
+    if not rechnung["besuch_ids"]:
+        # z.B. Rechnungen von vor 0004: besuch.rechnung_id wurde nie nachgetragen
+        return "keine verknüpften Besuche"
+    berechnet, verbucht = rechnung["summe_berechnet"], rechnung["summe"]
+    if berechnet is None or verbucht is None or Decimal(berechnet).quantize(Decimal("0.01")) != verbucht:
+        return f"Besuche ergeben {berechnet}, verbucht sind {verbucht}"
+    return None
+
+def ergaenze_rechnungsinhalte(stapel=500) -> dict:
+    """
+    Trägt den Inhalt für ältere Rechnungen ohne gespeicherten Inhalt nach (aus Besuchen und
+    Konditionen rekonstruiert, einmalig). Bei bezahlten Rechnungen ist der nachgetragene Inhalt
+    endgültig (trg_rechnung_bezahlt_schuetzen); Rechnungen ohne verknüpfte Besuche oder mit
+    abweichender Summe werden daher nicht ergänzt, sondern gemeldet.
+    Gibt {'ergaenzt': anzahl, 'uebersprungen': [(rechnung_nr, grund)]} zurück.
+    """
+    ergebnis = {"ergaenzt": 0, "uebersprungen": []}
+    letzte_id = 0
+    while True:
+        with db_cursor() as cur:
+            cur.execute("""
+                SELECT rechnung_id, rechnung_nr, kdnr, rechnungsdatum, summe
+                FROM rechnung
+                WHERE inhalt IS NULL AND rechnung_id > %s
+                ORDER BY rechnung_id
+                LIMIT %s;
+            """, (letzte_id, stapel))
+            rechnungen = cur.fetchall()
+            if not rechnungen:
+                return ergebnis
+            letzte_id = rechnungen[-1][0]
+            inhalte = []
+            for rid, rechnung in _rechnungen_aus_besuchen(cur, rechnungen).items():
+                grund = _nicht_rekonstruierbar(rechnung)
+                if grund:
+                    ergebnis["uebersprungen"].append((rechnung["rechnung_nr"], grund))
+                else:
+                    inhalte.append((rid, _inhalt_json(rechnung_inhalt(rechnung))))
+            if inhalte:
+                psycopg2.extras.execute_values(cur, """
+                    UPDATE rechnung r SET inhalt = v.inhalt::jsonb
+                    FROM (VALUES %s) AS v (rechnung_id, inhalt)
+                    WHERE r.rechnung_id = v.rechnung_id AND r.inhalt IS NULL;
+                """, inhalte)
+        ergebnis["ergaenzt"] += len(inhalte)
+
+def fetch_mahnkandidaten(faellig_bis, gemahnt_bis):
+    """
+    Alle unbezahlten Rechnungen, die eine (weitere) Mahnung bekommen, in einer Abfrage
+    über ix_rechnung_offen:
+      - Stufe 1: noch nicht gemahnt und rechnungsdatum <= faellig_bis
+      - Stufe 2: Stufe 1 liegt mindestens bis gemahnt_bis zurück
+    Der Rechnungsinhalt kommt aus der Spalte inhalt; nur bei älteren Rechnungen ohne Inhalt wird
+    er aus den verknüpften Besuchen wieder aufgebaut.
+    Gibt eine Liste von dicts mit rechnung_id, stufe, gemahnt_am, rechnungsdatum und rechnung zurück.
+    """
+    with db_cursor() as cur:
+        cur.execute("""
+            SELECT rechnung_id, rechnung_nr, kdnr, rechnungsdatum, summe, mahnstufe, gemahnt_am, inhalt::text
+            FROM rechnung
+            WHERE bezahlt = false
+              AND rechnungsdatum <= %s
+              AND mahnstufe < 2
+              AND (gemahnt_am IS NULL OR gemahnt_am <= %s)
+            ORDER BY rechnungsdatum, rechnung_nr;
+        """, (faellig_bis, gemahnt_bis))
+        rechnungen = cur.fetchall()
+        if not rechnungen:
+            return []
+        neu_aufbauen = _rechnungen_aus_besuchen(cur, [row[:5] for row in rechnungen if row[7] is None])
+
+    kandidaten = []
+    for rechnung_id, rechnung_nr, kdnr, rechnungsdatum, summe, mahnstufe, gemahnt_am, inhalt in rechnungen:
+        rechnung = _inhalt_laden(inhalt) if inhalt is not None else neu_aufbauen[rechnung_id]
+        kandidaten.append({
+            "rechnung_id": rechnung_id,
+            "stufe": mahnstufe + 1,
+            "gemahnt_am": gemahnt_am,
+            "rechnungsdatum": rechnungsdatum,
+            "rechnung": rechnung
+        })
+    return kandidaten
+
+def verbuche_mahnungen(mahnungen: list):
+    """
+    Hält versendete Mahnungen fest. mahnungen: [(rechnung_id, stufe, datum, frist)].
+    Eine Stufe wird pro Rechnung nur einmal gezählt (uk_mahnung_stufe).
+    """
+    if not mahnungen:
+        return
+    with db_cursor() as cur:
+        psycopg2.extras.execute_values(cur, """
+            INSERT INTO mahnung (rechnung_id, stufe, datum, frist) VALUES %s
+            ON CONFLICT (rechnung_id, stufe) DO NOTHING;
+        """, mahnungen)
+        psycopg2.extras.execute_values(cur, """
+            UPDATE rechnung r SET mahnstufe = v.stufe, gemahnt_am = v.datum
+            FROM (VALUES %s) AS v (rechnung_id, stufe, datum)
+            WHERE r.rechnung_id = v.rechnung_id AND r.mahnstufe < v.stufe;
+        """, [(rechnung_id, stufe, datum) for rechnung_id, stufe, datum, _ in mahnungen])
+
+# --- Offene Posten, Zahlungen und Verzug ---
+def fetch_basiszinssaetze() -> list:
+    """[(gueltig_ab, satz)] aufsteigend nach Datum."""
+    with db_cursor() as cur:
+        cur.execute("SELECT gueltig_ab, satz FROM basiszins ORDER BY gueltig_ab;")
+        return cur.fetchall()
+
+def fetch_offene_posten():
+    """
+    Alle unbezahlten Rechnungen samt Teilzahlungen und Mahnungen in drei Abfragen.
+    Gibt (rechnungen, zahlungen, mahnungen) zurück:
+      rechnungen: [(rechnung_id, rechnung_nr, kdnr, kunde, rechnungsdatum, summe)]
+      zahlungen:  {rechnung_id: [(datum, betrag)]}
+      mahnungen:  {rechnung_id: [(stufe, datum)]}
+    """
+    with db_cursor() as cur:
+        cur.execute("""
+            SELECT r.rechnung_id, r.rechnung_nr, r.kdnr, k.name, r.rechnungsdatum, r.summe
+            FROM rechnung r
+            JOIN kunde k ON k.kdnr = r.kdnr
+            WHERE r.bezahlt = false
+            ORDER BY r.rechnungsdatum, r.rechnung_nr;
+        """)
+        rechnungen = cur.fetchall()
+        ids = [row[0] for row in rechnungen]
+
+        zahlungen, mahnungen = {}, {}
+        if ids:
+            cur.execute("SELECT rechnung_id, datum, betrag FROM zahlung WHERE rechnung_id = ANY(%s) ORDER BY datum;", (ids,))
+            for rechnung_id, datum, betrag in cur.fetchall():
+                zahlungen.setdefault(rechnung_id, []).append((datum, betrag))
+            cur.execute("SELECT rechnung_id, stufe, datum FROM mahnung WHERE rechnung_id = ANY(%s) ORDER BY datum;", (ids,))
+            for rechnung_id, stufe, datum in cur.fetchall():
+                mahnungen.setdefault(rechnung_id, []).append((stufe, datum))
+    return rechnungen, zahlungen, mahnungen
+
+def erfasse_zahlung(rechnung_nr: str, betrag, datum=None) -> bool:
+    """
+    Verbucht einen (Teil-)Zahlungseingang. Ist die Rechnungssumme damit beglichen,
+    wird die Rechnung als bezahlt markiert. Gibt zurück, ob sie jetzt bezahlt ist.
+    """
+    with db_cursor() as cur:
+        cur.execute("SELECT rechnung_id, summe FROM rechnung WHERE rechnung_nr = %s FOR UPDATE;", (rechnung_nr,))
+        row = cur.fetchone()
+        if row is None:
+            raise ValueError(f"Rechnung {rechnung_nr} nicht gefunden.")
+        rechnung_id, summe = row
+        cur.execute(
+            "INSERT INTO zahlung (rechnung_id, datum, betrag) VALUES (%s, COALESCE(%s, CURRENT_DATE), %s);",
+            (rechnung_id, datum, betrag)
+        )
+        cur.execute("SELECT sum(betrag) FROM zahlung WHERE rechnung_id = %s;", (rechnung_id,))
+        gezahlt = cur.fetchone()[0]
+        bezahlt = summe is not None and gezahlt >= summe
+        if bezahlt:
+            cur.execute("UPDATE rechnung SET bezahlt = true WHERE rechnung_id = %s;", (rechnung_id,))
+    return bezahlt
 
 # Kunden- und Konditionsverwaltung
 
 def fetch_kunde_details(kdnr: int):
-    """Holt Stammdaten und die aktuell gültigen Konditionen eines Kunden."""
-    conn = get_connection()
-    cur = conn.cursor()
-    
-    # JOIN mit kondition, aber NUR die aktuell gültige (gueltig_bis IS NULL)
-    cur.execute("""
-        SELECT k.name, k.kuerzel, k.ansprechpartner, k.strasse, k.hausnummer, k.plz, k.ort,
-               c.preis_pro_einheit, c.einheitsdauer_min, c.fahrtstrecke_km, c.km_geld, c.gueltig_von
-        FROM kunde k
-        LEFT JOIN kondition c ON k.kdnr = c.kdnr AND c.gueltig_bis IS NULL
-        WHERE k.kdnr = %s;
-    """, (kdnr,))
-    
-    row = cur.fetchone()
-    cur.close()
-    conn.close()
-    
-    if not row:
+    """Holt Stammdaten und die aktuell gültigen Konditionen eines Kunden (aus dem Cache)."""
+    kunde = _kunde(kdnr)
+    if not kunde:
         return None
-        
+
+    # NUR die aktuell gültige Kondition (gueltig_bis IS NULL)
+    aktuell = next((k for k in _konditionen(kdnr) if k["gueltig_bis"] is None), {})
+    name, strasse, hausnummer, plz, ort, ansprechpartner, kuerzel = kunde
+
     return {
-        "name": row[0] or "", "kuerzel": row[1] or "", "ansprechpartner": row[2] or "", 
-        "strasse": row[3] or "", "hausnummer": row[4] or "", "plz": row[5] or "", "ort": row[6] or "",
-        "preis": row[7] if row[7] is not None else 0.0,
-        "dauer": row[8] if row[8] is not None else 0,
-        "strecke": row[9] if row[9] is not None else 0.0,
-        "km_geld": row[10] if row[10] is not None else 0.0,
-        "gueltig_von": row[11].strftime("%d.%m.%Y") if len(row) > 11 and row[11] is not None else "Unbekannt"
+        "name": name or "", "kuerzel": kuerzel or "", "ansprechpartner": ansprechpartner or "", 
+        "strasse": strasse or "", "hausnummer": hausnummer or "", "plz": plz or "", "ort": ort or "",
+        "preis": aktuell.get("preis_pro_einheit") if aktuell.get("preis_pro_einheit") is not None else 0.0,
+        "dauer": aktuell.get("einheitsdauer_min") if aktuell.get("einheitsdauer_min") is not None else 0,
+        "strecke": aktuell.get("fahrtstrecke_km") if aktuell.get("fahrtstrecke_km") is not None else 0.0,
+        "km_geld": aktuell.get("km_geld") if aktuell.get("km_geld") is not None else 0.0,
+        "gueltig_von": aktuell["gueltig_von"].strftime("%d.%m.%Y") if aktuell.get("gueltig_von") is not None else "Unbekannt",
+        "gueltig_von_datum": aktuell.get("gueltig_von")
     }
 
 def update_kunde_stammdaten(kdnr: int, daten: dict):
     """Aktualisiert die reinen Stammdaten eines Kunden."""
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        UPDATE kunde 
-        SET name = %s, kuerzel = %s, ansprechpartner = %s, strasse = %s, hausnummer = %s, plz = %s, ort = %s
-        WHERE kdnr = %s;
-    """, (
-        daten['name'], daten['kuerzel'], daten['ansprechpartner'] or None, 
-        daten['strasse'], daten['hausnummer'], daten['plz'], daten['ort'], kdnr
-    ))
-    conn.commit()
-    cur.close()
-    conn.close()
+    with db_cursor() as cur:
+        cur.execute("""
+            UPDATE kunde 
+            SET name = %s, kuerzel = %s, ansprechpartner = %s, strasse = %s, hausnummer = %s, plz = %s, ort = %s
+            WHERE kdnr = %s;
+        """, (
+            daten['name'], daten['kuerzel'], daten['ansprechpartner'] or None, 
+            daten['strasse'], daten['hausnummer'], daten['plz'], daten['ort'], kdnr
+        ))
+        _benachrichtigen(cur, kdnr)
+    invalidate_cache()
+
+def konditionen_datum_fehler(gueltig_von) -> str:
+    return (f"Die neuen Konditionen müssen nach dem Beginn der aktuellen ({gueltig_von:%d.%m.%Y}) gelten.\n"
+            "Zum Berichtigen der aktuellen Konditionen bitte 'Tippfehler' wählen.")
 
 def update_kunde_konditionen(kdnr: int, preis: float, dauer: int, strecke: float, km_geld: float, gueltig_ab_str: str):
-    """Versioniert die Konditionen: Beendet alte Kondition und legt neue an."""
-    conn = get_connection()
-    cur = conn.cursor()
-    
+    """
+    Versioniert die Konditionen: Beendet alte Kondition und legt neue an.
+    Die neue Kondition muss nach dem Beginn der aktuellen gelten, sonst ValueError.
+    """
     gueltig_ab = datetime.strptime(gueltig_ab_str, "%Y-%m-%d").date()
     gueltig_bis_alt = gueltig_ab - timedelta(days=1)
     
-    # 1. Prüfen, ob es eine aktive Kondition gibt
-    cur.execute("SELECT kondition_id FROM kondition WHERE kdnr = %s AND gueltig_bis IS NULL;", (kdnr,))
-    aktive_kondition = cur.fetchone()
-    
-    # 2. Falls ja, beenden wir sie am Tag VOR dem neuen Startdatum
-    if aktive_kondition:
-        cur.execute("UPDATE kondition SET gueltig_bis = %s WHERE kondition_id = %s;", (gueltig_bis_alt, aktive_kondition[0]))
+    with db_cursor() as cur:
+        # 1. Prüfen, ob es eine aktive Kondition gibt (gesperrt bis zum Commit)
+        cur.execute("SELECT kondition_id, gueltig_von FROM kondition WHERE kdnr = %s AND gueltig_bis IS NULL FOR UPDATE;", (kdnr,))
+        aktive_kondition = cur.fetchone()
+        # Sonst ergäbe sich ein leerer Zeitraum (gueltig_bis < gueltig_von) bzw. eine Überschneidung
+        if aktive_kondition and gueltig_ab <= aktive_kondition[1]:
+            raise ValueError(konditionen_datum_fehler(aktive_kondition[1]))
         
-    # 3. Neue Kondition anlegen
-    cur.execute("""
-        INSERT INTO kondition (kdnr, gueltig_von, preis_pro_einheit, einheitsdauer_min, fahrtstrecke_km, km_geld)
-        VALUES (%s, %s, %s, %s, %s, %s);
-    """, (kdnr, gueltig_ab, preis, dauer, strecke, km_geld))
-    
-    conn.commit()
-    cur.close()
-    conn.close()
+        # 2. Falls ja, beenden wir sie am Tag VOR dem neuen Startdatum
+        if aktive_kondition:
+            cur.execute("UPDATE kondition SET gueltig_bis = %s WHERE kondition_id = %s;", (gueltig_bis_alt, aktive_kondition[0]))
+            
+        # 3. Neue Kondition anlegen
+        cur.execute("""
+            INSERT INTO kondition (kdnr, gueltig_von, preis_pro_einheit, einheitsdauer_min, fahrtstrecke_km, km_geld)
+            VALUES (%s, %s, %s, %s, %s, %s);
+        """, (kdnr, gueltig_ab, preis, dauer, strecke, km_geld))
+        _benachrichtigen(cur, kdnr)
+    invalidate_cache()
 
 def correct_kunde_konditionen(kdnr: int, preis: float, dauer: int, strecke: float, km_geld: float):
     """Überschreibt die aktuell gültige Kondition (nur für Tippfehler, keine Historisierung)."""
-    conn = get_connection()
-    cur = conn.cursor()
-    
-    cur.execute("""
-        UPDATE kondition 
-        SET preis_pro_einheit = %s, einheitsdauer_min = %s, fahrtstrecke_km = %s, km_geld = %s
-        WHERE kdnr = %s AND gueltig_bis IS NULL;
-    """, (preis, dauer, strecke, km_geld, kdnr))
-    
-    conn.commit()
-    cur.close()
-    conn.close()
+    with db_cursor() as cur:
+        cur.execute("""
+            UPDATE kondition 
+            SET preis_pro_einheit = %s, einheitsdauer_min = %s, fahrtstrecke_km = %s, km_geld = %s
+            WHERE kdnr = %s AND gueltig_bis IS NULL;
+        """, (preis, dauer, strecke, km_geld, kdnr))
+        _benachrichtigen(cur, kdnr)
+    invalidate_cache()
 
 
 # --- Test ---
@@ -1,9 +1,15 @@
-from jinja2 import Environment, FileSystemLoader
-from weasyprint import HTML, CSS
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+from weasyprint import HTML, CSS, __version__ as WEASYPRINT_VERSION
 from weasyprint.text.fonts import FontConfiguration
 import psycopg2
 from datetime import datetime, timedelta
+import hashlib
+import json
+import os
 import sys
+import tempfile
+import threading
+from app_config import BASE_DIR, get_section
 
 #if len(sys.argv) == 4:
 #    kdnr = sys.argv[1]
@@ -77,19 +83,224 @@ import sys
 
 
 
+# --- Template-Umgebung ---
+# Wird einmal pro Prozess aufgebaut; Jinja hält kompilierte Templates im Speicher,
+# der Bytecode-Cache spart das Parsen zusätzlich beim nächsten Programmstart.
+TEMPLATE_DIR = os.path.join(BASE_DIR, "templates")
+TEMPLATE_CACHE_DIR = os.path.join(BASE_DIR, ".template_cache")
+RENDER_CACHE_DIR = os.path.join(BASE_DIR, ".render_cache")
+
+_env = None
+_env_lock = threading.Lock()
+
+def get_template_env() -> Environment:
+    """Liefert die gemeinsame Jinja2-Umgebung (lazy aufgebaut, an den Projektordner gebunden)."""
+    global _env
+    if _env is None:
+        with _env_lock:
+            if _env is None:
+                cfg = get_section("templates")
+                os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+                _env = Environment(
+                    loader=FileSystemLoader(TEMPLATE_DIR),
+                    bytecode_cache=FileSystemBytecodeCache(TEMPLATE_CACHE_DIR),
+                    # Entwicklung: geänderte Templates ohne Neustart neu laden
+                    auto_reload=cfg.getboolean("auto_reload", False),
+                    cache_size=-1
+                )
+    return _env
+
+def get_template(name: str):
+    return get_template_env().get_template(name)
+
+_vorlagen_stand = (None, None)  # (Dateiliste mit mtime/Größe, Hash)
+
+def vorlagen_hash() -> str:
+    """
+    Hash über alle Dateien im Template-Ordner: eingebundene und erweiterte Templates ebenso wie
+    dort abgelegte Bilder oder Stylesheets. Neu berechnet nur, wenn sich eine Datei geändert hat.
+    """
+    global _vorlagen_stand
+    dateien = []
+    for ordner, _, namen in os.walk(TEMPLATE_DIR):
+        for name in namen:
+            pfad = os.path.join(ordner, name)
+            st = os.stat(pfad)
+            dateien.append((os.path.relpath(pfad, TEMPLATE_DIR), st.st_mtime_ns, st.st_size))
+    dateien.sort()
+    signatur, wert = _vorlagen_stand
+    if signatur == dateien:
+        return wert
+    h = hashlib.sha256()
+    for name, _, _ in dateien:
+        h.update(name.encode("utf-8"))
+        h.update(b"\0")
+        with open(os.path.join(TEMPLATE_DIR, name), "rb") as f:
+            h.update(f.read())
+        h.update(b"\0")
+    wert = h.hexdigest()
+    _vorlagen_stand = (dateien, wert)
+    return wert
+
+# --- PDF-Renderer ---
+# Standardwerte entsprechen dem bisherigen, fest eingebauten Seitenlayout
+STANDARD_FUSSZEILE = "Dipl.-Psych. Katharina Kunisch M.A., Triodos Bank, DE67 5003 1000 1086 3140 09; BIC TRODDEF1"
+
+def pdf_datum(rechnung: dict):
+    """Erstellungsdatum für die PDF-Metadaten: das Rechnungsdatum statt der aktuellen Uhrzeit."""
+    try:
+        return datetime.strptime(rechnung["datum"], "%d.%m.%Y").strftime("%Y-%m-%dT00:00:00")
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def _css_text(text: str) -> str:
+    """Maskiert einen Text für content: "..." in CSS."""
+    return text.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\A ")
+
+class PdfRenderer:
+    """
+    Rendert PDFs mit einmalig geparstem Seiten-Stylesheet und wiederverwendeter
+    Font-Konfiguration. Seitenformat, Ränder und Fußzeile kommen aus [pdf] in der config.ini.
+
+    Mit aktivem Render-Cache wird jedes PDF unter dem Hash aus dem Template-Ordner, Seiten-CSS,
+    WeasyPrint-Version und Kontext abgelegt; ein erneuter Aufruf mit denselben Daten kopiert
+    nur noch die Datei aus .render_cache/.
+    """
+    def __init__(self, fusszeile=None, seitengroesse=None, seitenrand=None, seitenzahlen=None, render_cache=None):
+        cfg = get_section("pdf")
+        self.fusszeile = fusszeile if fusszeile is not None else cfg.get("fusszeile", STANDARD_FUSSZEILE)
+        self.seitengroesse = seitengroesse or cfg.get("seitengroesse", "A4")
+        self.seitenrand = seitenrand or cfg.get("seitenrand", "0mm 20mm 10mm 20mm")
+        self.seitenzahlen = seitenzahlen if seitenzahlen is not None else cfg.getboolean("seitenzahlen", True)
+        self.render_cache = render_cache if render_cache is not None else cfg.getboolean("render_cache", True)
+        self.render_cache_max_mb = cfg.getint("render_cache_max_mb", 500)
+
+        self.font_config = FontConfiguration()
+        self.stylesheet = CSS(string=self.page_css(), font_config=self.font_config)
+
+    def page_css(self) -> str:
+        css = f"@page {{size: {self.seitengroesse}; margin: {self.seitenrand}; "
+        if self.seitenzahlen:
+            css += '@bottom-right {content: "Seite " counter(page) " von " counter(pages); font-size: 10pt;} '
+        if self.fusszeile:
+            css += f'@bottom-center {{content: "{_css_text(self.fusszeile)}"; font-size: 8pt; padding-top: 5px; }}'
+        return css + "}"
+
+    def cache_schluessel(self, template_name: str, erstellt, context: dict) -> str:
+        # Alle Template-Dateien statt nur template_name: {% include %}/{% extends %} und Assets zählen mit
+        h = hashlib.sha256()
+        for teil in (WEASYPRINT_VERSION, template_name, vorlagen_hash(), self.page_css(), erstellt or "",
+                     json.dumps(context, sort_keys=True, default=str)):
+            h.update(teil.encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def render(self, template_name: str, output_path=None, erstellt=None, **context):
+        """
+        Rendert ein Template zu PDF. Ohne output_path werden die PDF-Bytes zurückgegeben.
+        erstellt (ISO-Zeitstempel) wird als Erstellungs- und Änderungsdatum eingetragen;
+        zusammen mit der festen Dokument-ID ergeben gleiche Daten byte-identische PDFs.
+        """
+        if not self.render_cache:
+            return self._render(template_name, output_path, erstellt, None, context)
+
+        schluessel = self.cache_schluessel(template_name, erstellt, context)
+        cache_pfad = os.path.join(RENDER_CACHE_DIR, schluessel[:2], schluessel + ".pdf")
+        try:
+            with open(cache_pfad, "rb") as f:
+                pdf = f.read()
+            os.utime(cache_pfad)  # zuletzt benutzt, für das Aufräumen
+        except FileNotFoundError:
+            pdf = self._render(template_name, None, erstellt, schluessel, context)
+            self._in_cache(cache_pfad, pdf)
+
+        if output_path is None:
+            return pdf
+        with open(output_path, "wb") as f:
+            f.write(pdf)
+
+    def _render(self, template_name, output_path, erstellt, schluessel, context):
+        html_content = get_template(template_name).render(**context)
+        dokument = HTML(string=html_content).render(stylesheets=[self.stylesheet], font_config=self.font_config)
+        if erstellt:
+            dokument.metadata.created = erstellt
+            dokument.metadata.modified = erstellt
+        # Feste Dokument-ID statt einer zufälligen: Voraussetzung für reproduzierbare Dateien
+        kennung = (schluessel or hashlib.sha256(html_content.encode("utf-8")).hexdigest())[:32]
+        return dokument.write_pdf(output_path, pdf_identifier=kennung.encode("ascii"))
+
+    def _in_cache(self, cache_pfad, pdf: bytes):
+        # Atomar schreiben: parallele Prozesse (Sammellauf, Render-Worker) sehen nie halbe Dateien
+        try:
+            os.makedirs(os.path.dirname(cache_pfad), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(cache_pfad), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(pdf)
+            os.replace(tmp, cache_pfad)
+            _cache_gewachsen(len(pdf), self.render_cache_max_mb)
+        except OSError as e:
+            print("⚠️ PDF konnte nicht im Render-Cache abgelegt werden:", e)
+
+# Laufende Schätzung der Cache-Größe: der Ordner wird nur beim ersten Schreiben, beim Überschreiten
+# der Grenze und alle _CACHE_NEU_ZAEHLEN Dateien durchlaufen (andere Prozesse schreiben mit).
+_CACHE_NEU_ZAEHLEN = 200
+_cache_groesse = None
+_cache_schreibvorgaenge = 0
+_cache_lock = threading.Lock()
+
+def _cache_gewachsen(groesse: int, max_mb: int):
+    global _cache_groesse, _cache_schreibvorgaenge
+    with _cache_lock:
+        _cache_schreibvorgaenge += 1
+        if _cache_groesse is not None and _cache_schreibvorgaenge % _CACHE_NEU_ZAEHLEN:
+            _cache_groesse += groesse
+            if _cache_groesse <= max_mb * 1024 * 1024:
+                return
+        _cache_groesse = render_cache_aufraeumen(max_mb)
+
+def render_cache_aufraeumen(max_mb: int) -> int:
+    """
+    Löscht die am längsten nicht benutzten PDFs, bis der Cache unter max_mb liegt (beim Überschreiten
+    auf 90 %, damit nicht jedes weitere PDF erneut aufräumt). Gibt die verbleibende Größe zurück.
+    """
+    dateien = []
+    for ordner, _, namen in os.walk(RENDER_CACHE_DIR):
+        for name in namen:
+            pfad = os.path.join(ordner, name)
+            try:
+                st = os.stat(pfad)
+            except FileNotFoundError:
+                continue
+            dateien.append((st.st_mtime, st.st_size, pfad))
+    gesamt = sum(groesse for _, groesse, _ in dateien)
+    grenze = max_mb * 1024 * 1024
+    if gesamt <= grenze:
+        return gesamt
+    for _, groesse, pfad in sorted(dateien):
+        if gesamt <= grenze * 0.9:
+            break
+        try:
+            os.remove(pfad)
+            gesamt -= groesse
+        except FileNotFoundError:
+            pass
+    return gesamt
+
+_renderer = None
+_renderer_lock = threading.Lock()
+
+def get_renderer() -> PdfRenderer:
+    """Gemeinsamer Renderer des Prozesses (Schriften und Stylesheet werden nur einmal geladen)."""
+    global _renderer
+    if _renderer is None:
+        with _renderer_lock:
+            if _renderer is None:
+                _renderer = PdfRenderer()
+    return _renderer
+
 def generate_invoice(rechnung, output_path):
-    # Template-Ordner setzen
-    env = Environment(loader=FileSystemLoader("."))
-    template = env.get_template("templates/rechnung.html")
-
-    # HTML mit Daten füllen
-    html_content = template.render(rechnung=rechnung)
-    HTML(string=html_content).write_pdf(
-        output_path,
-        stylesheets=[
-            CSS(string='@page {size: A4; margin: 0mm 20mm 10mm 20mm; @bottom-right {content: "Seite " counter(page) " von " counter(pages); font-size: 10pt;} @bottom-center {content: "Dipl.-Psych. Katharina Kunisch M.A., Triodos Bank, DE67 5003 1000 1086 3140 09; BIC TRODDEF1"; font-size: 8pt; padding-top: 5px; }}')
-        ]
-    )
+    # HTML mit Daten füllen und PDF erzeugen
+    return get_renderer().render("rechnung.html", output_path, erstellt=pdf_datum(rechnung), rechnung=rechnung)
     #page_css = '''
     #@page {
     #    size: A4;
@@ -0,0 +1,116 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from tkinter import messagebox
+
+
+class Aufgabe:
+    """Handle für eine Hintergrundaufgabe (Abbrechen, Status)."""
+    def __init__(self, busy_text, on_success=None, on_error=None):
+        self.busy_text = busy_text
+        self.on_success = on_success
+        self.on_error = on_error
+        self.abgebrochen = threading.Event()
+        self.future = None
+
+    def cancel(self):
+        """Verwirft das Ergebnis; noch nicht gestartete Aufgaben laufen gar nicht erst an."""
+        self.abgebrochen.set()
+        if self.future is not None:
+            self.future.cancel()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.abgebrochen.is_set()
+
+
+class BackgroundExecutor:
+    """
+    Führt DB- und Render-Aufrufe in einem Thread-Pool aus, damit das Tk-Fenster nicht einfriert.
+    Ergebnisse werden per after()-Pumpe im Tk-Hauptthread an die Callbacks übergeben,
+    Fehler landen (falls kein eigener Handler angegeben ist) in einer Messagebox.
+    """
+    def __init__(self, master, max_workers=4, status_var=None, poll_ms=50):
+        self.master = master
+        self.status_var = status_var
+        self.poll_ms = poll_ms
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hintergrund")
+        self._ergebnisse = queue.Queue()
+        self._aktiv = []
+        self._beendet = False
+        self.master.after(self.poll_ms, self._pump)
+
+    def submit(self, fn, *args, on_success=None, on_error=None, busy_text="Bitte warten...",
+               fehlertext="Vorgang fehlgeschlagen", **kwargs) -> Aufgabe:
+        """
+        Startet fn(*args, **kwargs) im Hintergrund.
+        on_success(ergebnis) und on_error(exception) laufen im Tk-Hauptthread.
+        """
+        on_error = on_error or (lambda e: messagebox.showerror("Fehler", f"{fehlertext}:\n{e}"))
+        aufgabe = Aufgabe(busy_text, on_success, on_error)
+        self._aktiv.append(aufgabe)
+        self._busy_anzeigen()
+
+        aufgabe.future = self._pool.submit(fn, *args, **kwargs)
+        aufgabe.future.add_done_callback(lambda future: self._ergebnisse.put(("fertig", aufgabe)))
+        return aufgabe
+
+    def call_in_ui(self, fn, *args):
+        """Aus einem Hintergrund-Thread heraus fn(*args) im Tk-Hauptthread ausführen (z.B. Fortschritt)."""
+        self._ergebnisse.put(("ui", lambda: fn(*args)))
+
+    def _pump(self):
+        if self._beendet:
+            return
+        try:
+            while True:
+                art, inhalt = self._ergebnisse.get_nowait()
+                if art == "ui":
+                    self._sicher_ausfuehren(inhalt)
+                else:
+                    self._abschliessen(inhalt)
+        except queue.Empty:
+            pass
+        self.master.after(self.poll_ms, self._pump)
+
+    def _abschliessen(self, aufgabe):
+        if aufgabe in self._aktiv:
+            self._aktiv.remove(aufgabe)
+        self._busy_anzeigen()
+
+        if aufgabe.cancelled or aufgabe.future.cancelled():
+            return
+        fehler = aufgabe.future.exception()
+        if fehler is not None:
+            self._sicher_ausfuehren(lambda: aufgabe.on_error(fehler))
+        elif aufgabe.on_success is not None:
+            self._sicher_ausfuehren(lambda: aufgabe.on_success(aufgabe.future.result()), aufgabe.on_error)
+
+    def _sicher_ausfuehren(self, fn, on_error=None):
+        # Fehler in Callbacks dürfen die Pumpe nicht anhalten
+        try:
+            fn()
+        except Exception as e:
+            if on_error is not None:
+                on_error(e)
+            else:
+                messagebox.showerror("Fehler", f"Unerwarteter Fehler:\n{e}")
+
+    def _busy_anzeigen(self):
+        try:
+            self.master.config(cursor="watch" if self._aktiv else "")
+        except Exception:
+            pass
+        if self.status_var is not None:
+            self.status_var.set(self._aktiv[-1].busy_text if self._aktiv else "Bereit")
+
+    @property
+    def beschaeftigt(self) -> bool:
+        return bool(self._aktiv)
+
+    def shutdown(self):
+        """Laufende Aufgaben abbrechen (soweit möglich) und den Pool beenden."""
+        self._beendet = True
+        for aufgabe in list(self._aktiv):
+            aufgabe.cancel()
+        self._pool.shutdown(wait=False, cancel_futures=True)
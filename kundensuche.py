@@ -0,0 +1,129 @@
+"""
+Tippsuche über die Kundenliste (Name, Kürzel, Kundennummer, Ort) für die Kunden-Dropdowns.
+
+Jedes Wort der Felder wird normalisiert (Kleinschreibung, ohne Akzente, ß -> ss) als Token in
+einer sortierten Liste abgelegt; eine Präfixsuche ist damit eine Bisektion statt eines Durchlaufs
+über alle Kunden. Mehrere Suchwörter müssen alle passen ("mül bam" findet "Müller, Bamberg").
+"""
+import bisect
+import heapq
+import re
+import unicodedata
+
+_WORT = re.compile(r"\w+")
+
+
+def normalisieren(text) -> str:
+    zerlegt = unicodedata.normalize("NFKD", str(text or "").casefold())
+    return "".join(z for z in zerlegt if not unicodedata.combining(z))
+
+
+def _tokens(kunde: dict) -> set:
+    tokens = {str(kunde["kdnr"])}
+    for feld in ("name", "kuerzel", "ort"):
+        tokens.update(_WORT.findall(normalisieren(kunde.get(feld))))
+    return tokens
+
+
+def beschriftung(kunde: dict) -> str:
+    """Eintrag im Dropdown, wie bisher: 'Name (kdnr)'."""
+    return f"{kunde['name']} ({kunde['kdnr']})"
+
+
+class KundenIndex:
+    """Präfix-Index über alle Kunden; Änderungen einzelner Kunden werden ohne Neuaufbau übernommen."""
+
+    def __init__(self, kunden=()):
+        self._kunden = {}            # kdnr -> kunde (dict)
+        self._tokens = {}            # kdnr -> set der Tokens
+        self._sortname = {}          # kdnr -> (normalisierter Name, kdnr) für die Anzeigereihenfolge
+        self.nach_beschriftung = {}  # 'Name (kdnr)' -> kdnr
+        self._alle = None            # alle Beschriftungen nach Name, wird bei Bedarf neu gebildet
+        # [(token, kdnr)] sortiert; einmal sortieren statt einzeln einfügen
+        self._eintraege = sorted((token, kunde["kdnr"]) for kunde in kunden for token in self._merken(kunde))
+
+    def __len__(self):
+        return len(self._kunden)
+
+    def _merken(self, kunde: dict) -> set:
+        kdnr = kunde["kdnr"]
+        tokens = _tokens(kunde)
+        self._kunden[kdnr] = kunde
+        self._tokens[kdnr] = tokens
+        self._sortname[kdnr] = (normalisieren(kunde["name"]), kdnr)
+        self.nach_beschriftung[beschriftung(kunde)] = kdnr
+        self._alle = None
+        return tokens
+
+    def entfernen(self, kdnr: int):
+        kunde = self._kunden.pop(kdnr, None)
+        if kunde is None:
+            return
+        for token in self._tokens.pop(kdnr):
+            del self._eintraege[bisect.bisect_left(self._eintraege, (token, kdnr))]
+        del self._sortname[kdnr]
+        del self.nach_beschriftung[beschriftung(kunde)]
+        self._alle = None
+
+    def aktualisieren(self, kunde: dict):
+        """Neuen Kunden aufnehmen oder geänderten Kunden ersetzen."""
+        if self._kunden.get(kunde["kdnr"]) == kunde:
+            return
+        self.entfernen(kunde["kdnr"])
+        for token in self._merken(kunde):
+            bisect.insort(self._eintraege, (token, kunde["kdnr"]))
+
+    def abgleichen(self, kunden: list) -> int:
+        """Übernimmt eine frisch geladene Kundenliste; nur Unterschiede werden angewendet. Gibt deren Anzahl zurück."""
+        neu = {k["kdnr"]: k for k in kunden}
+        aenderungen = 0
+        for kdnr in [kdnr for kdnr in self._kunden if kdnr not in neu]:
+            self.entfernen(kdnr)
+            aenderungen += 1
+        for kdnr, kunde in neu.items():
+            if self._kunden.get(kdnr) != kunde:
+                self.aktualisieren(kunde)
+                aenderungen += 1
+        return aenderungen
+
+    def _treffer(self, praefix: str) -> set:
+        """Alle Kunden mit einem Token, das mit praefix beginnt (zusammenhängender Bereich der Liste)."""
+        start = bisect.bisect_left(self._eintraege, (praefix,))
+        ende = bisect.bisect_left(self._eintraege, (praefix + "\U0010ffff",), start)
+        return {kdnr for _, kdnr in self._eintraege[start:ende]}
+
+    def alle(self) -> list:
+        """Alle Beschriftungen, nach Name sortiert."""
+        if self._alle is None:
+            self._alle = [beschriftung(self._kunden[kdnr]) for _, kdnr in sorted(self._sortname.values())]
+        return self._alle
+
+    def suchen(self, text: str, limit=None) -> list:
+        """Beschriftungen aller Kunden, auf die jedes Suchwort als Wortanfang passt, nach Name sortiert."""
+        woerter = _WORT.findall(normalisieren(text))
+        if not woerter:
+            return self.alle()[:limit]
+        # Längstes Wort zuerst: kleinste Treffermenge, die übrigen filtern nur noch
+        woerter.sort(key=len, reverse=True)
+        kandidaten = self._treffer(woerter[0])
+        for wort in woerter[1:]:
+            if not kandidaten:
+                break
+            kandidaten &= self._treffer(wort)
+        if limit is None:
+            ergebnis = sorted(kandidaten, key=self._sortname.__getitem__)
+        else:
+            ergebnis = heapq.nsmallest(limit, kandidaten, key=self._sortname.__getitem__)
+        return [beschriftung(self._kunden[kdnr]) for kdnr in ergebnis]
+
+    def beschriftung(self, kdnr: int) -> str:
+        return beschriftung(self._kunden[kdnr])
+
+    def kdnr(self, eingabe: str):
+        """Kundennummer zu einem Dropdown-Eintrag oder einer eindeutigen Suche, sonst None."""
+        if not eingabe or not eingabe.strip():
+            return None
+        if eingabe in self.nach_beschriftung:
+            return self.nach_beschriftung[eingabe]
+        treffer = self.suchen(eingabe, limit=2)
+        return self.nach_beschriftung[treffer[0]] if len(treffer) == 1 else None
@@ -0,0 +1,201 @@
+"""
+Mahnlauf: findet alle überfälligen, unbezahlten Rechnungen, ordnet sie der nächsten
+Mahnstufe zu (1 = Zahlungserinnerung, 2 = Mahnung), rendert die PDFs parallel und
+verbucht Stufe und Datum je Rechnung.
+
+  python mahnwesen.py                 Mahnungen zum heutigen Tag nach Mahnungen/<YYYY-MM-DD>
+  python mahnwesen.py --vorschau      nur anzeigen, welche Rechnungen gemahnt würden
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, timedelta
+from decimal import Decimal
+
+from app_config import get_section
+from db import fetch_mahnkandidaten, verbuche_mahnungen
+from verzug import berechne_offene_posten, verzug_cfg
+
+TEMPLATES = {1: "mahnung.html", 2: "mahnung_2.html"}
+BEZEICHNUNG = {1: "Zahlungserinnerung", 2: "Mahnung"}
+
+
+def _mahn_cfg():
+    cfg = get_section("mahnung")
+    return {
+        "zahlungsziel_tage": cfg.getint("zahlungsziel_tage", 14),
+        "karenz_tage": cfg.getint("karenz_tage", 7),
+        "abstand_tage": cfg.getint("abstand_tage", 14),
+        "frist_tage": cfg.getint("frist_tage", 14),
+        # Gebühr der 2. Mahnung, wie sie verzug.py ab dem Mahndatum ansetzt
+        "mahngebuehr": verzug_cfg()["gebuehren"][2]
+    }
+
+
+def _fmt(tag: date) -> str:
+    return tag.strftime("%d.%m.%Y")
+
+
+def mahnkontext(kandidat: dict, stichtag: date, cfg: dict, verzug=None) -> dict:
+    """
+    Alle Angaben, die die Mahnungs-Templates statt fester Daten und Beträge verwenden.
+    verzug: Ergebnis von verzug.berechne_verzug für diese Rechnung (Teilzahlungen, Zinsen, Gebühren).
+    """
+    faellig = kandidat["rechnungsdatum"] + timedelta(days=cfg["zahlungsziel_tage"])
+    # Rechnungen ohne verbuchte Summe (fehlende Konditionen) nicht mit "None" bzw. Renderfehler mahnen
+    betrag = kandidat["rechnung"]["summe"] or Decimal("0")
+    verzug = verzug or {}
+    return {
+        "stufe": kandidat["stufe"],
+        "bezeichnung": BEZEICHNUNG[kandidat["stufe"]],
+        "datum": _fmt(stichtag),
+        "frist": _fmt(stichtag + timedelta(days=cfg["frist_tage"])),
+        "rechnungsdatum": _fmt(kandidat["rechnungsdatum"]),
+        "faellig_am": _fmt(faellig),
+        "verzug_ab": _fmt(faellig + timedelta(days=1)),
+        "vorherige_mahnung": _fmt(kandidat["gemahnt_am"]) if kandidat["gemahnt_am"] else None,
+        "betrag": betrag,
+        "gezahlt": verzug.get("gezahlt"),
+        "offen": verzug.get("hauptforderung", betrag),
+        "zinsen": verzug.get("zinsen"),
+        "gebuehren": verzug.get("gebuehren"),
+        "gesamt": verzug.get("gesamt", betrag),
+        "mahngebuehr": cfg["mahngebuehr"],
+        "verzugszins_prozent": verzug.get("zinssatz")
+    }
+
+
+def _render_job(rechnung, mahnung, pfad, erstellt):
+    """Läuft im Worker-Prozess (WeasyPrint ist CPU-lastig)."""
+    from generate_invoice import get_renderer
+    get_renderer().render(TEMPLATES[mahnung["stufe"]], pfad, erstellt=erstellt, rechnung=rechnung, mahnung=mahnung)
+    return pfad
+
+
+def finde_mahnungen(stichtag=None) -> list:
+    """Liefert [(kandidat, mahnkontext)] aller Rechnungen, die zum Stichtag gemahnt werden."""
+    stichtag = stichtag or date.today()
+    cfg = _mahn_cfg()
+    kandidaten = fetch_mahnkandidaten(
+        stichtag - timedelta(days=cfg["zahlungsziel_tage"] + cfg["karenz_tage"]),
+        stichtag - timedelta(days=cfg["abstand_tage"])
+    )
+    if not kandidaten:
+        return []
+    # Offene Beträge nach Teilzahlungen, Zinsen und Gebühren für alle Rechnungen in einem Durchlauf
+    posten, _ = berechne_offene_posten(stichtag)
+    verzug = {p["rechnung_id"]: p for p in posten}
+    return [(k, mahnkontext(k, stichtag, cfg, verzug.get(k["rechnung_id"]))) for k in kandidaten]
+
+
+def erstelle_mahnungen(zielordner: str, stichtag=None, max_workers=None, fortschritt=None, abbruch=None):
+    """
+    Mahnlauf zum Stichtag (Standard: heute). Nur erfolgreich erzeugte Mahnungen werden verbucht,
+    fehlgeschlagene oder abgebrochene kommen beim nächsten Lauf wieder.
+    fortschritt(fertig, gesamt, rechnung_nr) und abbruch (threading.Event) wie bei der Monatsabrechnung.
+    Gibt einen Bericht (dict) zurück.
+    """
+    beginn = time.perf_counter()
+    stichtag = stichtag or date.today()
+    os.makedirs(zielordner, exist_ok=True)
+    mahnungen = finde_mahnungen(stichtag)
+
+    bericht = {
+        "stichtag": stichtag,
+        "zielordner": zielordner,
+        "erstellt": [],
+        "fehler": [],
+        "abgebrochen": False,
+        "dauer_s": 0.0
+    }
+
+    verbuchen = []
+    frist = stichtag + timedelta(days=_mahn_cfg()["frist_tage"])
+    erstellt = f"{stichtag.isoformat()}T00:00:00"
+    if mahnungen:
+        max_workers = max_workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=min(max_workers, len(mahnungen))) as pool:
+            jobs = {}
+            for kandidat, mahnung in mahnungen:
+                r = kandidat["rechnung"]
+                pfad = os.path.join(zielordner, f"Mahnung{mahnung['stufe']}_{r['rechnung_nr']}.pdf")
+                jobs[pool.submit(_render_job, r, mahnung, pfad, erstellt)] = (kandidat, mahnung)
+
+            for fertig, job in enumerate(as_completed(jobs), start=1):
+                kandidat, mahnung = jobs[job]
+                r = kandidat["rechnung"]
+                if job.cancelled():
+                    continue
+                try:
+                    pfad = job.result()
+                    verbuchen.append((kandidat["rechnung_id"], mahnung["stufe"], stichtag, frist))
+                    bericht["erstellt"].append((r['rechnung_nr'], mahnung["stufe"], r['kunde']['name'], mahnung['gesamt'], pfad))
+                except Exception as e:
+                    bericht["fehler"].append((r['rechnung_nr'], str(e)))
+                if fortschritt:
+                    fortschritt(fertig, len(mahnungen), r['rechnung_nr'])
+                if abbruch is not None and abbruch.is_set() and not bericht["abgebrochen"]:
+                    bericht["abgebrochen"] = True
+                    for rest in jobs:
+                        rest.cancel()
+
+    # --- Mahnstufe und Datum aller erzeugten Mahnungen in einer Transaktion festhalten ---
+    verbuche_mahnungen(verbuchen)
+
+    bericht["erstellt"].sort()
+    bericht["dauer_s"] = time.perf_counter() - beginn
+    return bericht
+
+
+def bericht_als_text(bericht: dict) -> str:
+    """Zusammenfassung des Mahnlaufs für Konsole und Messagebox."""
+    zeilen = [f"Mahnlauf zum {_fmt(bericht['stichtag'])}", f"Zielordner: {bericht['zielordner']}", ""]
+    if not bericht["erstellt"] and not bericht["fehler"]:
+        zeilen.append("✅ Keine überfälligen Rechnungen.")
+    for stufe in (1, 2):
+        erstellt = [e for e in bericht["erstellt"] if e[1] == stufe]
+        if erstellt:
+            summe = sum(s for _, _, _, s, _ in erstellt if s is not None)
+            zeilen.append(f"✅ {len(erstellt)}x {BEZEICHNUNG[stufe]} (offen gesamt {summe:.2f} €)")
+            zeilen.extend(f"   {nr}  {name}" for nr, _, name, _, _ in erstellt)
+    for nr, fehler in bericht["fehler"]:
+        zeilen.append(f"❌ {nr}: {fehler}")
+    if bericht.get("abgebrochen"):
+        zeilen.append("⏹ Lauf wurde abgebrochen, nicht alle Mahnungen wurden erstellt.")
+    zeilen.append(f"Dauer: {bericht['dauer_s']:.1f} s")
+    return "\n".join(zeilen)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Erstellt Zahlungserinnerungen und Mahnungen für überfällige Rechnungen.")
+    parser.add_argument("--stichtag", default=None, help="Stichtag YYYY-MM-DD (Standard: heute)")
+    parser.add_argument("--ziel", default=None, help="Zielordner für die PDFs (Standard: Mahnungen/<Stichtag>)")
+    parser.add_argument("--prozesse", type=int, default=None, help="Anzahl paralleler Render-Prozesse")
+    parser.add_argument("--vorschau", action="store_true", help="Nur anzeigen, nichts erstellen oder verbuchen")
+    args = parser.parse_args(argv)
+
+    stichtag = date.fromisoformat(args.stichtag) if args.stichtag else date.today()
+
+    if args.vorschau:
+        mahnungen = finde_mahnungen(stichtag)
+        for kandidat, mahnung in mahnungen:
+            r = kandidat["rechnung"]
+            print(f"Stufe {mahnung['stufe']}  {r['rechnung_nr']:<12} {mahnung['rechnungsdatum']}  {mahnung['gesamt']:>10} €  {r['kunde']['name']}")
+        print(f"{len(mahnungen)} Rechnungen würden gemahnt.")
+        return 0
+
+    ziel = args.ziel or os.path.join("Mahnungen", stichtag.isoformat())
+
+    def fortschritt(fertig, gesamt, rechnung_nr):
+        print(f"\r[{fertig:>3}/{gesamt}] {rechnung_nr:<20}", end="", flush=True)
+
+    bericht = erstelle_mahnungen(ziel, stichtag, args.prozesse, fortschritt)
+    print()
+    print(bericht_als_text(bericht))
+    return 1 if bericht["fehler"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,33 +1,80 @@
+import startzeit  # als erstes: Startzeitpunkt für die Messung bis zum ersten Fenster
 import tkinter as tk
 from tkinter import ttk, messagebox
 from db import (
-    fetch_kunden, fetch_rechnungsdaten, check_invoice_paid, upsert_rechnung,
-    fetch_offene_rechnungen, mark_rechnung_bezahlt,
-    fetch_kunde_details, update_kunde_stammdaten, update_kunde_konditionen, correct_kunde_konditionen
+    fetch_kunden, fetch_rechnungsdaten, check_invoice_paid, upsert_rechnung, naechste_rechnungsnummer,
+    fetch_offene_rechnungen, fetch_rechnungsaenderungen, mark_rechnung_bezahlt, erfasse_zahlung,
+    fetch_kunde_details, update_kunde_stammdaten, update_kunde_konditionen, correct_kunde_konditionen,
+    konditionen_datum_fehler, close_pool, starte_cache_listener
 )
-from tkinter import filedialog, messagebox
-from generate_invoice import generate_invoice
+from tkinter import filedialog, messagebox, simpledialog
+from render_worker import render_invoice
+from hintergrund import BackgroundExecutor
+from tabellenmodell import TabellenModell
+from kundensuche import KundenIndex
 from tkcalendar import DateEntry
 from datetime import datetime
+from decimal import Decimal, InvalidOperation
+import os
+import sys
+import threading
+
+# Hinweis: generate_invoice (WeasyPrint, fontTools, Pillow, ...), monatsabrechnung und mahnwesen werden
+# bewusst NICHT hier importiert, sondern erst bei Bedarf bzw. nach dem Öffnen des Fensters.
+
+# Offene Rechnungen: Seitengröße beim Nachladen und Intervall für den Abgleich mit der Datenbank
+RECHNUNGEN_SEITE = 200
+RECHNUNGEN_AKTUALISIERUNG_MS = 30000
+# Höchstzahl der Einträge, die die Kundensuche im Dropdown anzeigt
+KUNDENSUCHE_TREFFER = 50
+# Höchstzahl der Treffer im Rechnungsarchiv (neueste zuerst)
+ARCHIV_TREFFER = 500
+
+
+def vorwaermen():
+    """Lädt den PDF-Renderer im Hintergrund vor, damit die erste Rechnung nicht auf den Import wartet."""
+    try:
+        from generate_invoice import get_renderer
+        get_renderer()
+    except Exception as e:
+        print("⚠️ Renderer konnte nicht vorgeladen werden:", e)
 
 
 def main():
+    if "--importzeit" in sys.argv:
+        startzeit.drucke_importzeit()
+        return
+
     root = tk.Tk()
     root.title("Rechnungserstellung & Verwaltung")
-    root.geometry("400x420")
+    root.geometry("400x625")
 
     app = InvoiceApp(root)
+    startzeit.melde_erstes_fenster(root, ausgeben="--startzeit" in sys.argv)
+
+    # Cache-Invalidierung durch andere Clients (ohne Listener wird nicht gecacht)
+    starte_cache_listener()
+
+    # Renderer erst vorwärmen, wenn das Fenster steht
+    root.after(500, lambda: threading.Thread(target=vorwaermen, daemon=True).start())
     root.mainloop()
 
+    # Hintergrundaufgaben beenden und gepoolte Datenbankverbindungen sauber schließen
+    app.executor.shutdown()
+    close_pool()
+
 class InvoiceApp:
     def __init__(self, master):
         self.master = master
+        # Gemeinsamer Suchindex für beide Kunden-Dropdowns (Hauptfenster und Kundenverwaltung)
+        self.kunden_index = KundenIndex()
 
         # Label und Dropdown für Kunden
         ttk.Label(master, text="Kunde auswählen:").pack(pady=5)
         self.kunde_var = tk.StringVar()
-        self.kunde_dropdown = ttk.Combobox(master, textvariable=self.kunde_var, state="readonly")
+        self.kunde_dropdown = ttk.Combobox(master, textvariable=self.kunde_var)
         self.kunde_dropdown.pack(pady=5)
+        self._tippsuche(self.kunde_dropdown)
 
         # Datumseingaben mit Kalender
         ttk.Label(master, text="Startdatum:").pack(pady=5)
@@ -52,41 +99,137 @@ class InvoiceApp:
         )
         self.end_entry.pack(pady=5)
 
+        # Abrechnungsmodus: alle noch nicht berechneten Besuche bis zum Enddatum
+        self.nur_unberechnet_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            master, text="Alle offenen Besuche bis Enddatum", variable=self.nur_unberechnet_var,
+            command=self._modus_geaendert
+        ).pack(pady=5)
 
         # Buttons
         ttk.Button(master, text="Rechnung erstellen", command=self.erstelle_rechnung).pack(pady=(20, 5))
+        ttk.Button(master, text="Monatsabrechnung (alle Kunden)", command=self.erstelle_alle_rechnungen).pack(pady=5)
+        ttk.Button(master, text="Mahnlauf (überfällige Rechnungen)", command=self.erstelle_mahnungen).pack(pady=5)
         ttk.Button(master, text="Offene Rechnungen verwalten", command=self.manage_invoices).pack(pady=5)
         ttk.Button(master, text="Kunden & Konditionen verwalten", command=self.manage_customers).pack(pady=5)
+        ttk.Button(master, text="Rechnungsarchiv", command=self.rechnungsarchiv).pack(pady=5)
+        ttk.Button(master, text="Datensicherung jetzt erstellen", command=self.datensicherung).pack(pady=5)
+
+        # Statuszeile (Busy-Anzeige für Hintergrundaufgaben)
+        self.status_var = tk.StringVar(value="Bereit")
+        ttk.Label(master, textvariable=self.status_var, foreground="gray").pack(side=tk.BOTTOM, pady=5)
+
+        # Alle DB- und Render-Aufrufe laufen im Hintergrund, damit das Fenster nicht hängt
+        self.executor = BackgroundExecutor(master, status_var=self.status_var)
 
         # Kundenliste laden
         self.lade_kunden()
 
+        # Fällige Datensicherung (falls in der config.ini aktiviert) im Hintergrund nachholen
+        master.after(2000, self._datensicherung_beim_start)
+
+    def datensicherung(self):
+        """Sofortige Datensicherung (pg_dump, komprimiert, mit Prüfsumme) in den konfigurierten Ordner."""
+        import backup
+        self.executor.submit(
+            lambda: backup.bericht_als_text({"sicherung": backup.sichern()}),
+            on_success=lambda text: messagebox.showinfo("Datensicherung", text),
+            busy_text="Datensicherung läuft...",
+            fehlertext="Datensicherung fehlgeschlagen"
+        )
+
+    def _datensicherung_beim_start(self):
+        """
+        Eigener Thread statt Executor: eine Sicherung mit Restore-Test kann Minuten dauern und soll
+        weder die Busy-Anzeige belegen noch beim Schließen des Fensters abgebrochen werden.
+        """
+        import backup
+        if not backup.backup_cfg()["beim_start"]:
+            return
+
+        def lauf():
+            try:
+                ergebnis = backup.automatisch()
+            except Exception as e:
+                meldung = f"⚠️ Datensicherung fehlgeschlagen: {e}"
+            else:
+                if not (ergebnis["sicherung"] or ergebnis["restore_test"]):
+                    return
+                print(backup.bericht_als_text(ergebnis))
+                test = ergebnis["restore_test"]
+                meldung = "⚠️ Restore-Test der Datensicherung fehlgeschlagen" if test and not test["ok"] else "✅ Datensicherung erstellt"
+            print(meldung)
+            self.executor.call_in_ui(self.status_var.set, meldung)
+
+        threading.Thread(target=lauf, name="datensicherung").start()
+
     def lade_kunden(self):
         """Lädt Kundendaten aus der DB und füllt das Dropdown."""
-        try:
-            kunden = fetch_kunden()
-            self.kunden_dict = {f"{k['name']} ({k['kdnr']})": k['kdnr'] for k in kunden}
-            self.kunde_dropdown['values'] = list(self.kunden_dict.keys())
-        except Exception as e:
-            messagebox.showerror("Fehler", f"Kunden konnten nicht geladen werden:\n{e}")
+        self.executor.submit(
+            fetch_kunden,
+            on_success=self._kunden_geladen,
+            busy_text="Lade Kunden...",
+            fehlertext="Kunden konnten nicht geladen werden"
+        )
+
+    def _kunden_geladen(self, kunden):
+        # Nur geänderte, neue oder gelöschte Kunden werden im Index angepasst
+        self.kunden_index.abgleichen(kunden)
+        alle = self.kunden_index.alle()
+        self.kunde_dropdown['values'] = alle
         
-        if self.kunden_dict:
-            max_len = max(len(name) for name in self.kunden_dict.keys())
+        if alle:
+            max_len = max(len(name) for name in alle)
             self.kunde_dropdown.config(width=max_len)
 
+    def _tippsuche(self, combobox):
+        """Filtert die Einträge der Combobox beim Tippen über den Kundenindex."""
+        def getippt(event):
+            if event.keysym in ("Up", "Down", "Return", "Escape", "Tab"):
+                return
+            combobox['values'] = self.kunden_index.suchen(combobox.get(), limit=KUNDENSUCHE_TREFFER)
+
+        def bestaetigt(event):
+            # Eindeutiger Treffer: Eingabe durch den vollständigen Eintrag ersetzen
+            kdnr = self.kunden_index.kdnr(combobox.get())
+            if kdnr is not None:
+                combobox.set(self.kunden_index.beschriftung(kdnr))
+                combobox.event_generate("<<ComboboxSelected>>")
+
+        combobox.bind("<KeyRelease>", getippt)
+        combobox.bind("<Return>", bestaetigt)
+
+    def _gewaehlter_kunde(self, eingabe):
+        """Kundennummer zur Eingabe im Dropdown oder None (mit Hinweis)."""
+        if not eingabe:
+            messagebox.showwarning("Hinweis", "Bitte zuerst einen Kunden auswählen.")
+            return None
+        kdnr = self.kunden_index.kdnr(eingabe)
+        if kdnr is None:
+            messagebox.showwarning("Hinweis", f"'{eingabe}' passt nicht eindeutig zu einem Kunden.")
+        return kdnr
+
+    def _modus_geaendert(self):
+        # Im Modus "offene Besuche" spielt das Startdatum keine Rolle
+        self.start_entry.config(state="disabled" if self.nur_unberechnet_var.get() else "normal")
+
+    def _zeitraum_gueltig(self, start_str, ende_str) -> bool:
+        if not self.nur_unberechnet_var.get() and datetime.strptime(ende_str, "%Y-%m-%d") < datetime.strptime(start_str, "%Y-%m-%d"):
+            messagebox.showerror("Fehler", "Das Enddatum darf nicht vor dem Startdatum liegen.")
+            return False
+        return True
+
     def erstelle_rechnung(self):
         """Lädt Rechnungsdaten für den gewählten Kunden und Zeitraum und erzeugt PDF-Rechnung."""
-        auswahl = self.kunde_var.get()
-        if not auswahl:
-            messagebox.showwarning("Hinweis", "Bitte zuerst einen Kunden auswählen.")
+        kdnr = self._gewaehlter_kunde(self.kunde_var.get())
+        if kdnr is None:
             return
-        
-        kdnr = self.kunden_dict[auswahl]
+
         start_str = self.start_entry.get()
         ende_str = self.end_entry.get()
+        nur_unberechnet = self.nur_unberechnet_var.get()
         
-        if datetime.strptime(ende_str, "%Y-%m-%d") < datetime.strptime(start_str, "%Y-%m-%d"):
-            messagebox.showerror("Fehler", "Das Enddatum darf nicht vor dem Startdatum liegen.")
+        if not self._zeitraum_gueltig(start_str, ende_str):
             return
 
         # Uhrzeit hinzufügen, damit der ausgewählte Zeitraum
@@ -94,57 +237,344 @@ class InvoiceApp:
         start_db = f"{start_str} 00:00:00"
         ende_db = f"{ende_str} 23:59:59"
 
-        try:
-            rechnung = fetch_rechnungsdaten(kdnr, start_db, ende_db)
-            
-            # --- Fehlende Konditionen abfangen ---
-            if rechnung.get('summe') is None:
-                messagebox.showwarning(
-                    "Achtung: Keine Konditionen gefunden", 
-                    "Es konnten keine Kosten für diesen Zeitraum berechnet werden.\n\n"
-                    "Wahrscheinlicher Grund:\n"
-                    "Für diesen Kunden fehlt noch der Eintrag in der Tabelle 'kondition' "
-                    "(Preis pro Einheit, km-Geld etc.) oder die Konditionen sind in diesem "
-                    "Zeitraum nicht gültig.\n\n"
-                    "Bitte trage die Konditionen für diesen Kunden in der Datenbank nach!"
-                )
-                return
+        self.executor.submit(
+            self._lade_rechnung, kdnr, start_db, ende_db, nur_unberechnet,
+            on_success=lambda ergebnis: self._rechnung_geladen(kdnr, *ergebnis),
+            busy_text="Lade Rechnungsdaten...",
+            fehlertext="Rechnung konnte nicht erstellt werden"
+        )
 
-            rechnung_nr = rechnung['rechnung_nr']
+    @staticmethod
+    def _lade_rechnung(kdnr, start_db, ende_db, nur_unberechnet=False):
+        """
+        Hintergrund: Rechnungsdaten laden, Sperrstatus prüfen und Nummer für den Dateinamen vorschlagen.
+        Für gesperrte Rechnungen zusätzlich den Pfad der archivierten Fassung (oder None).
+        """
+        rechnung = fetch_rechnungsdaten(kdnr, start_db, ende_db, nur_unberechnet)
+        archiviert = None
+        if rechnung['rechnung_nr']:
+            # Neuerstellung einer bestehenden Rechnung
+            bezahlt = check_invoice_paid(rechnung['rechnung_nr'])
+            vorschau = rechnung['rechnung_nr']
+            if bezahlt:
+                # Gesperrt: die Besuche stehen in bereits_abgerechnet, archiviert ist die bezahlte
+                # Rechnung, zu der der früheste davon gehört
+                import archiv
+                archiviert = archiv.pdf_pfad(rechnung['bereits_abgerechnet'][0][1])
+        else:
+            bezahlt = False
+            vorschau = naechste_rechnungsnummer()
+        return rechnung, bezahlt, vorschau, archiviert
+
+    def _rechnung_geladen(self, kdnr, rechnung, bezahlt, vorschau, archiviert=None):
+        bereits = rechnung.get('bereits_abgerechnet', [])
+        hinweis_abgerechnet = (
+            f"{len(bereits)} Besuch(e) in diesem Zeitraum wurden bereits mit einer anderen Rechnung "
+            f"berechnet und sind nicht enthalten:\n"
+            + "\n".join(f"  {datum} → {nr}" for datum, nr in bereits[:10])
+            + ("\n  ..." if len(bereits) > 10 else "")
+        )
 
-            # --- SCHUTZMECHANISMUS: Ist die Rechnung schon als bezahlt gelockt? ---
-            if check_invoice_paid(rechnung_nr):
-                messagebox.showerror(
-                    "Rechnung gesperrt", 
-                    f"Die Rechnung {rechnung_nr} wurde bereits als BEZAHLT markiert.\n\n"
+        # --- SCHUTZMECHANISMUS: Ist die Rechnung schon als bezahlt gelockt? ---
+        # (alle Besuche des Zeitraums gehören zu bezahlten Rechnungen, daher vor "Keine Besuche")
+        if bezahlt:
+            text = (f"Die Rechnung {rechnung['rechnung_nr']} wurde bereits als BEZAHLT markiert.\n\n"
                     "Sie ist revisionssicher gesperrt und kann nicht mehr überschrieben "
-                    "oder neu generiert werden."
-                )
-                return
+                    "oder neu generiert werden.")
+            if archiviert is None:
+                messagebox.showerror("Rechnung gesperrt", text)
+            elif messagebox.askyesno("Rechnung gesperrt", text + "\n\nArchivierte Fassung öffnen?", icon="warning"):
+                import archiv
+                archiv.oeffnen(archiviert)
+            return
 
-            # --- Dateiname automatisch vorschlagen ---
-            vorgeschlagener_dateiname = f"{rechnung_nr}.pdf"
+        # --- Nichts abzurechnen ---
+        if not rechnung.get('besuche'):
+            messagebox.showinfo(
+                "Keine Besuche",
+                "Für diesen Kunden gibt es im gewählten Zeitraum keine abrechenbaren Besuche."
+                + (f"\n\n{hinweis_abgerechnet}" if bereits else "")
+            )
+            return
 
-            # Nutzer nach Speicherort fragen
-            pfad = filedialog.asksaveasfilename(
-                defaultextension=".pdf",
-                initialfile=vorgeschlagener_dateiname,
-                filetypes=[("PDF-Datei", "*.pdf")],
-                title="Rechnung speichern unter..."
+        # --- Fehlende Konditionen abfangen ---
+        if rechnung.get('summe') is None:
+            messagebox.showwarning(
+                "Achtung: Keine Konditionen gefunden", 
+                "Es konnten keine Kosten für diesen Zeitraum berechnet werden.\n\n"
+                "Wahrscheinlicher Grund:\n"
+                "Für diesen Kunden fehlt noch der Eintrag in der Tabelle 'kondition' "
+                "(Preis pro Einheit, km-Geld etc.) oder die Konditionen sind in diesem "
+                "Zeitraum nicht gültig.\n\n"
+                "Bitte trage die Konditionen für diesen Kunden in der Datenbank nach!"
             )
-            if not pfad:
-                return  # Benutzer hat abgebrochen
-            
-            generate_invoice(rechnung, pfad)
+            return
 
-            # --- UPSERT: Rechnung in die Datenbank schreiben ---
-            upsert_rechnung(rechnung, kdnr)
+        rechnung_nr = rechnung['rechnung_nr'] or vorschau
 
-            messagebox.showinfo("Erfolg", f"✅ Rechnung {rechnung_nr} gespeichert und in Datenbank verbucht:\n{pfad}")
-            
+        # --- Doppelte Abrechnung: bereits berechnete Besuche wurden ausgelassen ---
+        if bereits and not messagebox.askokcancel("Bereits abgerechnete Besuche", hinweis_abgerechnet + "\n\nRechnung ohne diese Besuche erstellen?"):
+            return
+
+        # --- Dateiname automatisch vorschlagen ---
+        vorgeschlagener_dateiname = f"{rechnung_nr}.pdf"
+
+        # Nutzer nach Speicherort fragen
+        pfad = filedialog.asksaveasfilename(
+            defaultextension=".pdf",
+            initialfile=vorgeschlagener_dateiname,
+            filetypes=[("PDF-Datei", "*.pdf")],
+            title="Rechnung speichern unter..."
+        )
+        if not pfad:
+            return  # Benutzer hat abgebrochen
+
+        self.executor.submit(
+            self._speichere_rechnung, rechnung, kdnr, pfad, vorgeschlagener_dateiname,
+            on_success=lambda ergebnis: messagebox.showinfo("Erfolg", "✅ Rechnung {} gespeichert und in Datenbank verbucht:\n{}{}".format(*ergebnis)),
+            busy_text=f"Erstelle PDF {rechnung_nr}...",
+            fehlertext="Rechnung konnte nicht erstellt werden"
+        )
+
+    @staticmethod
+    def _speichere_rechnung(rechnung, kdnr, pfad, vorgeschlagener_dateiname):
+        """Hintergrund: Rechnung verbuchen (vergibt die Nummer) und PDF rendern."""
+        # --- UPSERT: Rechnung in die Datenbank schreiben ---
+        rechnung_nr = upsert_rechnung(rechnung, kdnr)
+
+        # Vorgeschlagener Name, aber inzwischen hat ein anderer Client die Nummer vergeben
+        if os.path.basename(pfad) == vorgeschlagener_dateiname and vorgeschlagener_dateiname != f"{rechnung_nr}.pdf":
+            pfad = os.path.join(os.path.dirname(pfad), f"{rechnung_nr}.pdf")
+
+        try:
+            render_invoice(rechnung, pfad)
         except Exception as e:
-            messagebox.showerror("Fehler", f"Rechnung konnte nicht erstellt werden:\n{e}")
+            # Die Rechnung ist verbucht; erneutes Erstellen für den Zeitraum erzeugt sie mit derselben Nummer
+            raise RuntimeError(f"Rechnung {rechnung_nr} wurde verbucht, das PDF aber nicht erstellt ({e}).\n"
+                               "Bitte die Rechnung für denselben Zeitraum erneut erstellen.") from e
+
+        # --- Archiv: PDF unter seiner Prüfsumme ablegen; das gespeicherte PDF bleibt auch ohne gültig ---
+        import archiv
+        hinweis = ""
+        if archiv.archiv_cfg()["aktiv"]:
+            try:
+                archiv.archivieren(rechnung_nr, pfad)
+            except Exception as e:
+                hinweis = f"\n\n⚠️ PDF konnte nicht archiviert werden: {e}"
+        return rechnung_nr, pfad, hinweis
     
+    # Sammellauf für alle Kunden
+    def erstelle_alle_rechnungen(self):
+        """Erstellt die Rechnungen aller Kunden für den gewählten Zeitraum in einen Ordner."""
+        from monatsabrechnung import erstelle_alle_rechnungen, bericht_als_text
+
+        start_str = self.start_entry.get()
+        ende_str = self.end_entry.get()
+        nur_unberechnet = self.nur_unberechnet_var.get()
+
+        if not self._zeitraum_gueltig(start_str, ende_str):
+            return
+
+        zielordner = filedialog.askdirectory(title="Zielordner für alle Rechnungen wählen")
+        if not zielordner:
+            return  # Benutzer hat abgebrochen
+
+        self._sammellauf(
+            "Monatsabrechnung", "Lade Rechnungsdaten aller Kunden...", bericht_als_text,
+            erstelle_alle_rechnungen, start_str, ende_str, zielordner, nur_unberechnet=nur_unberechnet
+        )
+
+    # Mahnlauf für alle überfälligen Rechnungen
+    def erstelle_mahnungen(self):
+        """Erstellt Zahlungserinnerungen (Stufe 1) und Mahnungen (Stufe 2) für alle überfälligen Rechnungen."""
+        from mahnwesen import erstelle_mahnungen, bericht_als_text
+
+        zielordner = filedialog.askdirectory(title="Zielordner für die Mahnungen wählen")
+        if not zielordner:
+            return  # Benutzer hat abgebrochen
+
+        self._sammellauf("Mahnlauf", "Suche überfällige Rechnungen...", bericht_als_text, erstelle_mahnungen, zielordner)
+
+    def _sammellauf(self, titel, starttext, als_text, funktion, *args, **kwargs):
+        """
+        Führt einen Sammellauf (Monatsabrechnung, Mahnlauf) im Hintergrund aus, mit
+        Fortschrittsfenster, Abbrechen-Knopf und Bericht als Messagebox.
+        funktion muss fortschritt= und abbruch= annehmen und einen Bericht (dict) liefern.
+        """
+        # Fortschrittsanzeige
+        top = tk.Toplevel(self.master)
+        top.title(f"{titel} läuft...")
+        top.geometry("350x130")
+        top.transient(self.master)
+        status_var = tk.StringVar(value=starttext)
+        ttk.Label(top, textvariable=status_var).pack(pady=10)
+        progress = ttk.Progressbar(top, orient=tk.HORIZONTAL, length=300, mode="determinate")
+        progress.pack(pady=5)
+
+        abbruch = threading.Event()
+        def abbrechen():
+            abbruch.set()
+            status_var.set("Wird abgebrochen...")
+        ttk.Button(top, text="Abbrechen", command=abbrechen).pack(pady=5)
+        top.protocol("WM_DELETE_WINDOW", abbrechen)
+
+        def fortschritt(fertig, gesamt, rechnung_nr):
+            # Läuft im Hintergrund-Thread -> Anzeige im Tk-Thread aktualisieren
+            def anzeigen():
+                if top.winfo_exists() and not abbruch.is_set():
+                    progress.config(maximum=gesamt, value=fertig)
+                    status_var.set(f"{fertig}/{gesamt}: {rechnung_nr}")
+            self.executor.call_in_ui(anzeigen)
+
+        def fertig(bericht):
+            top.destroy()
+            if bericht["fehler"]:
+                messagebox.showwarning(f"{titel} mit Fehlern", als_text(bericht))
+            else:
+                messagebox.showinfo(f"{titel} abgeschlossen", als_text(bericht))
+
+        def fehler(e):
+            top.destroy()
+            messagebox.showerror("Fehler", f"{titel} fehlgeschlagen:\n{e}")
+
+        self.executor.submit(
+            funktion, *args, fortschritt=fortschritt, abbruch=abbruch, **kwargs,
+            on_success=fertig, on_error=fehler,
+            busy_text=f"{titel} läuft..."
+        )
+
+    # Rechnungsarchiv (alle Rechnungen, archivierte PDFs öffnen)
+    def rechnungsarchiv(self):
+        """Fenster mit dem Rechnungsindex: Suche nach Kunde/Nummer, Filter nach Status, PDF öffnen."""
+        top = tk.Toplevel(self.master)
+        top.title("Rechnungsarchiv")
+        top.geometry("760x400")
+
+        # Suchzeile
+        such_frame = ttk.Frame(top)
+        such_frame.pack(fill=tk.X, padx=10, pady=(10, 0))
+        ttk.Label(such_frame, text="Suche:").pack(side=tk.LEFT)
+        suche_var = tk.StringVar()
+        suche_entry = ttk.Entry(such_frame, textvariable=suche_var, width=30)
+        suche_entry.pack(side=tk.LEFT, padx=5)
+        status_var = tk.StringVar(value="alle")
+        ttk.Combobox(such_frame, textvariable=status_var, values=("alle", "offen", "bezahlt"),
+                     state="readonly", width=9).pack(side=tk.LEFT, padx=5)
+
+        frame = ttk.Frame(top)
+        frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        columns = ("nr", "datum", "kunde", "summe", "status", "pdf")
+        tree = ttk.Treeview(frame, columns=columns, show="headings")
+        for spalte, titel, breite in (("nr", "Rechnungs-Nr.", 90), ("datum", "Datum", 85), ("kunde", "Kunde", 250),
+                                      ("summe", "Summe (€)", 90), ("status", "Status", 70), ("pdf", "PDF", 50)):
+            tree.heading(spalte, text=titel)
+            tree.column(spalte, width=breite)
+        tree.column("summe", anchor=tk.E)
+        tree.column("pdf", anchor=tk.CENTER)
+        scrollbar = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=tree.yview)
+        tree.configure(yscroll=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        hinweis_var = tk.StringVar()
+        ttk.Label(top, textvariable=hinweis_var, foreground="gray").pack(anchor=tk.W, padx=10)
+
+        def suchen(*_):
+            from db import fetch_archiv
+            bezahlt = {"alle": None, "offen": False, "bezahlt": True}[status_var.get()]
+
+            def gefunden(zeilen):
+                if not tree.winfo_exists():
+                    return
+                tree.delete(*tree.get_children())
+                for r in zeilen:
+                    tree.insert("", tk.END, iid=r['rechnung_nr'], values=(
+                        r['rechnung_nr'], r['datum'], r['kunde'], f"{r['summe'] or 0:.2f}",
+                        "bezahlt" if r['bezahlt'] else "offen", "✓" if r['sha256'] else ""
+                    ))
+                hinweis_var.set(f"Nur die neuesten {ARCHIV_TREFFER} Treffer, bitte Suche eingrenzen."
+                                if len(zeilen) >= ARCHIV_TREFFER else f"{len(zeilen)} Rechnung(en)")
+
+            self.executor.submit(
+                fetch_archiv, suche_var.get(), bezahlt, limit=ARCHIV_TREFFER,
+                on_success=gefunden, busy_text="Durchsuche Rechnungsarchiv...",
+                fehlertext="Rechnungsarchiv konnte nicht geladen werden"
+            )
+
+        def ausgewaehlt():
+            rechnung_nr = tree.focus()
+            if not rechnung_nr:
+                messagebox.showwarning("Hinweis", "Bitte wähle zuerst eine Rechnung aus der Liste aus.", parent=top)
+            return rechnung_nr
+
+        def pdf_oeffnen(*_):
+            import archiv
+            rechnung_nr = ausgewaehlt()
+            if not rechnung_nr:
+                return
+
+            def geoeffnet(pfad):
+                if pfad is None:
+                    messagebox.showinfo("Rechnungsarchiv", f"Für {rechnung_nr} ist kein PDF archiviert.", parent=top)
+                else:
+                    archiv.oeffnen(pfad)
+
+            self.executor.submit(archiv.pdf_pfad, rechnung_nr, on_success=geoeffnet,
+                                 busy_text=f"Öffne {rechnung_nr}...", fehlertext="PDF konnte nicht geöffnet werden")
+
+        def aus_inhalt(art):
+            """Nachdruck bzw. Gutschrift aus dem gespeicherten Rechnungsinhalt (kein Besuchs-Abruf)."""
+            import nachdruck
+            rechnung_nr = ausgewaehlt()
+            if not rechnung_nr:
+                return
+            gutschrift = art == "gutschrift"
+            name = nachdruck.gutschrift_nr(rechnung_nr) if gutschrift else rechnung_nr
+            if gutschrift and not messagebox.askyesno(
+                    "Gutschrift", f"Gutschrift {name} über die gesamte Rechnung {rechnung_nr} erstellen?", parent=top):
+                return
+            ziel = filedialog.asksaveasfilename(parent=top, defaultextension=".pdf", initialfile=f"{name}.pdf",
+                                                filetypes=[("PDF-Datei", "*.pdf")],
+                                                title=f"{'Gutschrift' if gutschrift else 'Nachdruck'} speichern unter...")
+            if not ziel:
+                return
+
+            def fertig(bericht):
+                text = f"✅ {bericht['rechnung_nr']} gespeichert:\n{bericht['pfad']}"
+                messagebox.showinfo("Erfolg", "\n\n⚠️ ".join([text] + bericht["hinweise"]), parent=top)
+
+            self.executor.submit(nachdruck.gutschrift if gutschrift else nachdruck.nachdrucken, rechnung_nr, ziel,
+                                 on_success=fertig, busy_text=f"Erstelle {name}...",
+                                 fehlertext=f"{'Gutschrift' if gutschrift else 'Nachdruck'} fehlgeschlagen")
+
+        def pdf_speichern():
+            import archiv
+            rechnung_nr = ausgewaehlt()
+            if not rechnung_nr:
+                return
+            ziel = filedialog.asksaveasfilename(parent=top, defaultextension=".pdf", initialfile=f"{rechnung_nr}.pdf",
+                                                filetypes=[("PDF-Datei", "*.pdf")], title="Archivierte Rechnung speichern unter...")
+            if ziel:
+                self.executor.submit(archiv.exportieren, rechnung_nr, ziel,
+                                     on_success=lambda pfad: messagebox.showinfo("Erfolg", f"✅ Gespeichert:\n{pfad}", parent=top),
+                                     busy_text=f"Speichere {rechnung_nr}...", fehlertext="PDF konnte nicht gespeichert werden")
+
+        ttk.Button(such_frame, text="Suchen", command=suchen).pack(side=tk.LEFT)
+        suche_entry.bind("<Return>", suchen)
+        status_var.trace_add("write", suchen)
+        tree.bind("<Double-1>", pdf_oeffnen)
+
+        btn_frame = ttk.Frame(top)
+        btn_frame.pack(fill=tk.X, padx=10, pady=10)
+        ttk.Button(btn_frame, text="PDF öffnen", command=pdf_oeffnen).pack(side=tk.LEFT)
+        ttk.Button(btn_frame, text="PDF speichern unter...", command=pdf_speichern).pack(side=tk.LEFT, padx=5)
+        ttk.Button(btn_frame, text="Nachdruck...", command=lambda: aus_inhalt("nachdruck")).pack(side=tk.LEFT)
+        ttk.Button(btn_frame, text="Gutschrift...", command=lambda: aus_inhalt("gutschrift")).pack(side=tk.LEFT, padx=5)
+        ttk.Button(btn_frame, text="Schließen", command=top.destroy).pack(side=tk.RIGHT)
+
+        suche_entry.focus_set()
+        suchen()
+
     # Verwaltung offener Rechnungen
     def manage_invoices(self):
         """Öffnet ein neues Fenster zur Verwaltung unbezahlter Rechnungen."""
@@ -169,9 +599,26 @@ class InvoiceApp:
         self.tree.column("kunde", width=250)
         self.tree.column("summe", width=100, anchor=tk.E)
         
-        # Scrollbar für die Tabelle
+        # Zeilen nach Rechnungsnummer: Aktualisierungen ändern nur, was sich geändert hat
+        self.rechnungen_modell = TabellenModell(
+            self.tree,
+            schluessel=lambda r: r['rechnung_nr'],
+            werte=lambda r: (r['rechnung_nr'], r['datum'], r['kunde'], f"{r['summe']:.2f}"),
+            sortierung=lambda r: (r['rechnungsdatum'], r['rechnung_nr']),
+            absteigend=True
+        )
+        self._rechnungen_stand = None
+        self._rechnungen_laedt = False
+
+        # Scrollbar für die Tabelle; kurz vor dem Ende wird die nächste Seite nachgeladen
         scrollbar = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=self.tree.yview)
-        self.tree.configure(yscroll=scrollbar.set)
+
+        def gescrollt(erste, letzte):
+            scrollbar.set(erste, letzte)
+            if float(letzte) > 0.9:
+                self._naechste_rechnungsseite()
+
+        self.tree.configure(yscroll=gescrollt)
         
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
@@ -181,24 +628,78 @@ class InvoiceApp:
         btn_frame.pack(fill=tk.X, padx=10, pady=10)
         
         ttk.Button(btn_frame, text="Zahlungseingang verbuchen", command=self.mark_as_paid).pack(side=tk.LEFT)
+        ttk.Button(btn_frame, text="Teilzahlung erfassen", command=self.teilzahlung_erfassen).pack(side=tk.LEFT, padx=5)
         ttk.Button(btn_frame, text="Schließen", command=top.destroy).pack(side=tk.RIGHT)
         
-        # Daten initial laden
+        # Daten initial laden: erst das Wasserzeichen, dann die erste Seite. Was sich dazwischen
+        # ändert, holt die nächste Aktualisierung nach.
+        modell = self.rechnungen_modell
+
+        def erste_seite():
+            _, stand = fetch_rechnungsaenderungen()
+            return stand, fetch_offene_rechnungen(limit=RECHNUNGEN_SEITE)
+
+        def geladen(ergebnis):
+            if not modell.tree.winfo_exists() or modell is not self.rechnungen_modell:
+                return
+            self._rechnungen_stand, seite = ergebnis
+            modell.seite_anhaengen(seite, RECHNUNGEN_SEITE)
+            top.after(RECHNUNGEN_AKTUALISIERUNG_MS, self._rechnungen_periodisch, top, modell)
+
+        self.executor.submit(erste_seite, on_success=geladen, busy_text="Lade offene Rechnungen...",
+                             fehlertext="Fehler beim Laden der Rechnungen")
+
+    def _rechnungen_periodisch(self, top, modell):
+        """Holt bei geöffnetem Fenster regelmäßig die Änderungen anderer Clients."""
+        if not top.winfo_exists() or modell is not self.rechnungen_modell:
+            return
         self.load_open_invoices()
+        top.after(RECHNUNGEN_AKTUALISIERUNG_MS, self._rechnungen_periodisch, top, modell)
 
-    def load_open_invoices(self):
-        """Lädt die offenen Rechnungen aus der DB in die Tabelle."""
-        # Tabelle leeren
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-            
-        try:
-            offene = fetch_offene_rechnungen()
-            for r in offene:
-                self.tree.insert("", tk.END, values=(r['rechnung_nr'], r['datum'], r['kunde'], f"{r['summe']:.2f}"))
-        except Exception as e:
+    def _naechste_rechnungsseite(self):
+        modell = self.rechnungen_modell
+        if modell.vollstaendig or modell.grenze is None or self._rechnungen_laedt:
+            return
+        self._rechnungen_laedt = True
+
+        def geladen(seite):
+            self._rechnungen_laedt = False
+            if modell.tree.winfo_exists():
+                modell.seite_anhaengen(seite, RECHNUNGEN_SEITE)
+
+        def fehler(e):
+            self._rechnungen_laedt = False
             messagebox.showerror("Fehler", f"Fehler beim Laden der Rechnungen:\n{e}")
 
+        self.executor.submit(
+            fetch_offene_rechnungen, modell.grenze, RECHNUNGEN_SEITE,
+            on_success=geladen, on_error=fehler,
+            busy_text="Lade weitere Rechnungen..."
+        )
+
+    def load_open_invoices(self):
+        """Übernimmt nur die seit dem letzten Abruf geänderten Rechnungen in die Tabelle."""
+        modell = self.rechnungen_modell
+        if self._rechnungen_stand is None:
+            return  # erste Seite läuft noch
+
+        def geaendert(ergebnis):
+            # Fenster wurde inzwischen geschlossen oder neu geöffnet
+            if not modell.tree.winfo_exists() or modell is not self.rechnungen_modell:
+                return
+            zeilen, self._rechnungen_stand = ergebnis
+            modell.anwenden(
+                [r for r in zeilen if not r['bezahlt']],
+                entfernen=[r['rechnung_nr'] for r in zeilen if r['bezahlt']]
+            )
+
+        self.executor.submit(
+            fetch_rechnungsaenderungen, self._rechnungen_stand,
+            on_success=geaendert,
+            busy_text="Aktualisiere offene Rechnungen...",
+            fehlertext="Fehler beim Laden der Rechnungen"
+        )
+
     def mark_as_paid(self):
         """Markiert die ausgewählte Rechnung als bezahlt."""
         selected_item = self.tree.focus()
@@ -211,12 +712,51 @@ class InvoiceApp:
         kunde = item_data['values'][2]
         
         if messagebox.askyesno("Zahlungseingang", f"Wurde die Rechnung {rechnung_nr} von '{kunde}' wirklich bezahlt?"):
-            try:
-                mark_rechnung_bezahlt(rechnung_nr)
+            def bezahlt(_):
                 messagebox.showinfo("Erfolg", f"Rechnung {rechnung_nr} erfolgreich als bezahlt markiert!")
                 self.load_open_invoices() # Liste sofort aktualisieren
-            except Exception as e:
-                messagebox.showerror("Fehler", f"Fehler beim Speichern:\n{e}")
+
+            self.executor.submit(
+                mark_rechnung_bezahlt, rechnung_nr,
+                on_success=bezahlt,
+                busy_text="Verbuche Zahlungseingang...",
+                fehlertext="Fehler beim Speichern"
+            )
+
+    def teilzahlung_erfassen(self):
+        """Verbucht einen Teilbetrag zur ausgewählten Rechnung; Verzugszinsen laufen nur noch auf den Rest."""
+        selected_item = self.tree.focus()
+        if not selected_item:
+            messagebox.showwarning("Hinweis", "Bitte wähle zuerst eine Rechnung aus der Liste aus.")
+            return
+
+        item_data = self.tree.item(selected_item)
+        rechnung_nr = item_data['values'][0]
+        eingabe = simpledialog.askstring("Teilzahlung", f"Eingegangener Betrag für Rechnung {rechnung_nr} (€):", parent=self.tree)
+        if not eingabe:
+            return
+        try:
+            betrag = Decimal(eingabe.strip().replace(".", "").replace(",", "."))
+        except InvalidOperation:
+            messagebox.showerror("Fehler", f"'{eingabe}' ist kein gültiger Betrag.")
+            return
+        if betrag <= 0:
+            messagebox.showerror("Fehler", "Der Betrag muss größer als 0 sein.")
+            return
+
+        def verbucht(bezahlt):
+            if bezahlt:
+                messagebox.showinfo("Erfolg", f"Rechnung {rechnung_nr} ist damit vollständig bezahlt.")
+            else:
+                messagebox.showinfo("Erfolg", f"Teilzahlung über {betrag:.2f} € zu Rechnung {rechnung_nr} verbucht.")
+            self.load_open_invoices()
+
+        self.executor.submit(
+            erfasse_zahlung, rechnung_nr, betrag,
+            on_success=verbucht,
+            busy_text="Verbuche Teilzahlung...",
+            fehlertext="Fehler beim Speichern"
+        )
 
     # NEU: KUNDEN & KONDITIONEN VERWALTEN
     def manage_customers(self):
@@ -229,9 +769,10 @@ class InvoiceApp:
         sel_frame.pack(fill=tk.X, padx=10, pady=10)
         ttk.Label(sel_frame, text="Kunde wählen:").pack(side=tk.LEFT, padx=5)
         self.mng_kunde_var = tk.StringVar()
-        mng_dropdown = ttk.Combobox(sel_frame, textvariable=self.mng_kunde_var, values=list(self.kunden_dict.keys()), state="readonly", width=40)
+        mng_dropdown = ttk.Combobox(sel_frame, textvariable=self.mng_kunde_var, values=self.kunden_index.alle(), width=40)
         mng_dropdown.pack(side=tk.LEFT, padx=5)
         mng_dropdown.bind("<<ComboboxSelected>>", self.load_customer_data_into_form)
+        self._tippsuche(mng_dropdown)
 
         # Variablen für die Formularfelder
         self.f_name = tk.StringVar()
@@ -300,105 +841,126 @@ class InvoiceApp:
             self.gueltig_ab_entry.config(state="normal")
 
     def load_customer_data_into_form(self, event=None):
-        auswahl = self.mng_kunde_var.get()
-        if not auswahl: return
-        kdnr = self.kunden_dict[auswahl]
+        kdnr = self.kunden_index.kdnr(self.mng_kunde_var.get())
+        if kdnr is None: return
+
+        self.executor.submit(
+            fetch_kunde_details, kdnr,
+            on_success=self._kunde_in_formular,
+            busy_text="Lade Kundendaten...",
+            fehlertext="Daten konnten nicht geladen werden"
+        )
 
-        try:
-            details = fetch_kunde_details(kdnr)
-            if details:
-                self.f_name.set(details['name'])
-                self.f_kuerzel.set(details['kuerzel'])
-                self.f_ansprechpartner.set(details['ansprechpartner'])
-                self.f_strasse.set(details['strasse'])
-                self.f_hausnr.set(details['hausnummer'])
-                self.f_plz.set(details['plz'])
-                self.f_ort.set(details['ort'])
-
-                self.f_preis.set(details['preis'])
-                self.f_dauer.set(details['dauer'])
-                self.f_strecke.set(details['strecke'])
-                self.f_kmgeld.set(details['km_geld'])
-
-                # Originale Konditionen merken, um zu prüfen, ob sie geändert wurden
-                self.orig_konditionen = {
-                    "preis": details['preis'],
-                    "dauer": details['dauer'],
-                    "strecke": details['strecke'],
-                    "km_geld": details['km_geld']
-                }
-                
-                # Datum auf heute setzen für potentielle Änderungen
-                self.gueltig_ab_entry.set_date(datetime.now().date())
-
-                # Dynamischer Titel für den Konditionen-Rahmen
-                gueltig_von_str = details.get('gueltig_von', 'Unbekannt')
-                self.kond_frame.config(text=f"Aktuelle Konditionen (Gültig seit: {gueltig_von_str})")
-                
-                # Checkbox zurücksetzen
-                self.f_tippfehler.set(False)
-                self.toggle_kondition_mode()
+    def _kunde_in_formular(self, details):
+        # Fenster wurde inzwischen geschlossen
+        if not self.cust_top.winfo_exists():
+            return
 
-        except Exception as e:
-            messagebox.showerror("Fehler", f"Daten konnten nicht geladen werden:\n{e}")
+        if details:
+            self.f_name.set(details['name'])
+            self.f_kuerzel.set(details['kuerzel'])
+            self.f_ansprechpartner.set(details['ansprechpartner'])
+            self.f_strasse.set(details['strasse'])
+            self.f_hausnr.set(details['hausnummer'])
+            self.f_plz.set(details['plz'])
+            self.f_ort.set(details['ort'])
+
+            self.f_preis.set(details['preis'])
+            self.f_dauer.set(details['dauer'])
+            self.f_strecke.set(details['strecke'])
+            self.f_kmgeld.set(details['km_geld'])
+
+            # Originale Konditionen merken, um zu prüfen, ob sie geändert wurden
+            self.orig_konditionen = {
+                "preis": details['preis'],
+                "dauer": details['dauer'],
+                "strecke": details['strecke'],
+                "km_geld": details['km_geld'],
+                "gueltig_von": details['gueltig_von_datum']
+            }
+            
+            # Datum auf heute setzen für potentielle Änderungen
+            self.gueltig_ab_entry.set_date(datetime.now().date())
+
+            # Dynamischer Titel für den Konditionen-Rahmen
+            gueltig_von_str = details.get('gueltig_von', 'Unbekannt')
+            self.kond_frame.config(text=f"Aktuelle Konditionen (Gültig seit: {gueltig_von_str})")
+            
+            # Checkbox zurücksetzen
+            self.f_tippfehler.set(False)
+            self.toggle_kondition_mode()
 
     def save_customer_data(self):
-        auswahl = self.mng_kunde_var.get()
-        if not auswahl:
-            messagebox.showwarning("Hinweis", "Bitte zuerst einen Kunden auswählen.")
+        kdnr = self._gewaehlter_kunde(self.mng_kunde_var.get())
+        if kdnr is None:
             return
-        
-        kdnr = self.kunden_dict[auswahl]
 
+        # Formularwerte im Tk-Thread auslesen
+        stamm_daten = {
+            "name": self.f_name.get(),
+            "kuerzel": self.f_kuerzel.get(),
+            "ansprechpartner": self.f_ansprechpartner.get(),
+            "strasse": self.f_strasse.get(),
+            "hausnummer": self.f_hausnr.get(),
+            "plz": self.f_plz.get(),
+            "ort": self.f_ort.get()
+        }
         try:
-            # 1. Stammdaten speichern (immer)
-            stamm_daten = {
-                "name": self.f_name.get(),
-                "kuerzel": self.f_kuerzel.get(),
-                "ansprechpartner": self.f_ansprechpartner.get(),
-                "strasse": self.f_strasse.get(),
-                "hausnummer": self.f_hausnr.get(),
-                "plz": self.f_plz.get(),
-                "ort": self.f_ort.get()
-            }
-            update_kunde_stammdaten(kdnr, stamm_daten)
-
-            # 2. Prüfen, ob Konditionen geändert wurden
             neu_preis = self.f_preis.get()
             neu_dauer = self.f_dauer.get()
             neu_strecke = self.f_strecke.get()
             neu_kmgeld = self.f_kmgeld.get()
+        except tk.TclError as e:
+            messagebox.showerror("Fehler", f"Speichern fehlgeschlagen:\n{e}")
+            return
+        tippfehler = self.f_tippfehler.get()
+        gueltig_ab = self.gueltig_ab_entry.get()
+        orig = dict(self.orig_konditionen)
+
+        # Prüfen, ob Konditionen geändert wurden
+        konditionen_geandert = (
+            neu_preis != orig.get('preis') or
+            neu_dauer != orig.get('dauer') or
+            neu_strecke != orig.get('strecke') or
+            neu_kmgeld != orig.get('km_geld')
+        )
+        # Neue Version erst nach Beginn der aktuellen (db.py prüft beim Speichern noch einmal)
+        if (konditionen_geandert and not tippfehler and orig.get('gueltig_von') is not None
+                and self.gueltig_ab_entry.get_date() <= orig['gueltig_von']):
+            messagebox.showerror("Ungültiges Datum", konditionen_datum_fehler(orig['gueltig_von']))
+            return
 
-            konditionen_geandert = (
-                neu_preis != self.orig_konditionen.get('preis') or
-                neu_dauer != self.orig_konditionen.get('dauer') or
-                neu_strecke != self.orig_konditionen.get('strecke') or
-                neu_kmgeld != self.orig_konditionen.get('km_geld')
-            )
+        def speichern():
+            # 1. Stammdaten speichern (immer)
+            update_kunde_stammdaten(kdnr, stamm_daten)
 
-            # 3. Wenn geändert -> Versionieren!
+            # 2. Wenn Konditionen geändert -> Versionieren!
             if konditionen_geandert:
-                if self.f_tippfehler.get():
+                if tippfehler:
                     # Nur Update ausführen (Tippfehler)
                     correct_kunde_konditionen(kdnr, neu_preis, neu_dauer, neu_strecke, neu_kmgeld)
-                    msg = "Stammdaten und Tippfehler in den Konditionen erfolgreich gespeichert!"
-                else:
-                    # Neue Version anlegen (Preiserhöhung etc.)
-                    gueltig_ab = self.gueltig_ab_entry.get()
-                    update_kunde_konditionen(kdnr, neu_preis, neu_dauer, neu_strecke, neu_kmgeld, gueltig_ab)
-                    msg = "Stammdaten gespeichert und NEUE Konditionen-Version erfolgreich angelegt!"
-            else:
-                msg = "Stammdaten erfolgreich gespeichert! (Konditionen blieben unverändert)"
+                    return "Stammdaten und Tippfehler in den Konditionen erfolgreich gespeichert!"
+                # Neue Version anlegen (Preiserhöhung etc.)
+                update_kunde_konditionen(kdnr, neu_preis, neu_dauer, neu_strecke, neu_kmgeld, gueltig_ab)
+                return "Stammdaten gespeichert und NEUE Konditionen-Version erfolgreich angelegt!"
+            return "Stammdaten erfolgreich gespeichert! (Konditionen blieben unverändert)"
 
+        def gespeichert(msg):
             messagebox.showinfo("Erfolg", msg)
             
-            # Haupt-Dropdown (in InvoiceApp) sicherheitshalber neu laden
+            # Geänderten Kunden sofort im Index ersetzen; der Abgleich holt Änderungen anderer Clients
+            self.kunden_index.aktualisieren({"kdnr": kdnr, "name": stamm_daten["name"],
+                                             "kuerzel": stamm_daten["kuerzel"], "ort": stamm_daten["ort"]})
+            self.kunde_dropdown['values'] = self.kunden_index.alle()
             self.lade_kunden() 
             self.cust_top.destroy()
 
-        except Exception as e:
-            messagebox.showerror("Fehler", f"Speichern fehlgeschlagen:\n{e}")
-
+        self.executor.submit(
+            speichern,
+            on_success=gespeichert,
+            busy_text="Speichere Kundendaten...",
+            fehlertext="Speichern fehlgeschlagen"
+        )
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
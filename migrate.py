@@ -0,0 +1,232 @@
+"""
+Versionierte Schema-Migrationen für die kundendatenbank.
+
+  python migrate.py            alle offenen Migrationen aus migrations/ anwenden
+  python migrate.py --status   angewendete und offene Migrationen anzeigen
+  python migrate.py --pruefen  EXPLAIN-Prüfung: nutzen die wichtigen Abfragen ihre Indizes?
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import sys
+
+from app_config import BASE_DIR
+from db import get_connection
+
+MIGRATIONS_DIR = os.path.join(BASE_DIR, "migrations")
+_DATEINAME = re.compile(r"^(\d{4})_(\w+)\.sql$")
+
+# Beliebige, feste Zahl: verhindert, dass zwei Clients gleichzeitig migrieren
+_ADVISORY_LOCK_ID = 7324101
+
+# --- EXPLAIN-Regressionsprüfungen ---
+# (Name, SQL, Parameter, erlaubte Indizes). Mit enable_seqscan = off geplant, damit die Prüfung
+# auch auf kleinen Tabellen aussagekräftig ist: Taucht keiner der Indizes im Plan auf,
+# kann die Abfrage den Index gar nicht nutzen (z.B. nach einer Umformulierung).
+PLAN_PRUEFUNGEN = [
+    (
+        "Besuche eines Kunden im Zeitraum",
+        "SELECT termin, anzahl_einheiten, bemerkung FROM besuch WHERE kdnr = %s AND termin BETWEEN %s AND %s ORDER BY termin",
+        (10001, "2025-10-01 00:00:00", "2025-10-31 23:59:59"),
+        {"ix_besuch_kdnr_termin"}
+    ),
+    (
+        "Besuche aller Kunden im Zeitraum (Monatsabrechnung)",
+        "SELECT kdnr, termin FROM besuch WHERE termin BETWEEN %s AND %s",
+        ("2025-10-01 00:00:00", "2025-10-31 23:59:59"),
+        {"ix_besuch_termin", "ix_besuch_kdnr_termin"}
+    ),
+    (
+        "Gültige Kondition eines Kunden",
+        "SELECT kondition_id FROM kondition WHERE kdnr = %s AND gueltig_von <= %s",
+        (10001, "2025-10-15"),
+        {"ix_kondition_kdnr_gueltig", "kondition_keine_ueberlappung"}
+    ),
+    (
+        "Unberechnete Besuche eines Kunden bis Stichtag",
+        "SELECT besuch_id, termin FROM besuch WHERE kdnr = %s AND termin <= %s AND rechnung_id IS NULL ORDER BY termin",
+        (10001, "2025-10-31 23:59:59"),
+        {"ix_besuch_unberechnet"}
+    ),
+    (
+        "Besuche einer Rechnung",
+        "SELECT besuch_id FROM besuch WHERE rechnung_id = %s",
+        (1,),
+        {"ix_besuch_rechnung"}
+    ),
+    (
+        "Offene Rechnungen",
+        "SELECT r.rechnung_nr, r.rechnungsdatum, r.summe FROM rechnung r WHERE r.bezahlt = false ORDER BY r.rechnungsdatum DESC",
+        (),
+        {"ix_rechnung_offen"}
+    ),
+    (
+        "Offene Rechnungen, nächste Seite",
+        "SELECT r.rechnung_nr FROM rechnung r WHERE r.bezahlt = false AND (r.rechnungsdatum, r.rechnung_nr) < (%s, %s) "
+        "ORDER BY r.rechnungsdatum DESC, r.rechnung_nr DESC LIMIT 200",
+        ("2025-10-01", "2510-001"),
+        {"ix_rechnung_offen"}
+    ),
+    (
+        "Geänderte Rechnungen seit Wasserzeichen",
+        "SELECT rechnung_nr, bezahlt FROM rechnung WHERE geaendert_am > %s ORDER BY geaendert_am",
+        ("2025-10-17 12:00:00+00",),
+        {"ix_rechnung_geaendert"}
+    ),
+    (
+        "Kundensuche (Trigramm)",
+        "SELECT kdnr FROM kunde WHERE kunde_suchtext(name, kuerzel, ort) ILIKE %s OR %s <%% kunde_suchtext(name, kuerzel, ort)",
+        ("%klinik%", "klinik"),
+        {"ix_kunde_suche"}
+    ),
+    (
+        "Rechnungsarchiv, neueste zuerst",
+        "SELECT r.rechnung_nr FROM rechnung r WHERE r.rechnungsdatum BETWEEN %s AND %s "
+        "ORDER BY r.rechnungsdatum DESC, r.rechnung_nr DESC LIMIT 500",
+        ("2025-01-01", "2025-12-31"),
+        {"ix_rechnung_datum"}
+    ),
+    (
+        "Archivierte Fassung einer Rechnung",
+        "SELECT sha256 FROM rechnung_pdf WHERE rechnung_id = %s ORDER BY erstellt_am DESC, pdf_id DESC LIMIT 1",
+        (1,),
+        {"ix_rechnung_pdf_rechnung", "uk_rechnung_pdf"}
+    ),
+    (
+        "Überfällige Rechnungen (Mahnlauf)",
+        "SELECT rechnung_id FROM rechnung WHERE bezahlt = false AND rechnungsdatum <= %s AND mahnstufe < 2 "
+        "AND (gemahnt_am IS NULL OR gemahnt_am <= %s)",
+        ("2025-10-10", "2025-10-17"),
+        {"ix_rechnung_offen"}
+    ),
+]
+
+
+def finde_migrationen():
+    """Liefert [(version, name, pfad)] sortiert nach Version."""
+    migrationen = []
+    for pfad in sorted(glob.glob(os.path.join(MIGRATIONS_DIR, "*.sql"))):
+        treffer = _DATEINAME.match(os.path.basename(pfad))
+        if treffer:
+            migrationen.append((treffer.group(1), treffer.group(2), pfad))
+    return migrationen
+
+
+def _checksumme(pfad):
+    with open(pfad, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _angewendet(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migration (
+            version       TEXT PRIMARY KEY,
+            name          TEXT NOT NULL,
+            checksumme    TEXT NOT NULL,
+            angewendet_am TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+    """)
+    cur.execute("SELECT version, checksumme FROM schema_migration ORDER BY version;")
+    return dict(cur.fetchall())
+
+
+def migrieren():
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(%s);", (_ADVISORY_LOCK_ID,))
+            angewendet = _angewendet(cur)
+            conn.commit()
+
+            for version, name, pfad in finde_migrationen():
+                checksumme = _checksumme(pfad)
+                if version in angewendet:
+                    if angewendet[version] != checksumme:
+                        print(f"⚠️ {version}_{name}: Datei wurde nach dem Anwenden verändert!")
+                    continue
+
+                with open(pfad, encoding="utf-8") as f:
+                    sql = f.read()
+                try:
+                    # Jede Migration in einer eigenen Transaktion: ganz oder gar nicht
+                    cur.execute(sql)
+                    cur.execute(
+                        "INSERT INTO schema_migration (version, name, checksumme) VALUES (%s, %s, %s);",
+                        (version, name, checksumme)
+                    )
+                    conn.commit()
+                    print(f"✅ {version}_{name} angewendet")
+                except Exception as e:
+                    conn.rollback()
+                    print(f"❌ {version}_{name} fehlgeschlagen: {e}")
+                    return False
+
+            cur.execute("SELECT pg_advisory_unlock(%s);", (_ADVISORY_LOCK_ID,))
+            conn.commit()
+        return True
+    finally:
+        conn.close()
+
+
+def status():
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            angewendet = _angewendet(cur)
+        conn.commit()
+    finally:
+        conn.close()
+    for version, name, _ in finde_migrationen():
+        print(f"{'✅' if version in angewendet else '⏳'} {version}_{name}")
+
+
+def _index_namen(plan):
+    """Sammelt rekursiv alle 'Index Name'-Einträge eines EXPLAIN-JSON-Plans."""
+    namen = set()
+    if "Index Name" in plan:
+        namen.add(plan["Index Name"])
+    for unterplan in plan.get("Plans", []):
+        namen |= _index_namen(unterplan)
+    return namen
+
+
+def plaene_pruefen():
+    """EXPLAIN-Prüfung aller PLAN_PRUEFUNGEN. Gibt True zurück, wenn alle Abfragen ihre Indizes nutzen."""
+    conn = get_connection()
+    alles_ok = True
+    try:
+        with conn.cursor() as cur:
+            for name, sql, params, erwartet in PLAN_PRUEFUNGEN:
+                cur.execute("SET LOCAL enable_seqscan = off;")
+                cur.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+                plan = cur.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                genutzt = _index_namen(plan[0]["Plan"])
+                conn.rollback()
+
+                if genutzt & erwartet:
+                    print(f"✅ {name}: {', '.join(sorted(genutzt & erwartet))}")
+                else:
+                    alles_ok = False
+                    print(f"❌ {name}: erwartet {' oder '.join(sorted(erwartet))}, genutzt: {', '.join(sorted(genutzt)) or 'kein Index'}")
+    finally:
+        conn.close()
+    return alles_ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Schema-Migrationen der kundendatenbank")
+    parser.add_argument("--status", action="store_true", help="Migrationsstand anzeigen")
+    parser.add_argument("--pruefen", action="store_true", help="EXPLAIN-Prüfung der wichtigsten Abfragen")
+    args = parser.parse_args()
+
+    if args.status:
+        status()
+    elif args.pruefen:
+        sys.exit(0 if plaene_pruefen() else 1)
+    else:
+        sys.exit(0 if migrieren() else 1)
@@ -0,0 +1,47 @@
+-- Basisschema der kundendatenbank.
+-- IF NOT EXISTS: auf der bestehenden Datenbank (Tabellen von Hand angelegt) ändert sich nichts,
+-- eine neue Datenbank (z.B. Test oder Wiederherstellung) bekommt das komplette Schema.
+
+CREATE TABLE IF NOT EXISTS kunde (
+    kdnr            SERIAL PRIMARY KEY,
+    name            TEXT NOT NULL,
+    kuerzel         TEXT NOT NULL,
+    ansprechpartner TEXT,
+    strasse         TEXT,
+    hausnummer      TEXT,
+    plz             TEXT,
+    ort             TEXT
+);
+
+CREATE TABLE IF NOT EXISTS kondition (
+    kondition_id      SERIAL PRIMARY KEY,
+    kdnr              INTEGER NOT NULL REFERENCES kunde (kdnr),
+    gueltig_von       DATE NOT NULL,
+    gueltig_bis       DATE,
+    preis_pro_einheit NUMERIC(10, 2) NOT NULL,
+    einheitsdauer_min INTEGER NOT NULL,
+    fahrtstrecke_km   NUMERIC(8, 2) NOT NULL DEFAULT 0,
+    km_geld           NUMERIC(6, 2) NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS besuch (
+    besuch_id        SERIAL PRIMARY KEY,
+    kdnr             INTEGER NOT NULL REFERENCES kunde (kdnr),
+    termin           TIMESTAMP NOT NULL,
+    anzahl_einheiten INTEGER NOT NULL,
+    bemerkung        TEXT
+);
+
+CREATE TABLE IF NOT EXISTS rechnung (
+    rechnung_id                SERIAL PRIMARY KEY,
+    rechnung_nr                TEXT NOT NULL CONSTRAINT uk_rechnung_nr UNIQUE,
+    kdnr                       INTEGER NOT NULL REFERENCES kunde (kdnr),
+    kondition_id               INTEGER REFERENCES kondition (kondition_id),
+    rechnungsdatum             DATE NOT NULL DEFAULT CURRENT_DATE,
+    summe                      NUMERIC(10, 2),
+    preis_pro_einheit_snapshot NUMERIC(10, 2),
+    einheitsdauer_min_snapshot INTEGER,
+    fahrtstrecke_km_snapshot   NUMERIC(8, 2),
+    km_geld_snapshot           NUMERIC(6, 2),
+    bezahlt                    BOOLEAN NOT NULL DEFAULT false
+);
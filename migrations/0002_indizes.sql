@@ -0,0 +1,28 @@
+-- Indizes für die häufigen Abfragen (siehe PLAN_PRUEFUNGEN in migrate.py)
+
+-- Rechnungsdaten eines Kunden: besuch WHERE kdnr = ? AND termin BETWEEN ? AND ?
+CREATE INDEX IF NOT EXISTS ix_besuch_kdnr_termin ON besuch (kdnr, termin);
+
+-- Monatsabrechnung aller Kunden: besuch WHERE termin BETWEEN ? AND ?
+CREATE INDEX IF NOT EXISTS ix_besuch_termin ON besuch (termin);
+
+-- Konditionen eines Kunden (Versionen nach Gültigkeitsbeginn)
+CREATE INDEX IF NOT EXISTS ix_kondition_kdnr_gueltig ON kondition (kdnr, gueltig_von);
+
+-- Offene Rechnungen: nur unbezahlte Zeilen, sortiert nach Datum
+CREATE INDEX IF NOT EXISTS ix_rechnung_offen ON rechnung (rechnungsdatum DESC) WHERE bezahlt = false;
+
+CREATE INDEX IF NOT EXISTS ix_rechnung_kdnr ON rechnung (kdnr);
+
+-- Gültigkeitszeiträume der Konditionen eines Kunden dürfen sich nicht überschneiden,
+-- sonst würde ein Besuch doppelt berechnet. Schlägt fehl, falls bereits Überschneidungen existieren.
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'kondition_keine_ueberlappung') THEN
+        ALTER TABLE kondition ADD CONSTRAINT kondition_keine_ueberlappung
+            EXCLUDE USING gist (kdnr WITH =, daterange(gueltig_von, gueltig_bis, '[]') WITH &&);
+    END IF;
+END
+$$;
@@ -0,0 +1,7 @@
+-- Offline-Erfassung: jeder Besuch bekommt auf dem Handy einen eindeutigen Schlüssel.
+-- Wiederholte Übertragungen (z.B. nach Verbindungsabbruch) legen so keinen zweiten Besuch an.
+ALTER TABLE besuch ADD COLUMN IF NOT EXISTS idempotenz_schluessel UUID;
+
+CREATE UNIQUE INDEX IF NOT EXISTS ux_besuch_idempotenz
+    ON besuch (idempotenz_schluessel)
+    WHERE idempotenz_schluessel IS NOT NULL;
@@ -0,0 +1,36 @@
+-- Abgerechnete Besuche: jeder Besuch verweist auf die Rechnung, mit der er berechnet wurde.
+
+ALTER TABLE besuch ADD COLUMN IF NOT EXISTS rechnung_id INTEGER REFERENCES rechnung (rechnung_id);
+
+-- Abrechnung "alle offenen Besuche bis Datum X": nur die noch nicht berechneten Zeilen
+CREATE INDEX IF NOT EXISTS ix_besuch_unberechnet ON besuch (kdnr, termin) WHERE rechnung_id IS NULL;
+
+-- Besuche einer Rechnung (Neuerstellung, Freigabe)
+CREATE INDEX IF NOT EXISTS ix_besuch_rechnung ON besuch (rechnung_id) WHERE rechnung_id IS NOT NULL;
+
+-- Doppelte Abrechnung verhindern: ein bereits berechneter Besuch kann keiner anderen Rechnung
+-- zugeordnet werden; freigeben (NULL) geht nur, solange seine Rechnung nicht bezahlt ist.
+CREATE OR REPLACE FUNCTION besuch_abrechnung_schuetzen() RETURNS trigger AS $$
+DECLARE
+    alte_nr TEXT;
+    alte_bezahlt BOOLEAN;
+BEGIN
+    IF OLD.rechnung_id IS NOT NULL AND NEW.rechnung_id IS DISTINCT FROM OLD.rechnung_id THEN
+        SELECT rechnung_nr, bezahlt INTO alte_nr, alte_bezahlt FROM rechnung WHERE rechnung_id = OLD.rechnung_id;
+        IF NEW.rechnung_id IS NOT NULL THEN
+            RAISE EXCEPTION 'Besuch % vom % ist bereits in Rechnung % abgerechnet', OLD.besuch_id, OLD.termin::date, alte_nr
+                USING ERRCODE = 'unique_violation';
+        END IF;
+        IF alte_bezahlt THEN
+            RAISE EXCEPTION 'Besuch % gehört zur bezahlten Rechnung % und kann nicht freigegeben werden', OLD.besuch_id, alte_nr
+                USING ERRCODE = 'integrity_constraint_violation';
+        END IF;
+    END IF;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_besuch_abrechnung ON besuch;
+CREATE TRIGGER trg_besuch_abrechnung
+    BEFORE UPDATE OF rechnung_id ON besuch
+    FOR EACH ROW EXECUTE FUNCTION besuch_abrechnung_schuetzen();
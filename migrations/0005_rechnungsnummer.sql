@@ -0,0 +1,15 @@
+-- Fortlaufender Nummernkreis pro Monat: YYMM-NNN (siehe reserviere_rechnungsnummern in db.py).
+-- Eine Zeile pro Monat; ein Block wird mit einem einzigen UPDATE ... RETURNING reserviert.
+
+CREATE TABLE IF NOT EXISTS rechnungsnummer (
+    monat     CHAR(4) PRIMARY KEY,
+    letzte_nr INTEGER NOT NULL CHECK (letzte_nr >= 0)
+);
+
+-- Zähler aus bereits vorhandenen Rechnungen im neuen Format übernehmen
+INSERT INTO rechnungsnummer (monat, letzte_nr)
+SELECT left(rechnung_nr, 4), max(split_part(rechnung_nr, '-', 2)::int)
+FROM rechnung
+WHERE rechnung_nr ~ '^\d{4}-\d{3,}$'
+GROUP BY left(rechnung_nr, 4)
+ON CONFLICT (monat) DO UPDATE SET letzte_nr = GREATEST(rechnungsnummer.letzte_nr, EXCLUDED.letzte_nr);
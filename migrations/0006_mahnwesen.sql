@@ -0,0 +1,16 @@
+-- Mahnwesen: aktuelle Mahnstufe je Rechnung und Verlauf aller versendeten Mahnungen.
+
+ALTER TABLE rechnung ADD COLUMN IF NOT EXISTS mahnstufe SMALLINT NOT NULL DEFAULT 0;
+ALTER TABLE rechnung ADD COLUMN IF NOT EXISTS gemahnt_am DATE;
+
+CREATE TABLE IF NOT EXISTS mahnung (
+    mahnung_id  SERIAL PRIMARY KEY,
+    rechnung_id INTEGER NOT NULL REFERENCES rechnung (rechnung_id),
+    stufe       SMALLINT NOT NULL CHECK (stufe BETWEEN 1 AND 2),
+    datum       DATE NOT NULL,
+    frist       DATE NOT NULL,
+    -- Jede Stufe höchstens einmal pro Rechnung, auch bei parallelen Läufen
+    CONSTRAINT uk_mahnung_stufe UNIQUE (rechnung_id, stufe)
+);
+
+-- Die Suche nach überfälligen Rechnungen nutzt ix_rechnung_offen (rechnungsdatum WHERE bezahlt = false)
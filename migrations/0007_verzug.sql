@@ -0,0 +1,28 @@
+-- Verzugszinsen und Teilzahlungen (siehe verzug.py).
+
+-- Basiszinssatz nach § 247 BGB, wechselt zum 1. Januar und 1. Juli.
+-- Neue Sätze (Bekanntgabe der Deutschen Bundesbank) per INSERT nachtragen.
+CREATE TABLE IF NOT EXISTS basiszins (
+    gueltig_ab DATE PRIMARY KEY,
+    satz       NUMERIC(5, 2) NOT NULL
+);
+
+INSERT INTO basiszins (gueltig_ab, satz) VALUES
+    ('2016-07-01', -0.88),
+    ('2023-01-01', 1.62),
+    ('2023-07-01', 3.12),
+    ('2024-01-01', 3.62),
+    ('2024-07-01', 3.37),
+    ('2025-01-01', 2.27),
+    ('2025-07-01', 1.27)
+ON CONFLICT (gueltig_ab) DO NOTHING;
+
+-- Zahlungseingänge, auch Teilbeträge; mark_rechnung_bezahlt bleibt für den Komplettausgleich
+CREATE TABLE IF NOT EXISTS zahlung (
+    zahlung_id  SERIAL PRIMARY KEY,
+    rechnung_id INTEGER NOT NULL REFERENCES rechnung (rechnung_id),
+    datum       DATE NOT NULL DEFAULT CURRENT_DATE,
+    betrag      NUMERIC(10, 2) NOT NULL CHECK (betrag > 0)
+);
+
+CREATE INDEX IF NOT EXISTS ix_zahlung_rechnung ON zahlung (rechnung_id);
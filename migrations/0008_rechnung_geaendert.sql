@@ -0,0 +1,37 @@
+-- Inkrementelle Aktualisierung der Rechnungsliste: jede Rechnung trägt den Zeitpunkt ihrer
+-- letzten Änderung, Clients holen nur Zeilen nach ihrem letzten Stand (Wasserzeichen).
+
+ALTER TABLE rechnung ADD COLUMN IF NOT EXISTS geaendert_am TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp();
+
+CREATE INDEX IF NOT EXISTS ix_rechnung_geaendert ON rechnung (geaendert_am);
+
+CREATE OR REPLACE FUNCTION rechnung_geaendert_setzen() RETURNS trigger AS $$
+BEGIN
+    NEW.geaendert_am := clock_timestamp();
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_rechnung_geaendert ON rechnung;
+CREATE TRIGGER trg_rechnung_geaendert
+    BEFORE UPDATE ON rechnung
+    FOR EACH ROW EXECUTE FUNCTION rechnung_geaendert_setzen();
+
+-- Die Liste zeigt den Kundennamen: eine Umbenennung markiert die offenen Rechnungen des Kunden
+CREATE OR REPLACE FUNCTION kunde_name_geaendert() RETURNS trigger AS $$
+BEGIN
+    UPDATE rechnung SET geaendert_am = clock_timestamp() WHERE kdnr = NEW.kdnr AND bezahlt = false;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_kunde_name_geaendert ON kunde;
+CREATE TRIGGER trg_kunde_name_geaendert
+    AFTER UPDATE OF name ON kunde
+    FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name)
+    EXECUTE FUNCTION kunde_name_geaendert();
+
+-- Seitenweises Laden (Keyset über rechnungsdatum, rechnung_nr): die Rechnungsnummer gehört
+-- mit in den Index, damit die Sortierung eindeutig ist und ohne Sort-Schritt auskommt
+DROP INDEX IF EXISTS ix_rechnung_offen;
+CREATE INDEX ix_rechnung_offen ON rechnung (rechnungsdatum, rechnung_nr) WHERE bezahlt = false;
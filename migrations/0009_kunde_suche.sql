@@ -0,0 +1,12 @@
+-- Unscharfe Kundensuche für die Erfassungs-App (GET /kunden/search).
+-- Trigramm-Index über Name, Kürzel und Ort: Teilwörter und Tippfehler ("bamberg klink")
+-- werden über den Index gefunden statt über einen Durchlauf der ganzen Tabelle.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Suchtext als IMMUTABLE-Funktion, damit Index und Abfrage denselben Ausdruck verwenden
+CREATE OR REPLACE FUNCTION kunde_suchtext(name TEXT, kuerzel TEXT, ort TEXT) RETURNS TEXT AS $$
+    SELECT lower(coalesce(name, '') || ' ' || coalesce(kuerzel, '') || ' ' || coalesce(ort, ''));
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+CREATE INDEX IF NOT EXISTS ix_kunde_suche ON kunde USING gin (kunde_suchtext(name, kuerzel, ort) gin_trgm_ops);
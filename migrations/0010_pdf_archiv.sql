@@ -0,0 +1,64 @@
+-- PDF-Archiv: jede erzeugte Rechnung wird einmal unter ihrer SHA-256 im Archivordner abgelegt
+-- (siehe archiv.py) und hier mit der Rechnung verknüpft. Neuerstellungen unbezahlter Rechnungen
+-- ergeben weitere Fassungen; maßgeblich ist die jüngste.
+
+CREATE TABLE IF NOT EXISTS rechnung_pdf (
+    pdf_id      SERIAL PRIMARY KEY,
+    rechnung_id INTEGER NOT NULL REFERENCES rechnung (rechnung_id),
+    sha256      CHAR(64) NOT NULL CHECK (sha256 ~ '^[0-9a-f]{64}$'),
+    groesse     INTEGER NOT NULL CHECK (groesse > 0),
+    erstellt_am TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp(),
+    -- Dieselbe Datei wird nur einmal verknüpft
+    CONSTRAINT uk_rechnung_pdf UNIQUE (rechnung_id, sha256)
+);
+
+-- Jüngste Fassung einer Rechnung
+CREATE INDEX IF NOT EXISTS ix_rechnung_pdf_rechnung ON rechnung_pdf (rechnung_id, erstellt_am DESC);
+
+-- Archivliste ohne Filter bzw. nach Zeitraum: neueste zuerst, Keyset wie bei den offenen Rechnungen
+CREATE INDEX IF NOT EXISTS ix_rechnung_datum ON rechnung (rechnungsdatum, rechnung_nr);
+
+-- Archiveinträge sind unveränderlich; eine bezahlte Rechnung bekommt höchstens noch ihre
+-- erste Fassung (Nachtragen alter PDFs), aber keine neue
+CREATE OR REPLACE FUNCTION rechnung_pdf_schuetzen() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP <> 'INSERT' THEN
+        RAISE EXCEPTION 'Archivierte PDFs können nicht geändert oder gelöscht werden.';
+    END IF;
+    IF EXISTS (SELECT 1 FROM rechnung WHERE rechnung_id = NEW.rechnung_id AND bezahlt)
+       AND EXISTS (SELECT 1 FROM rechnung_pdf WHERE rechnung_id = NEW.rechnung_id) THEN
+        RAISE EXCEPTION 'Rechnung ist bezahlt, ihr archiviertes PDF kann nicht ersetzt werden.';
+    END IF;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_rechnung_pdf_schuetzen ON rechnung_pdf;
+CREATE TRIGGER trg_rechnung_pdf_schuetzen
+    BEFORE INSERT OR UPDATE OR DELETE ON rechnung_pdf
+    FOR EACH ROW EXECUTE FUNCTION rechnung_pdf_schuetzen();
+
+-- Bisher schützte nur die Anwendung bezahlte Rechnungen vor dem Überschreiben; jetzt auch die
+-- Datenbank. Erlaubt bleiben Mahnstand und Änderungszeitpunkt.
+CREATE OR REPLACE FUNCTION rechnung_bezahlt_schuetzen() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        RAISE EXCEPTION 'Rechnung % ist bezahlt und kann nicht gelöscht werden.', OLD.rechnung_nr;
+    END IF;
+    IF NOT NEW.bezahlt
+       OR (NEW.rechnung_nr, NEW.kdnr, NEW.kondition_id, NEW.summe, NEW.rechnungsdatum,
+           NEW.preis_pro_einheit_snapshot, NEW.einheitsdauer_min_snapshot, NEW.fahrtstrecke_km_snapshot, NEW.km_geld_snapshot)
+          IS DISTINCT FROM
+          (OLD.rechnung_nr, OLD.kdnr, OLD.kondition_id, OLD.summe, OLD.rechnungsdatum,
+           OLD.preis_pro_einheit_snapshot, OLD.einheitsdauer_min_snapshot, OLD.fahrtstrecke_km_snapshot, OLD.km_geld_snapshot) THEN
+        RAISE EXCEPTION 'Rechnung % ist bezahlt und revisionssicher gesperrt.', OLD.rechnung_nr;
+    END IF;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_rechnung_bezahlt_schuetzen ON rechnung;
+CREATE TRIGGER trg_rechnung_bezahlt_schuetzen
+    BEFORE UPDATE OR DELETE ON rechnung
+    FOR EACH ROW WHEN (OLD.bezahlt)
+    EXECUTE FUNCTION rechnung_bezahlt_schuetzen();
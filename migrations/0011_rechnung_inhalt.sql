@@ -0,0 +1,31 @@
+-- Vollständiger Rechnungsinhalt als JSONB (Kopf, Kunde, alle Besuchs- und Fahrtkostenzeilen, Summe,
+-- Template und dessen Version), so wie er gerendert wurde. Nachdrucke und Gutschriften brauchen
+-- damit nur noch diese eine Zeile statt Besuche und Konditionen erneut zusammenzusetzen.
+-- Die *_snapshot-Spalten bleiben für bestehende Auswertungen erhalten.
+
+ALTER TABLE rechnung ADD COLUMN IF NOT EXISTS inhalt JSONB
+    CONSTRAINT ck_rechnung_inhalt CHECK (inhalt IS NULL OR jsonb_typeof(inhalt) = 'object');
+
+-- Sperre bezahlter Rechnungen (0010) um den Inhalt erweitern. Ein fehlender Inhalt darf einmal
+-- nachgetragen werden (ältere Rechnungen, siehe python nachdruck.py --nachtragen).
+CREATE OR REPLACE FUNCTION rechnung_bezahlt_schuetzen() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        RAISE EXCEPTION 'Rechnung % ist bezahlt und kann nicht gelöscht werden.', OLD.rechnung_nr;
+    END IF;
+    IF NOT NEW.bezahlt
+       OR (NEW.rechnung_nr, NEW.kdnr, NEW.kondition_id, NEW.summe, NEW.rechnungsdatum,
+           NEW.preis_pro_einheit_snapshot, NEW.einheitsdauer_min_snapshot, NEW.fahrtstrecke_km_snapshot, NEW.km_geld_snapshot,
+           NEW.inhalt)
+          IS DISTINCT FROM
+          (OLD.rechnung_nr, OLD.kdnr, OLD.kondition_id, OLD.summe, OLD.rechnungsdatum,
+           OLD.preis_pro_einheit_snapshot, OLD.einheitsdauer_min_snapshot, OLD.fahrtstrecke_km_snapshot, OLD.km_geld_snapshot,
+           COALESCE(OLD.inhalt, NEW.inhalt)) THEN
+        RAISE EXCEPTION 'Rechnung % ist bezahlt und revisionssicher gesperrt.', OLD.rechnung_nr;
+    END IF;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+-- Rechnungen ohne Inhalt finden (Nachtragen)
+CREATE INDEX IF NOT EXISTS ix_rechnung_ohne_inhalt ON rechnung (rechnung_id) WHERE inhalt IS NULL;
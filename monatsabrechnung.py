@@ -0,0 +1,159 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, timedelta
+
+from db import fetch_rechnungsdaten_alle, fetch_bezahlte_rechnungsnummern, upsert_rechnungen
+
+
+def _render_job(rechnung, pfad):
+    """Läuft im Worker-Prozess: WeasyPrint ist CPU-lastig, daher ein Prozess pro Kern."""
+    from generate_invoice import generate_invoice
+    generate_invoice(rechnung, pfad)
+    return pfad
+
+
+def vormonat(heute=None):
+    """Liefert (erster, letzter) Tag des Vormonats als 'YYYY-MM-DD'."""
+    heute = heute or date.today()
+    letzter = heute.replace(day=1) - timedelta(days=1)
+    return letzter.replace(day=1).isoformat(), letzter.isoformat()
+
+
+def erstelle_alle_rechnungen(startdatum: str, enddatum: str, zielordner: str, max_workers=None, fortschritt=None, abbruch=None,
+                             nur_unberechnet=False):
+    """
+    Monatsabrechnung für alle Kunden:
+      1. Rechnungsdaten aller Kunden in einer Abfrage laden
+      2. bereits bezahlte (gesperrte) Rechnungen aussortieren
+      3. alle Rechnungen in einer Transaktion verbuchen; neue Rechnungen bekommen ihre
+         Nummern dabei als ein Block (YYMM-NNN)
+      4. PDFs parallel in einem Prozess-Pool rendern
+      5. fertige PDFs im Archiv ablegen (siehe archiv.py, falls in der config.ini aktiv)
+
+    fortschritt(fertig, gesamt, rechnung_nr) wird nach jedem gerenderten PDF aufgerufen.
+    abbruch (threading.Event): wenn gesetzt, werden noch nicht gestartete PDFs verworfen.
+    Die Rechnungen sind dann bereits verbucht; ein erneuter Lauf über denselben Zeitraum
+    erstellt die fehlenden PDFs mit denselben Nummern.
+    nur_unberechnet: alle noch nicht abgerechneten Besuche bis enddatum statt des Zeitraums.
+    Gibt einen Bericht (dict) zurück.
+    """
+    beginn = time.perf_counter()
+    os.makedirs(zielordner, exist_ok=True)
+
+    # Zeitraum vom Beginn des ersten bis zum Ende des letzten Tages
+    rechnungen, ohne_kondition = fetch_rechnungsdaten_alle(f"{startdatum} 00:00:00", f"{enddatum} 23:59:59", nur_unberechnet)
+
+    # --- SCHUTZMECHANISMUS: bezahlte Rechnungen sind revisionssicher gesperrt ---
+    bezahlt = fetch_bezahlte_rechnungsnummern([r['rechnung_nr'] for _, r in rechnungen if r['rechnung_nr']])
+    offen = [(kdnr, r) for kdnr, r in rechnungen if r['rechnung_nr'] not in bezahlt]
+
+    from archiv import archiv_cfg, archivieren
+    if not archiv_cfg()["aktiv"]:
+        archivieren = None
+
+    bericht = {
+        "zeitraum": (None if nur_unberechnet else startdatum, enddatum),
+        "zielordner": zielordner,
+        "erstellt": [],
+        "gesperrt": sorted(bezahlt),
+        "ohne_kondition": ohne_kondition,
+        "bereits_abgerechnet": [(r['kunde']['name'], len(r['bereits_abgerechnet'])) for _, r in offen if r['bereits_abgerechnet']],
+        "fehler": [],
+        "nicht_archiviert": [],
+        "abgebrochen": False,
+        "dauer_s": 0.0
+    }
+
+    # --- UPSERT: alle Rechnungen in einer Transaktion verbuchen (vergibt die Nummern) ---
+    upsert_rechnungen([(r, kdnr) for kdnr, r in offen])
+
+    if offen:
+        max_workers = max_workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=min(max_workers, len(offen))) as pool:
+            jobs = {
+                pool.submit(_render_job, r, os.path.join(zielordner, f"{r['rechnung_nr']}.pdf")): (kdnr, r)
+                for kdnr, r in offen
+            }
+            for fertig, job in enumerate(as_completed(jobs), start=1):
+                kdnr, r = jobs[job]
+                if job.cancelled():
+                    continue
+                try:
+                    pfad = job.result()
+                    bericht["erstellt"].append((r['rechnung_nr'], r['kunde']['name'], r['summe'], pfad))
+                except Exception as e:
+                    bericht["fehler"].append((r['rechnung_nr'], str(e)))
+                else:
+                    if archivieren:
+                        try:
+                            archivieren(r['rechnung_nr'], pfad)
+                        except Exception as e:
+                            bericht["nicht_archiviert"].append((r['rechnung_nr'], str(e)))
+                if fortschritt:
+                    fortschritt(fertig, len(offen), r['rechnung_nr'])
+                if abbruch is not None and abbruch.is_set() and not bericht["abgebrochen"]:
+                    bericht["abgebrochen"] = True
+                    for rest in jobs:
+                        rest.cancel()
+
+    bericht["erstellt"].sort()
+    bericht["dauer_s"] = time.perf_counter() - beginn
+    return bericht
+
+
+def bericht_als_text(bericht: dict) -> str:
+    """Zusammenfassung des Sammellaufs für Konsole und Messagebox."""
+    start, ende = bericht["zeitraum"]
+    titel = f"Monatsabrechnung {start} bis {ende}" if start else f"Abrechnung aller offenen Besuche bis {ende}"
+    zeilen = [titel, f"Zielordner: {bericht['zielordner']}", ""]
+    summe = sum(s for _, _, s, _ in bericht["erstellt"] if s is not None)
+    zeilen.append(f"✅ {len(bericht['erstellt'])} Rechnungen erstellt und verbucht (gesamt {summe:.2f} €)")
+    if bericht["gesperrt"]:
+        zeilen.append(f"🔒 {len(bericht['gesperrt'])} bereits bezahlt und gesperrt: {', '.join(bericht['gesperrt'])}")
+    if bericht["ohne_kondition"]:
+        namen = ", ".join(f"{name} ({kdnr})" for kdnr, name in bericht["ohne_kondition"])
+        zeilen.append(f"⚠️ {len(bericht['ohne_kondition'])} Kunden ohne gültige Konditionen übersprungen: {namen}")
+    if bericht.get("bereits_abgerechnet"):
+        details = ", ".join(f"{kunde} ({anzahl} Besuch(e))" for kunde, anzahl in bericht["bereits_abgerechnet"])
+        zeilen.append(f"ℹ️ Bereits anderweitig berechnete Besuche ausgelassen bei den Kunden: {details}")
+    for nr, fehler in bericht["fehler"]:
+        zeilen.append(f"❌ {nr}: {fehler}")
+    for nr, fehler in bericht.get("nicht_archiviert", []):
+        zeilen.append(f"⚠️ {nr}: PDF erstellt, aber nicht archiviert ({fehler})")
+    if bericht.get("abgebrochen"):
+        zeilen.append("⏹ Lauf wurde abgebrochen, nicht alle PDFs wurden erstellt.")
+    if bericht["fehler"] or bericht.get("abgebrochen"):
+        zeilen.append("Alle Rechnungen sind verbucht; ein erneuter Lauf über denselben Zeitraum erstellt die fehlenden PDFs.")
+    zeilen.append(f"Dauer: {bericht['dauer_s']:.1f} s")
+    return "\n".join(zeilen)
+
+
+def main(argv=None):
+    von, bis = vormonat()
+    parser = argparse.ArgumentParser(description="Erstellt die Rechnungen aller Kunden für einen Zeitraum.")
+    parser.add_argument("--von", default=von, help="Startdatum YYYY-MM-DD (Standard: Anfang Vormonat)")
+    parser.add_argument("--bis", default=bis, help="Enddatum YYYY-MM-DD (Standard: Ende Vormonat)")
+    parser.add_argument("--ziel", default=None, help="Zielordner für die PDFs (Standard: Rechnungen/<YYYY-MM>)")
+    parser.add_argument("--prozesse", type=int, default=None, help="Anzahl paralleler Render-Prozesse")
+    parser.add_argument("--unberechnet", action="store_true",
+                        help="Alle noch nicht abgerechneten Besuche bis --bis (--von wird ignoriert)")
+    args = parser.parse_args(argv)
+
+    if args.bis < args.von and not args.unberechnet:
+        parser.error("Das Enddatum darf nicht vor dem Startdatum liegen.")
+    ziel = args.ziel or os.path.join("Rechnungen", (args.bis if args.unberechnet else args.von)[:7])
+
+    def fortschritt(fertig, gesamt, rechnung_nr):
+        print(f"\r[{fertig:>3}/{gesamt}] {rechnung_nr:<20}", end="", flush=True)
+
+    bericht = erstelle_alle_rechnungen(args.von, args.bis, ziel, args.prozesse, fortschritt, nur_unberechnet=args.unberechnet)
+    print()
+    print(bericht_als_text(bericht))
+    return 1 if bericht["fehler"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
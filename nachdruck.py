@@ -0,0 +1,93 @@
+"""
+Nachdruck und Gutschrift aus dem gespeicherten Rechnungsinhalt (Spalte rechnung.inhalt).
+
+Beides braucht nur die eine Rechnungszeile und einen Render-Aufruf; Besuche und Konditionen werden
+nicht erneut gelesen. Rechnungsdatum, Frist und alle Beträge bleiben wie im Original, auch wenn
+sich Konditionen oder Kundendaten inzwischen geändert haben.
+
+  python nachdruck.py 2510-001 ziel.pdf               Rechnung erneut ausgeben
+  python nachdruck.py --gutschrift 2510-001 ziel.pdf  Gutschrift (Storno) zur Rechnung
+  python nachdruck.py --nachtragen                    Inhalt älterer Rechnungen einmalig rekonstruieren
+"""
+import argparse
+import os
+import sys
+from datetime import date
+
+from db import ergaenze_rechnungsinhalte, fetch_rechnung_inhalt, template_version
+from render_worker import render_invoice
+
+
+def _inhalt(rechnung_nr: str) -> dict:
+    rechnung = fetch_rechnung_inhalt(rechnung_nr)
+    if rechnung is None:
+        raise RuntimeError(f"Für {rechnung_nr} ist kein Rechnungsinhalt gespeichert "
+                           "(ältere Rechnung: python nachdruck.py --nachtragen).")
+    return rechnung
+
+
+def _hinweise(rechnung: dict) -> list:
+    if rechnung.get("template_version") != template_version(rechnung.get("template", "rechnung.html")):
+        return ["Das Rechnungslayout wurde seit der Erstellung geändert; das PDF weicht optisch vom Original ab."]
+    return []
+
+
+def nachdrucken(rechnung_nr: str, pfad: str) -> dict:
+    """Gibt eine Rechnung aus dem gespeicherten Inhalt erneut aus. Gibt einen Bericht (dict) zurück."""
+    rechnung = _inhalt(rechnung_nr)
+    render_invoice(rechnung, pfad)
+    return {"rechnung_nr": rechnung_nr, "pfad": pfad, "hinweise": _hinweise(rechnung)}
+
+
+def gutschrift_nr(rechnung_nr: str) -> str:
+    """Gutschriften tragen die Nummer der Rechnung mit Zusatz, der Rechnungsnummernkreis bleibt lückenlos."""
+    return f"{rechnung_nr}-G"
+
+
+def gutschrift(rechnung_nr: str, pfad: str, datum=None) -> dict:
+    """
+    Gutschrift (Storno) über die gesamte Rechnung: gleiche Leistungszeilen, negative Summe.
+    Die Gutschrift wird nicht verbucht; offene Rechnungen bitte zusätzlich ausbuchen.
+    """
+    rechnung = _inhalt(rechnung_nr)
+    datum = datum or date.today()
+    beleg = dict(
+        rechnung,
+        rechnung_nr=gutschrift_nr(rechnung_nr),
+        datum=datum.strftime("%d.%m.%Y"),
+        summe=-rechnung["summe"] if rechnung.get("summe") is not None else None,
+        gutschrift={"rechnung_nr": rechnung_nr, "datum": rechnung["datum"], "bezahlt": rechnung["bezahlt"]}
+    )
+    render_invoice(beleg, pfad)
+    return {"rechnung_nr": beleg["rechnung_nr"], "pfad": pfad, "summe": beleg["summe"], "hinweise": _hinweise(rechnung)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Nachdruck und Gutschrift aus dem gespeicherten Rechnungsinhalt")
+    parser.add_argument("rechnung_nr", nargs="?")
+    parser.add_argument("ziel", nargs="?", help="PDF-Datei oder Ordner (Standard: <nummer>.pdf im aktuellen Ordner)")
+    parser.add_argument("--gutschrift", action="store_true", help="Gutschrift statt Nachdruck")
+    parser.add_argument("--nachtragen", action="store_true", help="Inhalt älterer Rechnungen nachtragen")
+    args = parser.parse_args()
+
+    if args.nachtragen:
+        ergebnis = ergaenze_rechnungsinhalte()
+        print(f"✅ Inhalt für {ergebnis['ergaenzt']} Rechnungen nachgetragen")
+        for rechnung_nr, grund in ergebnis["uebersprungen"]:
+            print(f"⚠️ {rechnung_nr} nicht ergänzt: {grund}")
+        sys.exit(0)
+    if not args.rechnung_nr:
+        parser.error("Rechnungsnummer fehlt.")
+
+    name = gutschrift_nr(args.rechnung_nr) if args.gutschrift else args.rechnung_nr
+    ziel = args.ziel or f"{name}.pdf"
+    if os.path.isdir(ziel):
+        ziel = os.path.join(ziel, f"{name}.pdf")
+    try:
+        bericht = (gutschrift if args.gutschrift else nachdrucken)(args.rechnung_nr, ziel)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    print(f"✅ {bericht['rechnung_nr']}: {bericht['pfad']}")
+    for hinweis in bericht["hinweise"]:
+        print(f"⚠️ {hinweis}")
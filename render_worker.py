@@ -0,0 +1,262 @@
+"""
+Langlebiger Render-Worker: hält WeasyPrint, Schriften, Templates und Stylesheet warm
+und rendert PDFs für mehrere Clients (GUI-Instanzen, Sammelläufe) über einen lokalen Socket.
+
+Starten:  python render_worker.py
+Status:   python render_worker.py --status
+
+Der Worker schreibt Dateien nur innerhalb von [render_worker] ausgabe_ordner; für alle anderen
+Ziele holt der Client die PDF-Bytes und schreibt selbst.
+"""
+import argparse
+import os
+import queue
+import sys
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+from app_config import BASE_DIR, get_section
+
+VORGEWAERMTE_TEMPLATES = ("rechnung.html", "mahnung.html", "mahnung_2.html")
+PLATZHALTER_AUTHKEY = "bitte-aendern"  # aus der config.ini.example
+
+
+def _worker_cfg():
+    cfg = get_section("render_worker")
+    authkey = cfg.get("authkey", "").strip()
+    ordner = cfg.get("ausgabe_ordner", "").strip()
+    return {
+        "adresse": (cfg.get("host", "127.0.0.1"), cfg.getint("port", 6061)),
+        # Kein eingebauter Schlüssel: ein bekannter authkey erlaubt jedem lokalen Prozess Aufträge
+        "authkey": authkey.encode("utf-8") if authkey and authkey != PLATZHALTER_AUTHKEY else None,
+        # relative Pfade beziehen sich auf den Programmordner
+        "ausgabe_ordner": os.path.join(BASE_DIR, ordner) if ordner else None,
+        "aktiv": cfg.getboolean("aktiv", False),
+        "timeout": cfg.getfloat("timeout", 60.0)
+    }
+
+
+def _authkey(cfg: dict) -> bytes:
+    if cfg["authkey"] is None:
+        raise RuntimeError("[render_worker] authkey ist in der config.ini nicht gesetzt (eigenen Schlüssel eintragen).")
+    return cfg["authkey"]
+
+
+def im_ausgabe_ordner(pfad: str, ordner) -> bool:
+    """True, wenn pfad (nach Auflösen von Links und ..) innerhalb von ordner liegt."""
+    if not ordner or not pfad:
+        return False
+    ordner = os.path.realpath(ordner)
+    try:
+        return os.path.commonpath([ordner, os.path.realpath(pfad)]) == ordner
+    except ValueError:  # z.B. anderes Laufwerk unter Windows
+        return False
+
+
+# --- Server ---
+class RenderServer:
+    def __init__(self, adresse, authkey, ausgabe_ordner=None):
+        self.adresse = adresse
+        self.authkey = authkey
+        self.ausgabe_ordner = ausgabe_ordner
+        self.jobs = queue.Queue()
+        self.gestartet = time.time()
+        self.anzahl = 0
+        self.fehler = 0
+        self.dauer_gesamt = 0.0
+        self.dauer_max = 0.0
+        self.dauer_letzte = 0.0
+        self._stat_lock = threading.Lock()
+
+    def vorwaermen(self):
+        """Importiert WeasyPrint, lädt Schriften und kompiliert die Templates vorab."""
+        from weasyprint import HTML
+        from generate_invoice import get_renderer, get_template
+
+        renderer = get_renderer()
+        for name in VORGEWAERMTE_TEMPLATES:
+            try:
+                get_template(name)
+            except Exception as e:
+                print(f"⚠️ Template {name} konnte nicht geladen werden:", e)
+        # Ein Mini-Dokument erzwingt das Laden der Schriften
+        HTML(string="<p>warm</p>").write_pdf(stylesheets=[renderer.stylesheet], font_config=renderer.font_config)
+
+    def status(self) -> dict:
+        with self._stat_lock:
+            return {
+                "warteschlange": self.jobs.qsize(),
+                "gerendert": self.anzahl,
+                "fehler": self.fehler,
+                "dauer_letzte_ms": self.dauer_letzte * 1000,
+                "dauer_schnitt_ms": (self.dauer_gesamt / self.anzahl * 1000) if self.anzahl else 0.0,
+                "dauer_max_ms": self.dauer_max * 1000,
+                "laufzeit_s": time.time() - self.gestartet
+            }
+
+    def _render_schleife(self):
+        # Ein Render-Thread: WeasyPrint ist CPU-lastig, mehrere Threads brächten wegen des GIL nichts
+        from generate_invoice import get_renderer, pdf_datum
+        renderer = get_renderer()
+        while True:
+            auftrag, antwort = self.jobs.get()
+            beginn = time.perf_counter()
+            try:
+                if auftrag.get("pfad") and not im_ausgabe_ordner(auftrag["pfad"], self.ausgabe_ordner):
+                    raise PermissionError(f"Pfad liegt außerhalb des Ausgabeordners: {auftrag['pfad']}")
+                kontext = {auftrag.get("variable", "rechnung"): auftrag["rechnung"]}
+                pdf = renderer.render(auftrag.get("template", "rechnung.html"), auftrag.get("pfad"),
+                                      erstellt=pdf_datum(auftrag["rechnung"]), **kontext)
+                dauer = time.perf_counter() - beginn
+                ergebnis = {"ok": True, "dauer_ms": dauer * 1000}
+                if auftrag.get("pfad"):
+                    ergebnis["pfad"] = auftrag["pfad"]
+                else:
+                    ergebnis["pdf"] = pdf
+                with self._stat_lock:
+                    self.anzahl += 1
+                    self.dauer_gesamt += dauer
+                    self.dauer_letzte = dauer
+                    self.dauer_max = max(self.dauer_max, dauer)
+            except Exception as e:
+                with self._stat_lock:
+                    self.fehler += 1
+                ergebnis = {"ok": False, "fehler": str(e)}
+            antwort.put(ergebnis)
+
+    def _client_schleife(self, conn):
+        antwort = queue.Queue(maxsize=1)
+        try:
+            while True:
+                try:
+                    auftrag = conn.recv()
+                except (EOFError, OSError):
+                    break
+                if auftrag.get("aktion") == "status":
+                    ergebnis = {"ok": True, "status": self.status()}
+                elif auftrag.get("aktion") == "render":
+                    self.jobs.put((auftrag, antwort))
+                    ergebnis = antwort.get()
+                else:
+                    ergebnis = {"ok": False, "fehler": f"Unbekannte Aktion: {auftrag.get('aktion')}"}
+                try:
+                    conn.send(ergebnis)
+                except OSError:
+                    # Client hat aufgegeben (z.B. Timeout) und die Verbindung geschlossen
+                    break
+        finally:
+            conn.close()
+
+    def serve_forever(self):
+        self.vorwaermen()
+        threading.Thread(target=self._render_schleife, daemon=True).start()
+        with Listener(self.adresse, authkey=self.authkey) as listener:
+            print(f"✅ Render-Worker bereit auf {self.adresse[0]}:{self.adresse[1]}")
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    # z.B. falscher authkey eines Clients
+                    print("❌ Verbindung abgelehnt:", e)
+                    continue
+                threading.Thread(target=self._client_schleife, args=(conn,), daemon=True).start()
+
+
+# --- Client ---
+class RenderClient:
+    """Verbindung zu einem laufenden Render-Worker (eine Anfrage gleichzeitig pro Client)."""
+    def __init__(self, adresse=None, authkey=None, timeout=None, ausgabe_ordner=None):
+        cfg = _worker_cfg()
+        self.adresse = adresse or cfg["adresse"]
+        self.authkey = authkey or _authkey(cfg)
+        self.timeout = timeout or cfg["timeout"]
+        self.ausgabe_ordner = ausgabe_ordner or cfg["ausgabe_ordner"]
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _anfrage(self, auftrag: dict) -> dict:
+        with self._lock:
+            if self._conn is None:
+                self._conn = Client(self.adresse, authkey=self.authkey)
+            try:
+                self._conn.send(auftrag)
+                if not self._conn.poll(self.timeout):
+                    raise TimeoutError("Render-Worker antwortet nicht.")
+                antwort = self._conn.recv()
+            except Exception:
+                self.close_locked()
+                raise
+        if not antwort.get("ok"):
+            raise RuntimeError(antwort.get("fehler", "Unbekannter Fehler im Render-Worker"))
+        return antwort
+
+    def render(self, rechnung: dict, pfad=None, template="rechnung.html"):
+        """
+        Rendert im Worker. Mit pfad wird die Datei geschrieben (im Ausgabeordner vom Worker,
+        sonst vom Client) und pfad zurückgegeben, ohne pfad kommen die PDF-Bytes zurück.
+        """
+        worker_schreibt = im_ausgabe_ordner(pfad, self.ausgabe_ordner)
+        antwort = self._anfrage({"aktion": "render", "template": template, "rechnung": rechnung,
+                                 "pfad": pfad if worker_schreibt else None})
+        if pfad is None or worker_schreibt:
+            return antwort.get("pfad") or antwort.get("pdf")
+        with open(pfad, "wb") as f:
+            f.write(antwort["pdf"])
+        return pfad
+
+    def status(self) -> dict:
+        return self._anfrage({"aktion": "status"})["status"]
+
+    def close_locked(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            finally:
+                self._conn = None
+
+    def close(self):
+        with self._lock:
+            self.close_locked()
+
+
+_client = None
+
+def render_invoice(rechnung: dict, pfad: str):
+    """
+    Rendert eine Rechnung über den Render-Worker, falls in der config.ini aktiviert und erreichbar.
+    Andernfalls wird lokal im eigenen Prozess gerendert.
+    """
+    global _client
+    cfg = _worker_cfg()
+    if cfg["aktiv"] and cfg["authkey"] is None:
+        print("⚠️ Render-Worker: kein authkey in der config.ini, rendere lokal")
+    elif cfg["aktiv"]:
+        try:
+            if _client is None:
+                _client = RenderClient()
+            return _client.render(rechnung, pfad)
+        except (ConnectionError, OSError, EOFError, TimeoutError, AuthenticationError) as e:
+            print("⚠️ Render-Worker nicht erreichbar, rendere lokal:", e)
+
+    from generate_invoice import generate_invoice
+    generate_invoice(rechnung, pfad)
+    return pfad
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="PDF-Render-Worker")
+    parser.add_argument("--status", action="store_true", help="Status eines laufenden Workers anzeigen")
+    args = parser.parse_args()
+
+    cfg = _worker_cfg()
+    try:
+        if args.status:
+            for schluessel, wert in RenderClient().status().items():
+                print(f"{schluessel:<18} {wert:.1f}" if isinstance(wert, float) else f"{schluessel:<18} {wert}")
+        else:
+            RenderServer(cfg["adresse"], _authkey(cfg), cfg["ausgabe_ordner"]).serve_forever()
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
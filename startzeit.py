@@ -0,0 +1,64 @@
+"""
+Startzeit-Messung für main.py.
+
+  python main.py --startzeit    misst die Zeit bis zum ersten sichtbaren Fenster
+  python main.py --importzeit   Import-Bericht im Stil von 'python -X importtime'
+"""
+import os
+import re
+import subprocess
+import sys
+import time
+
+from app_config import BASE_DIR, get_section
+
+# Zeitpunkt, zu dem dieses Modul (als eines der ersten in main.py) geladen wurde
+PROZESS_START = time.perf_counter()
+
+_IMPORTTIME_ZEILE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def startbudget_ms() -> int:
+    return get_section("app").getint("startbudget_ms", 1500)
+
+
+def melde_erstes_fenster(root, ausgeben=False):
+    """Misst die Zeit bis zum ersten gezeichneten Fenster und meldet Überschreitungen des Budgets."""
+    def gezeichnet():
+        dauer_ms = (time.perf_counter() - PROZESS_START) * 1000
+        budget = startbudget_ms()
+        if ausgeben or dauer_ms > budget:
+            zeichen = "✅" if dauer_ms <= budget else "⚠️"
+            print(f"{zeichen} Erstes Fenster nach {dauer_ms:.0f} ms (Budget {budget} ms)")
+    root.update_idletasks()
+    root.after_idle(gezeichnet)
+
+
+def importzeit_bericht(modul: str, top: int = 15) -> str:
+    """Startet einen frischen Interpreter mit -X importtime und fasst die teuersten Imports zusammen."""
+    ergebnis = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modul}"],
+        cwd=BASE_DIR, capture_output=True, text=True, env=dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    )
+    eintraege = []
+    for zeile in ergebnis.stderr.splitlines():
+        treffer = _IMPORTTIME_ZEILE.match(zeile)
+        if treffer:
+            selbst, kumuliert, einrueckung, name = treffer.groups()
+            # Nur Top-Level-Pakete (geringste Einrückung) zählen für die Gesamtsumme
+            eintraege.append((int(kumuliert), int(selbst), len(einrueckung), name))
+
+    gesamt_us = sum(k for k, _, tiefe, _ in eintraege if tiefe == 1)
+    zeilen = [f"import {modul}: gesamt {gesamt_us / 1000:.0f} ms", f"{'kumuliert':>10} {'selbst':>8}  Modul"]
+    for kumuliert, selbst, tiefe, name in sorted(eintraege, reverse=True)[:top]:
+        zeilen.append(f"{kumuliert / 1000:8.1f}ms {selbst / 1000:6.1f}ms  {name}")
+    if ergebnis.returncode != 0:
+        zeilen.append(f"❌ Import fehlgeschlagen:\n{ergebnis.stderr.strip().splitlines()[-1]}")
+    return "\n".join(zeilen)
+
+
+def drucke_importzeit():
+    # Startpfad (bis zum Fenster) und der verzögert geladene Renderer
+    print(importzeit_bericht("main"))
+    print()
+    print(importzeit_bericht("generate_invoice"))
@@ -0,0 +1,104 @@
+"""
+Schlüsselbasiertes Modell für ttk.Treeview: Änderungen werden als minimale insert/item/move/delete-
+Operationen auf die vorhandenen Zeilen angewendet, statt die Tabelle zu leeren und neu zu füllen.
+Unterstützt seitenweises Nachladen (Zeilen jenseits der geladenen Grenze werden ignoriert,
+bis ihre Seite geladen wird).
+"""
+import bisect
+
+
+class TabellenModell:
+    def __init__(self, tree, schluessel, werte, sortierung, absteigend=False):
+        """
+        schluessel(zeile) -> eindeutige ID (wird als iid im Treeview verwendet)
+        werte(zeile)      -> Tupel der angezeigten Spaltenwerte
+        sortierung(zeile) -> Sortierschlüssel (aufsteigend vergleichbar)
+        """
+        self.tree = tree
+        self._schluessel = schluessel
+        self._werte = werte
+        self._sortierung = sortierung
+        self._absteigend = absteigend
+        self._zeilen = {}      # schluessel -> (sortierschluessel, werte)
+        self._sortiert = []    # [(sortierschluessel, schluessel)] aufsteigend
+        self.grenze = None     # Sortierschlüssel der letzten nachgeladenen Zeile
+        self.vollstaendig = False
+
+    def __len__(self):
+        return len(self._zeilen)
+
+    def __contains__(self, schluessel):
+        return schluessel in self._zeilen
+
+    def _index(self, eintrag) -> int:
+        """Anzeigeposition für einen (noch nicht eingefügten) Eintrag."""
+        pos = bisect.bisect_left(self._sortiert, eintrag)
+        return len(self._sortiert) - pos if self._absteigend else pos
+
+    def _im_geladenen_bereich(self, sortierschluessel) -> bool:
+        if self.vollstaendig:
+            return True
+        if self.grenze is None:
+            return False
+        return sortierschluessel >= self.grenze if self._absteigend else sortierschluessel <= self.grenze
+
+    def _entferne_sortiert(self, sortierschluessel, schluessel):
+        eintrag = (sortierschluessel, schluessel)
+        del self._sortiert[bisect.bisect_left(self._sortiert, eintrag)]
+
+    def anwenden(self, zeilen=(), entfernen=()) -> tuple:
+        """
+        Übernimmt neue oder geänderte Zeilen und entfernt die Schlüssel aus entfernen.
+        Unveränderte Zeilen lösen keine Treeview-Operation aus.
+        Gibt (neu, geaendert, entfernt) zurück.
+        """
+        neu = geaendert = entfernt = 0
+        for schluessel in entfernen:
+            if schluessel in self._zeilen:
+                sortierschluessel, _ = self._zeilen.pop(schluessel)
+                self._entferne_sortiert(sortierschluessel, schluessel)
+                self.tree.delete(schluessel)
+                entfernt += 1
+
+        for zeile in zeilen:
+            schluessel = self._schluessel(zeile)
+            sortierschluessel = self._sortierung(zeile)
+            werte = self._werte(zeile)
+            alt = self._zeilen.get(schluessel)
+            if alt is None:
+                if not self._im_geladenen_bereich(sortierschluessel):
+                    continue  # kommt mit ihrer Seite
+                eintrag = (sortierschluessel, schluessel)
+                self.tree.insert("", self._index(eintrag), iid=schluessel, values=werte)
+                bisect.insort(self._sortiert, eintrag)
+                neu += 1
+            elif alt != (sortierschluessel, werte):
+                if alt[1] != werte:
+                    self.tree.item(schluessel, values=werte)
+                if alt[0] != sortierschluessel:
+                    self._entferne_sortiert(alt[0], schluessel)
+                    eintrag = (sortierschluessel, schluessel)
+                    # erst aushängen: der Index von move zählt die Zeile sonst selbst mit
+                    self.tree.detach(schluessel)
+                    self.tree.move(schluessel, "", self._index(eintrag))
+                    bisect.insort(self._sortiert, eintrag)
+                geaendert += 1
+            else:
+                continue
+            self._zeilen[schluessel] = (sortierschluessel, werte)
+        return neu, geaendert, entfernt
+
+    def seite_anhaengen(self, zeilen: list, seitengroesse: int):
+        """Nächste Seite (in Anzeigereihenfolge) übernehmen und die Ladegrenze verschieben."""
+        if zeilen:
+            self.grenze = self._sortierung(zeilen[-1])
+        if len(zeilen) < seitengroesse:
+            self.vollstaendig = True
+        self.anwenden(zeilen)
+
+    def leeren(self):
+        self.tree.delete(*self.tree.get_children())
+        self._zeilen.clear()
+        self._sortiert.clear()
+        self.grenze = None
+        self.vollstaendig = False
@@ -0,0 +1,220 @@
+"""
+Verzugszinsen, Mahngebühren und offene Beträge aller unbezahlten Rechnungen.
+
+  python verzug.py                    Offene-Posten-Liste zum heutigen Tag
+  python verzug.py --stichtag 2025-12-31 --csv op.csv
+
+Zinsen: (Basiszinssatz + Zuschlag) p. a. auf die offene Hauptforderung, taggenau ab dem Tag nach
+Fälligkeit, Zinstage/365, keine Zinseszinsen (§ 289 BGB). Wechsel des Basiszinssatzes und
+Teilzahlungen teilen den Zeitraum in Abschnitte. Zahlungen tilgen nach § 367 BGB zuerst Kosten,
+dann Zinsen, dann die Hauptforderung. Gerechnet wird durchgehend mit Decimal, gerundet wird
+erst das Ergebnis je Rechnung.
+"""
+import argparse
+import bisect
+import csv
+import sys
+from datetime import date, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+from app_config import get_section
+
+CENT = Decimal("0.01")
+_NULL = Decimal("0")
+_TAGE_PRO_JAHR = Decimal("36500")  # 365 Tage x Prozent
+
+
+def verzug_cfg():
+    cfg = get_section("mahnung")
+    return {
+        "zahlungsziel_tage": cfg.getint("zahlungsziel_tage", 14),
+        # 5 Prozentpunkte über dem Basiszinssatz (§ 288 Abs. 1 BGB); ohne Verbraucherbeteiligung
+        # sind 9 Prozentpunkte zulässig (§ 288 Abs. 2 BGB)
+        "zuschlag_prozentpunkte": Decimal(cfg.get("zuschlag_prozentpunkte", "5")),
+        # Gebühr, die mit der Mahnung der jeweiligen Stufe fällig wird
+        "gebuehren": {
+            1: Decimal(cfg.get("erinnerungsgebuehr", "0.00")),
+            2: Decimal(cfg.get("mahngebuehr", "10.00"))
+        },
+        # Verzugspauschale nach § 288 Abs. 5 BGB (nur gegenüber Unternehmern), ab Verzugsbeginn
+        "pauschale": Decimal(cfg.get("pauschale", "0.00"))
+    }
+
+
+def faellig_am(rechnungsdatum: date, cfg: dict) -> date:
+    return rechnungsdatum + timedelta(days=cfg["zahlungsziel_tage"])
+
+
+class Zinstabelle:
+    """Basiszinssätze als sortierte Abschnitte; liefert Zinsen für beliebige Zeiträume."""
+    def __init__(self, saetze, zuschlag):
+        saetze = sorted(saetze)
+        self.ab = [ab for ab, _ in saetze]
+        self.prozent = [Decimal(satz) + zuschlag for _, satz in saetze]
+
+    def satz_am(self, tag: date) -> Decimal:
+        i = bisect.bisect_right(self.ab, tag) - 1
+        if i < 0:
+            raise ValueError(f"Kein Basiszinssatz für {tag} hinterlegt.")
+        return self.prozent[i]
+
+    def zinsen(self, basis: Decimal, von: date, bis: date, abschnitte=None) -> Decimal:
+        """Zinsen auf basis für die Tage von (einschließlich) bis bis (ausschließlich)."""
+        if basis <= 0 or bis <= von:
+            return _NULL
+        if not self.ab:
+            raise ValueError("Keine Basiszinssätze hinterlegt (Tabelle basiszins).")
+        summe = _NULL
+        i = bisect.bisect_right(self.ab, von) - 1
+        if i < 0:
+            # wie satz_am: nie mit einem Satz rechnen, der damals noch nicht galt
+            raise ValueError(f"Kein Basiszinssatz für {von} hinterlegt.")
+        start = von
+        while start < bis:
+            ende = min(bis, self.ab[i + 1]) if i + 1 < len(self.ab) else bis
+            if ende > start:
+                betrag = basis * self.prozent[i] * (ende - start).days / _TAGE_PRO_JAHR
+                summe += betrag
+                if abschnitte is not None:
+                    abschnitte.append((start, ende - timedelta(days=1), self.prozent[i], basis, betrag))
+            start = ende
+            i += 1
+        return summe
+
+
+def berechne_verzug(summe, rechnungsdatum: date, zahlungen, mahnungen, zinstabelle: Zinstabelle,
+                    stichtag: date, cfg: dict, mit_abschnitten=False) -> dict:
+    """
+    Offener Stand einer Rechnung zum Stichtag.
+    zahlungen: [(datum, betrag)], mahnungen: [(stufe, datum)] (erzeugen die Gebühren).
+    """
+    verzug_ab = faellig_am(rechnungsdatum, cfg) + timedelta(days=1)
+    ende = stichtag + timedelta(days=1)  # Stichtag zählt mit
+
+    # Ereignisse nach Datum; am selben Tag zuerst Kosten, dann Zahlungen
+    ereignisse = [(datum, 1, betrag) for datum, betrag in zahlungen if datum <= stichtag]
+    ereignisse += [(datum, 0, cfg["gebuehren"].get(stufe, _NULL)) for stufe, datum in mahnungen if datum <= stichtag]
+    if cfg["pauschale"] and verzug_ab <= stichtag:
+        ereignisse.append((verzug_ab, 0, cfg["pauschale"]))
+    ereignisse.sort()
+
+    haupt = Decimal(summe or 0)
+    zinsen = kosten = gezahlt = kosten_gesamt = _NULL
+    abschnitte = [] if mit_abschnitten else None
+    tag = verzug_ab
+    for datum, art, betrag in ereignisse:
+        if datum > tag:
+            zinsen += zinstabelle.zinsen(haupt, tag, datum, abschnitte)
+            tag = datum
+        if art == 0:
+            kosten += betrag
+            kosten_gesamt += betrag
+            continue
+        # Zahlung: Kosten -> Zinsen -> Hauptforderung (§ 367 BGB)
+        gezahlt += betrag
+        rest = Decimal(betrag)
+        tilgung = min(rest, kosten)
+        kosten, rest = kosten - tilgung, rest - tilgung
+        tilgung = min(rest, zinsen)
+        zinsen, rest = zinsen - tilgung, rest - tilgung
+        haupt -= rest  # eine Überzahlung bleibt als Guthaben (negativ) stehen
+    if ende > tag:
+        zinsen += zinstabelle.zinsen(haupt, tag, ende, abschnitte)
+
+    haupt = haupt.quantize(CENT, ROUND_HALF_UP)
+    zinsen = zinsen.quantize(CENT, ROUND_HALF_UP)
+    kosten = kosten.quantize(CENT, ROUND_HALF_UP)
+    ergebnis = {
+        "summe": Decimal(summe or 0),
+        "gezahlt": gezahlt,
+        "hauptforderung": haupt,
+        "zinsen": zinsen,
+        "gebuehren": kosten,
+        "gebuehren_gesamt": kosten_gesamt,
+        "gesamt": haupt + zinsen + kosten,
+        "faellig_am": verzug_ab - timedelta(days=1),
+        "verzug_ab": verzug_ab,
+        "verzugstage": max((ende - verzug_ab).days, 0),
+        "zinssatz": zinstabelle.satz_am(stichtag) if zinstabelle.ab else None
+    }
+    if mit_abschnitten:
+        ergebnis["abschnitte"] = [
+            (von, bis, satz, basis.quantize(CENT), betrag.quantize(CENT, ROUND_HALF_UP))
+            for von, bis, satz, basis, betrag in abschnitte
+        ]
+    return ergebnis
+
+
+def berechne_offene_posten(stichtag=None, mit_abschnitten=False):
+    """
+    Lädt alle offenen Rechnungen mit Zahlungen und Mahnungen (drei Abfragen) und berechnet
+    sie in einem Durchlauf. Gibt (posten, hinweise) zurück; posten ist nach Rechnungsdatum sortiert.
+    """
+    from db import fetch_offene_posten, fetch_basiszinssaetze
+
+    stichtag = stichtag or date.today()
+    cfg = verzug_cfg()
+    saetze = fetch_basiszinssaetze()
+    tabelle = Zinstabelle(saetze, cfg["zuschlag_prozentpunkte"])
+    rechnungen, zahlungen, mahnungen = fetch_offene_posten()
+
+    hinweise = []
+    if saetze and (stichtag - saetze[-1][0]).days > 184:
+        hinweise.append(f"⚠️ Letzter hinterlegter Basiszinssatz gilt ab {saetze[-1][0]:%d.%m.%Y}; "
+                        "neuere Sätze in der Tabelle basiszins nachtragen.")
+
+    posten = []
+    for rechnung_id, rechnung_nr, kdnr, kunde, rechnungsdatum, summe in rechnungen:
+        try:
+            werte = berechne_verzug(summe, rechnungsdatum, zahlungen.get(rechnung_id, []),
+                                    mahnungen.get(rechnung_id, []), tabelle, stichtag, cfg, mit_abschnitten)
+        except ValueError as e:
+            hinweise.append(f"❌ {rechnung_nr}: {e}")
+            continue
+        werte.update(rechnung_id=rechnung_id, rechnung_nr=rechnung_nr, kdnr=kdnr, kunde=kunde, rechnungsdatum=rechnungsdatum)
+        posten.append(werte)
+    return posten, hinweise
+
+
+def offene_posten_text(posten: list, stichtag: date) -> str:
+    zeilen = [
+        f"Offene Posten zum {stichtag:%d.%m.%Y}",
+        f"{'Rechnung':<12} {'Datum':<10} {'Kunde':<28} {'Haupt':>10} {'Zinsen':>8} {'Gebühr':>8} {'Gesamt':>10} {'Tage':>5}"
+    ]
+    for p in posten:
+        zeilen.append(
+            f"{p['rechnung_nr']:<12} {p['rechnungsdatum']:%d.%m.%y}   {p['kunde'][:28]:<28} {p['hauptforderung']:>10} "
+            f"{p['zinsen']:>8} {p['gebuehren']:>8} {p['gesamt']:>10} {p['verzugstage']:>5}"
+        )
+    gesamt = sum((p['gesamt'] for p in posten), _NULL)
+    zinsen = sum((p['zinsen'] for p in posten), _NULL)
+    zeilen.append(f"{len(posten)} offene Rechnungen, davon Zinsen {zinsen} €, gesamt offen {gesamt} €")
+    return "\n".join(zeilen)
+
+
+def schreibe_csv(posten: list, pfad: str):
+    felder = ["rechnung_nr", "rechnungsdatum", "kunde", "summe", "gezahlt", "hauptforderung", "zinsen",
+              "gebuehren", "gesamt", "faellig_am", "verzugstage", "zinssatz"]
+    with open(pfad, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f, delimiter=";")
+        writer.writerow(felder)
+        for p in posten:
+            # Dezimalkomma für Excel
+            writer.writerow([str(p[feld]).replace(".", ",") if isinstance(p[feld], Decimal) else p[feld] for feld in felder])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offene-Posten-Liste mit Verzugszinsen und Mahngebühren")
+    parser.add_argument("--stichtag", default=None, help="Stichtag YYYY-MM-DD (Standard: heute)")
+    parser.add_argument("--csv", default=None, help="zusätzlich als CSV (Semikolon, Dezimalkomma) speichern")
+    args = parser.parse_args()
+
+    stichtag = date.fromisoformat(args.stichtag) if args.stichtag else date.today()
+    posten, hinweise = berechne_offene_posten(stichtag)
+    print(offene_posten_text(posten, stichtag))
+    for hinweis in hinweise:
+        print(hinweis)
+    if args.csv:
+        schreibe_csv(posten, args.csv)
+        print(f"✅ CSV gespeichert: {args.csv}")
+    sys.exit(0)